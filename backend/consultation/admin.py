@@ -1,7 +1,28 @@
+from django import forms
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.models import User
-from .models import UserProfile, Clinic, DoctorAvailability, Meeting
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from . import analytics, search
+from .models import UserProfile, Clinic, DoctorAvailability, Job, Meeting, TranscriptArchive
+from .paginators import EstimatedCountPaginator
+
+
+class DeferringChangeList(ChangeList):
+    """
+    Changelist that leaves the ModelAdmin's ``changelist_defer`` columns
+    unread: large fields no list column shows. Change forms still load them.
+    """
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        return queryset.defer(*self.model_admin.changelist_defer)
+
 
 # =============================================================================
 # 1. USER PROFILE EXTENSION
@@ -23,11 +44,13 @@ class UserAdmin(BaseUserAdmin):
     """
     inlines = (UserProfileInline,)
     list_display = ('username', 'email', 'first_name', 'last_name', 'get_role', 'is_staff')
+    list_select_related = ('profile',)
     
     def get_role(self, obj):
         # Safe access in case profile doesn't exist for some legacy users
         return obj.profile.role if hasattr(obj, 'profile') else '-'
     get_role.short_description = 'Role'
+    get_role.admin_order_field = 'profile__role'
 
 # Unregister the default User admin and register our customized version
 admin.site.unregister(User)
@@ -39,6 +62,7 @@ class UserProfileAdmin(admin.ModelAdmin):
     Standalone view for UserProfiles if needed.
     """
     list_display = ('user', 'role', 'clinic', 'mobile', 'sex')
+    list_select_related = ('user', 'clinic')
     list_filter = ('role', 'sex', 'clinic')
     search_fields = ('user__username', 'user__email', 'mobile')
     autocomplete_fields = ['user', 'clinic']
@@ -62,13 +86,19 @@ class ClinicAdmin(admin.ModelAdmin):
     search_fields = ('name', 'clinic_id')
     inlines = [DoctorAvailabilityInline]
 
+    def get_queryset(self, request):
+        # Counted in the list query rather than one COUNT per row.
+        return super().get_queryset(request).annotate(member_total=Count('members'))
+
     def member_count(self, obj):
-        return obj.members.count()
+        return obj.member_total
     member_count.short_description = 'Total Members'
+    member_count.admin_order_field = 'member_total'
 
 @admin.register(DoctorAvailability)
 class DoctorAvailabilityAdmin(admin.ModelAdmin):
     list_display = ('doctor', 'clinic', 'day_name', 'start_time', 'end_time')
+    list_select_related = ('doctor', 'clinic')
     list_filter = ('day_of_week', 'clinic')
     search_fields = ('doctor__username', 'doctor__first_name', 'clinic__name')
     autocomplete_fields = ['doctor', 'clinic']
@@ -77,13 +107,34 @@ class DoctorAvailabilityAdmin(admin.ModelAdmin):
         return obj.get_day_of_week_display()
     day_name.short_description = 'Day'
 
+    def delete_queryset(self, request, queryset):
+        # Bulk delete skips DoctorAvailability.delete(); refresh the snapshots here.
+        doctors = set(queryset.values_list('doctor_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for doctor_id in doctors:
+            analytics.refresh_availability(doctor_id)
+
 
 # =============================================================================
 # 3. MEETING MANAGEMENT
 # =============================================================================
 
+class MeetingAdminForm(forms.ModelForm):
+    """Shows a compacted transcript in the speech_to_text box as if it were still hot."""
+
+    class Meta:
+        model = Meeting
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk and self.instance.transcript_compacted:
+            self.initial['speech_to_text'] = self.instance.transcript
+
+
 @admin.register(Meeting)
 class MeetingAdmin(admin.ModelAdmin):
+    form = MeetingAdminForm
     list_display = (
         'meeting_id', 
         'scheduled_time',
@@ -105,8 +156,17 @@ class MeetingAdmin(admin.ModelAdmin):
         'doctor__username', 'doctor__first_name',
         'appointment_reason'
     )
-    readonly_fields = ('room_id', 'created_at', 'updated_at')
+    search_help_text = 'Searches room id, names and reason, plus transcripts through the full-text index.'
+    readonly_fields = ('room_id', 'transcript_compacted', 'started_at', 'ended_at', 'created_at', 'updated_at')
     autocomplete_fields = ['patient', 'doctor', 'sales', 'clinic']
+    transcript_search_limit = 500
+
+    # The table grows without bound: no exact COUNT(*) per page, and the
+    # transcript and participant list stay unread until a meeting is opened.
+    list_select_related = ('patient', 'doctor')
+    changelist_defer = ('speech_to_text', 'participants')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     # Organize the form into logical sections
     fieldsets = (
@@ -120,11 +180,11 @@ class MeetingAdmin(admin.ModelAdmin):
             'fields': ('scheduled_time', 'duration', 'status', 'meeting_type', 'appointment_type')
         }),
         ('Medical Context', {
-            'fields': ('appointment_reason', 'department', 'remark', 'speech_to_text'),
+            'fields': ('appointment_reason', 'department', 'remark', 'speech_to_text', 'transcript_compacted'),
             'classes': ('collapse',)  # Makes this section collapsible
         }),
         ('Metadata', {
-            'fields': ('created_at', 'updated_at')
+            'fields': ('started_at', 'ended_at', 'created_at', 'updated_at')
         }),
     )
 
@@ -132,21 +192,112 @@ class MeetingAdmin(admin.ModelAdmin):
     def get_patient(self, obj):
         return obj.patient.get_full_name() if obj.patient else "-"
     get_patient.short_description = 'Patient'
+    get_patient.admin_order_field = 'patient__first_name'
 
     def get_doctor(self, obj):
         return obj.doctor.get_full_name() if obj.doctor else "-"
     get_doctor.short_description = 'Doctor'
+    get_doctor.admin_order_field = 'doctor__first_name'
+
+    def get_changelist(self, request, **kwargs):
+        return DeferringChangeList
+
+    # --- Transcript search ---
+
+    def get_search_results(self, request, queryset, search_term):
+        base = queryset   # list_filter and date hierarchy already applied
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            # speech_to_text is deliberately not in search_fields: icontains
+            # would scan every transcript. The best-ranked index hits are
+            # added to the field matches instead, within the active filters.
+            hits = search.search(search_term, limit=self.transcript_search_limit)
+            if hits:
+                queryset = base.filter(
+                    Q(pk__in=queryset.values("pk")) | Q(pk__in=[hit.meeting_id for hit in hits]),
+                )
+                may_have_duplicates = False
+        return queryset, may_have_duplicates
+
+    def save_model(self, request, obj, form, change):
+        if change and obj.transcript_compacted:
+            if 'speech_to_text' in form.changed_data:
+                obj.transcript = obj.speech_to_text
+            else:
+                obj.speech_to_text = ''   # the form showed the archived text; leave it archived
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            if not change or 'speech_to_text' in form.changed_data:
+                search.replace(obj.pk, obj.transcript)
+
+    def delete_queryset(self, request, queryset):
+        # One by one so Meeting.delete() takes each meeting out of the utilization rollups.
+        with transaction.atomic():
+            for meeting in queryset:
+                meeting.delete()
 
     # --- Custom Actions ---
 
     @admin.action(description='Mark selected meetings as Cancelled')
     def mark_cancelled(self, request, queryset):
-        updated = queryset.update(status='cancelled')
+        updated = analytics.update_status(queryset, 'cancelled')
         self.message_user(request, f"{updated} meeting(s) marked as Cancelled.")
 
     @admin.action(description='Mark selected meetings as Ended')
     def mark_ended(self, request, queryset):
-        updated = queryset.update(status='ended')
+        updated = analytics.update_status(queryset, 'ended')
         self.message_user(request, f"{updated} meeting(s) marked as Ended.")
 
-    actions = [mark_cancelled, mark_ended]
\ No newline at end of file
+    actions = [mark_cancelled, mark_ended]
+
+
+@admin.register(TranscriptArchive)
+class TranscriptArchiveAdmin(admin.ModelAdmin):
+    list_display = ('meeting', 'codec', 'raw_size', 'stored_size', 'compacted_at')
+    list_filter = ('codec',)
+    readonly_fields = ('meeting', 'codec', 'raw_size', 'compacted_at')
+    exclude = ('data',)
+    # The meeting column's __str__ names its patient and doctor or sales rep.
+    list_select_related = ('meeting__patient', 'meeting__doctor', 'meeting__sales')
+    changelist_defer = ('data', 'meeting__speech_to_text', 'meeting__participants')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # The size comes from the database; the compressed bytes stay there.
+        return super().get_queryset(request).annotate(stored_bytes=Length('data'))
+
+    def get_changelist(self, request, **kwargs):
+        return DeferringChangeList
+
+    def stored_size(self, obj):
+        return obj.stored_bytes
+    stored_size.short_description = 'Compressed bytes'
+    stored_size.admin_order_field = 'stored_bytes'
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'attempts', 'run_after', 'locked_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('kind', 'last_error')
+    readonly_fields = ('attempts', 'locked_by', 'locked_until', 'last_error', 'created_at', 'finished_at')
+    ordering = ('-created_at',)
+    changelist_defer = ('payload', 'last_error')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return DeferringChangeList
+
+    @admin.action(description='Retry selected jobs now')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='running').update(
+            status='queued', attempts=0, run_after=timezone.now(), locked_until=None, finished_at=None,
+        )
+        self.message_user(request, f"{updated} job(s) queued again.")
+
+    actions = [retry_now]
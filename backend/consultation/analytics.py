@@ -0,0 +1,373 @@
+"""
+consultation/analytics.py
+=========================
+Doctor and sales-rep utilization, served from two rollup tables instead of
+scanning Meeting and DoctorAvailability on every dashboard load:
+
+  * UtilizationDaily — meeting counters per (local day, clinic, user, role,
+    appointment type). Meeting.save()/delete() call apply() with the
+    meeting's state before and after the write, in the same transaction;
+    apply() subtracts the old contribution and adds the new one with F()
+    increments. Booking, start, end and cancel therefore cost a few
+    single-row updates, wherever they happen (views, admin, scheduler).
+    Saves that change none of STATE_FIELDS (transcripts, remarks) do not
+    write those columns and skip the row lock and the rollups.
+    Queryset .update() bypasses save(): use update_status() for bulk
+    status changes.
+  * UtilizationAvailability — available minutes per (local day, clinic,
+    user), snapshotted from DoctorAvailability. Changing someone's hours
+    rewrites only today onwards (UTILIZATION_AVAILABILITY_DAYS ahead); past
+    days keep the hours they actually had.
+
+``manage.py rollup_utilization`` rebuilds both for a date range (backfill,
+or repair after raw SQL edits). summarize() is the read side used by
+/api/analytics/utilization/; it touches only the rollups.
+
+No-shows are meetings the scheduler (consultation/scheduler.py) marked
+"no_show", plus any still "scheduled" once their day is over.
+"""
+
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import DoctorAvailability, Meeting, UtilizationAvailability, UtilizationDaily
+
+STATE_FIELDS = (
+    "scheduled_time", "duration", "status", "clinic_id", "doctor_id", "sales_id",
+    "appointment_type", "started_at", "ended_at",
+)
+COUNTERS = (
+    "meetings", "scheduled", "started", "ended", "cancelled", "no_show",
+    "booked_minutes", "held_seconds", "held_count",
+)
+ROLES    = ("doctor", "sales")
+
+
+# ===== 1. Incremental maintenance =====
+
+def state(meeting):
+    """The fields the rollups depend on, normalised; loaded from the DB if any are deferred."""
+    values = meeting.__dict__
+    if all(field in values for field in STATE_FIELDS):
+        return _normalise(tuple(values[field] for field in STATE_FIELDS))
+    return _load(meeting.pk)
+
+
+def remember(meeting):
+    """Keep the state ``meeting`` was (re)loaded with, if none of it was deferred."""
+    values = meeting.__dict__
+    if all(field in values for field in STATE_FIELDS):
+        meeting._analytics_state = _normalise(tuple(values[field] for field in STATE_FIELDS))
+    else:
+        meeting._analytics_state = None
+
+
+def untouched_fields(meeting):
+    """
+    update_fields for a save that cannot move the rollups: every column but
+    STATE_FIELDS, if none of those changed since the meeting was loaded.
+    Not writing them also keeps a concurrent status change from being
+    overwritten behind the rollups' back. None if the state did change.
+    """
+    loaded = getattr(meeting, "_analytics_state", None)
+    if loaded is None or meeting._state.adding or state(meeting) != loaded:
+        return None
+    return [f.name for f in meeting._meta.concrete_fields if not f.primary_key and f.attname not in STATE_FIELDS]
+
+
+def writes_state(meeting, update_fields):
+    """Whether a save with these update_fields can change any of STATE_FIELDS."""
+    if update_fields is None or meeting._state.adding:
+        return True
+    return any(meeting._meta.get_field(name).attname in STATE_FIELDS for name in update_fields)
+
+
+def previous_state(meeting):
+    """State as stored, locked for the rest of the transaction; None for a new meeting."""
+    if meeting._state.adding or meeting.pk is None:
+        return None
+    return _load(meeting.pk, lock=True)
+
+
+def _load(pk, lock=False):
+    meetings = Meeting.objects.filter(pk=pk)
+    if lock:
+        meetings = meetings.select_for_update()
+    row = meetings.values_list(*STATE_FIELDS).first()
+    return _normalise(row) if row else None
+
+
+def _normalise(row):
+    scheduled_time, duration, *rest = row
+    if isinstance(scheduled_time, str):   # views pass the ISO string straight to create()
+        scheduled_time = parse_datetime(scheduled_time)
+    if scheduled_time is not None and timezone.is_naive(scheduled_time):
+        scheduled_time = timezone.make_aware(scheduled_time)
+    return (scheduled_time, int(duration or 0), *rest)
+
+
+def _contributions(state):
+    """{rollup key: {counter: value}} that one meeting in ``state`` adds."""
+    if state is None or state[0] is None:
+        return {}
+    scheduled_time, duration, status, clinic_id, doctor_id, sales_id, appointment_type, started_at, ended_at = state
+    counts = {"meetings": 1}
+    if status in ("scheduled", "started", "ended", "cancelled", "no_show"):
+        counts[status] = 1
+    if status != "cancelled":
+        counts["booked_minutes"] = duration
+    if status == "ended" and started_at and ended_at:
+        counts["held_seconds"] = max(0, int((ended_at - started_at).total_seconds()))
+        counts["held_count"]   = 1
+    day  = timezone.localdate(scheduled_time)
+    keys = []
+    if doctor_id:
+        keys.append((day, clinic_id, doctor_id, "doctor", appointment_type))
+    if sales_id:
+        keys.append((day, clinic_id, sales_id, "sales", appointment_type))
+    return {key: counts for key in keys}
+
+
+def apply(old, new):
+    """Move one meeting's contribution from state ``old`` to state ``new`` (either may be None)."""
+    deltas = defaultdict(Counter)
+    _collect(deltas, old, new)
+    _flush(deltas)
+
+
+def _collect(deltas, old, new):
+    for key, counts in _contributions(old).items():
+        deltas[key].subtract(counts)
+    for key, counts in _contributions(new).items():
+        deltas[key].update(counts)
+
+
+def _flush(deltas):
+    for key, delta in deltas.items():
+        delta = {counter: value for counter, value in delta.items() if value}
+        if delta:
+            _increment(key, delta)
+
+
+def _increment(key, delta):
+    day, clinic_id, user_id, role, appointment_type = key
+    row     = UtilizationDaily.objects.filter(
+        day=day, clinic_id=clinic_id, user_id=user_id, role=role, appointment_type=appointment_type,
+    )
+    changes = {counter: F(counter) + value for counter, value in delta.items()}
+    if row.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            UtilizationDaily.objects.create(
+                day=day, clinic_id=clinic_id, user_id=user_id, role=role,
+                appointment_type=appointment_type, **delta,
+            )
+    except IntegrityError:   # created concurrently
+        row.update(**changes)
+
+
+def update_status(meetings, status):
+    """
+    ``meetings.update(status=status)`` in one UPDATE, keeping the rollups and
+    started_at/ended_at in step; the rollup deltas of the whole batch are
+    merged, so each affected rollup row is written once. Returns the number
+    of meetings changed.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(meetings.exclude(status=status).select_for_update().values_list("pk", *STATE_FIELDS))
+        if not rows:
+            return 0
+        changes = {"status": status, "updated_at": now}
+        pks     = [row[0] for row in rows]
+        if status == "started":
+            Meeting.objects.filter(pk__in=pks, started_at__isnull=True).update(started_at=now)
+        if status == "ended":
+            Meeting.objects.filter(pk__in=pks, ended_at__isnull=True).update(ended_at=now)
+        Meeting.objects.filter(pk__in=pks).update(**changes)
+        deltas = defaultdict(Counter)
+        for row in rows:
+            old = _normalise(row[1:])
+            new = list(old)
+            new[2] = status
+            if status == "started" and new[7] is None:
+                new[7] = now
+            if status == "ended" and new[8] is None:
+                new[8] = now
+            _collect(deltas, old, tuple(new))
+        _flush(deltas)
+    return len(rows)
+
+
+# ===== 2. Availability snapshots =====
+
+def refresh_availability(user_id=None, start=None, end=None, replace_past=False):
+    """
+    Snapshot available minutes for days ``start``..``end`` (default: today
+    to UTILIZATION_AVAILABILITY_DAYS ahead) from the current
+    DoctorAvailability. Days before today are only filled in where missing,
+    unless ``replace_past``.
+    """
+    today = timezone.localdate()
+    start = start or today
+    end   = end or today + timedelta(days=getattr(settings, "UTILIZATION_AVAILABILITY_DAYS", 90))
+    hours = DoctorAvailability.objects.all()
+    if user_id is not None:
+        hours = hours.filter(doctor_id=user_id)
+    by_weekday = defaultdict(Counter)   # weekday -> {(user, clinic): minutes}
+    for user, clinic, weekday, opens, closes in hours.values_list(
+        "doctor_id", "clinic_id", "day_of_week", "start_time", "end_time",
+    ):
+        minutes = (closes.hour * 60 + closes.minute) - (opens.hour * 60 + opens.minute)
+        if minutes > 0:
+            by_weekday[weekday][(user, clinic)] += minutes
+
+    rows = UtilizationAvailability.objects.filter(day__range=(start, end))
+    if user_id is not None:
+        rows = rows.filter(user_id=user_id)
+    rewrite_from = start if replace_past else max(start, today)
+    with transaction.atomic():
+        rows.filter(day__gte=rewrite_from).delete()
+        kept = set(rows.values_list("day", "clinic_id", "user_id"))
+        snapshot = []
+        day = start
+        while day <= end:
+            for (user, clinic), minutes in by_weekday[day.weekday()].items():
+                if (day, clinic, user) not in kept:
+                    snapshot.append(UtilizationAvailability(
+                        day=day, clinic_id=clinic, user_id=user,
+                        role="doctor" if clinic else "sales", minutes=minutes,
+                    ))
+            day += timedelta(days=1)
+        UtilizationAvailability.objects.bulk_create(snapshot, batch_size=1000)
+    return len(snapshot)
+
+
+# ===== 3. Rebuild =====
+
+def _day_bounds(start, end):
+    """Aware datetimes covering local days ``start``..``end`` inclusive."""
+    return (
+        timezone.make_aware(datetime.combine(start, time.min)),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)),
+    )
+
+
+def rebuild(start, end):
+    """Recompute UtilizationDaily for local days ``start``..``end`` from Meeting."""
+    since, until = _day_bounds(start, end)
+    held = ExpressionWrapper(F("ended_at") - F("started_at"), output_field=DurationField())
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            # Lifecycle increments wait for the rebuild and then apply on top of it.
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {UtilizationDaily._meta.db_table} IN EXCLUSIVE MODE")
+        UtilizationDaily.objects.filter(day__range=(start, end)).delete()
+        rows = []
+        for role in ROLES:
+            grouped = (
+                Meeting.objects
+                .filter(scheduled_time__gte=since, scheduled_time__lt=until, **{f"{role}__isnull": False})
+                .annotate(day=TruncDate("scheduled_time", tzinfo=timezone.get_current_timezone()))
+                .values("day", "clinic_id", f"{role}_id", "appointment_type")
+                .annotate(
+                    n_meetings=Count("pk"),
+                    n_scheduled=Count("pk", filter=Q(status="scheduled")),
+                    n_started=Count("pk", filter=Q(status="started")),
+                    n_ended=Count("pk", filter=Q(status="ended")),
+                    n_cancelled=Count("pk", filter=Q(status="cancelled")),
+                    n_no_show=Count("pk", filter=Q(status="no_show")),
+                    n_booked=Sum("duration", filter=~Q(status="cancelled")),
+                    n_held=Sum(held, filter=Q(status="ended", started_at__isnull=False, ended_at__isnull=False)),
+                    n_held_count=Count("pk", filter=Q(status="ended", started_at__isnull=False, ended_at__isnull=False)),
+                )
+                .order_by()
+            )
+            for row in grouped.iterator(chunk_size=2000):
+                rows.append(UtilizationDaily(
+                    day=row["day"], clinic_id=row["clinic_id"], user_id=row[f"{role}_id"], role=role,
+                    appointment_type=row["appointment_type"],
+                    meetings=row["n_meetings"], scheduled=row["n_scheduled"], started=row["n_started"],
+                    ended=row["n_ended"], cancelled=row["n_cancelled"], no_show=row["n_no_show"],
+                    booked_minutes=row["n_booked"] or 0,
+                    held_seconds=int(row["n_held"].total_seconds()) if row["n_held"] else 0,
+                    held_count=row["n_held_count"],
+                ))
+        UtilizationDaily.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+# ===== 4. Read side =====
+
+def summarize(start, end, clinic=None, user=None, role=None):
+    """
+    Utilization per user over local days ``start``..``end``, from the
+    rollups only: {"users": [...], "totals": {...}}.
+    """
+    today  = timezone.localdate()
+    meetings = UtilizationDaily.objects.filter(day__range=(start, end))
+    hours    = UtilizationAvailability.objects.filter(day__range=(start, end))
+    if clinic is not None:
+        meetings, hours = meetings.filter(clinic_id=clinic), hours.filter(clinic_id=clinic)
+    if user is not None:
+        meetings, hours = meetings.filter(user_id=user), hours.filter(user_id=user)
+    if role is not None:
+        meetings, hours = meetings.filter(role=role), hours.filter(role=role)
+
+    sums  = {f"sum_{counter}": Sum(counter) for counter in COUNTERS}
+    users = {}
+
+    def entry(user_id, user_role):
+        return users.setdefault((user_id, user_role), {
+            "user_id": user_id, "role": user_role, "available_minutes": 0,
+            **{counter: 0 for counter in COUNTERS}, "past_scheduled": 0, "appointment_types": {},
+        })
+
+    for row in meetings.values("user_id", "role", "appointment_type").annotate(
+        **sums, past_scheduled=Sum("scheduled", filter=Q(day__lt=today)),
+    ).order_by():
+        item = entry(row["user_id"], row["role"])
+        for counter in COUNTERS:
+            item[counter] += row[f"sum_{counter}"] or 0
+        item["past_scheduled"] += row["past_scheduled"] or 0
+        item["appointment_types"][row["appointment_type"]] = row["sum_meetings"]
+    for row in hours.values("user_id", "role").annotate(minutes=Sum("minutes")).order_by():
+        entry(row["user_id"], row["role"])["available_minutes"] += row["minutes"]
+
+    names = {
+        pk: (f"{first} {last}".strip() or username)
+        for pk, first, last, username in User.objects.filter(
+            pk__in={user_id for user_id, _ in users},
+        ).values_list("pk", "first_name", "last_name", "username")
+    }
+    totals = {"available_minutes": 0, "past_scheduled": 0, **{counter: 0 for counter in COUNTERS}}
+    result = []
+    for item in users.values():
+        for counter in totals:
+            totals[counter] += item[counter]
+        result.append(_finish(item, name=names.get(item["user_id"], "")))
+    result.sort(key=lambda item: (item["role"], item["name"]))
+    return {"from": start, "to": end, "users": result, "totals": _finish(totals)}
+
+
+def _finish(item, **extra):
+    """Derived ratios; the raw seconds/counts behind them are dropped."""
+    held_seconds = item.pop("held_seconds")
+    held_count   = item.pop("held_count")
+    overdue      = item.pop("past_scheduled")   # never marked by the scheduler
+    item.update(extra)
+    item["in_progress"]          = item.pop("started")
+    item["no_shows"]             = item.pop("no_show") + overdue
+    item["still_scheduled"]      = item.pop("scheduled") - overdue
+    item["utilization"]          = round(item["booked_minutes"] / item["available_minutes"], 4) if item["available_minutes"] else None
+    item["avg_duration_minutes"] = round(held_seconds / held_count / 60, 1) if held_count else None
+    return item
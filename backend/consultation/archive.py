@@ -0,0 +1,301 @@
+"""
+consultation/archive.py
+=======================
+Opt-in on-disk archive of the raw PCM the STT consumers receive, so a
+meeting can be re-transcribed later.
+
+Layout under ``settings.AUDIO_ARCHIVE_ROOT``::
+
+    <room_id>/<speaker>/000000.pcm   linear16 mono, preallocated to
+                                     AUDIO_ARCHIVE_SEGMENT_SECONDS of audio
+    <room_id>/<speaker>/000000.idx   one record per chunk:
+                                     (wall-clock time received, offset, length)
+    <room_id>/<speaker>/meta.json    speaker label etc. (describe())
+
+  * AudioArchiver — process-wide. write() only enqueues and never touches
+    the disk; a daemon thread appends to the segment files and their
+    indexes. When the queue is full chunks are dropped and counted rather
+    than blocking the event loop. close_stream() truncates the last
+    segment to the bytes actually written; it does not block either, and
+    a close that finds the queue full is done by the writer the next time
+    it goes idle.
+  * ArchiveReader — random access to any time range of a stream, reading
+    the segments through mmap.
+"""
+
+import atexit
+import bisect
+import json
+import logging
+import mmap
+import os
+import queue
+import re
+import struct
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger("consultation.archive")
+
+BYTES_PER_SECOND = metrics.AUDIO_BYTES_PER_SECOND
+INDEX_RECORD     = struct.Struct("<dII")   # received_at (epoch s), offset, length
+_CLOSE           = object()
+_META            = object()
+_SAFE_NAME       = re.compile(r"[^A-Za-z0-9._-]+")
+_IDLE_SECONDS    = 1.0   # writer wake-up for closes that did not fit in the queue
+
+
+def safe_name(value):
+    """Path component for a room id or speaker label."""
+    return _SAFE_NAME.sub("_", value).strip("._") or "_"
+
+
+class _SegmentWriter:
+    """Appends one speaker's chunks to preallocated segment files. Writer thread only."""
+
+    def __init__(self, directory, segment_bytes):
+        self.directory     = directory
+        self.segment_bytes = segment_bytes
+        self.segment       = -1
+        self.pcm           = None
+        self.idx           = None
+        self.offset        = 0
+        directory.mkdir(parents=True, exist_ok=True)
+        existing = sorted(directory.glob("*.pcm"))
+        # A reconnecting consumer continues after the last segment on disk.
+        self.next_segment  = int(existing[-1].stem) + 1 if existing else 0
+
+    def append(self, data, received_at):
+        if self.pcm is None or self.offset + len(data) > self.segment_bytes:
+            self._roll()
+        self.pcm.seek(self.offset)
+        self.pcm.write(data)
+        self.idx.write(INDEX_RECORD.pack(received_at, self.offset, len(data)))
+        self.offset += len(data)
+
+    def _roll(self):
+        self.close()
+        self.segment       = self.next_segment
+        self.next_segment += 1
+        path     = self.directory / f"{self.segment:06d}.pcm"
+        self.pcm = open(path, "w+b")
+        try:
+            os.posix_fallocate(self.pcm.fileno(), 0, self.segment_bytes)
+        except (AttributeError, OSError):
+            self.pcm.truncate(self.segment_bytes)   # sparse, but still one extent-sized file
+        self.idx    = open(path.with_suffix(".idx"), "ab")
+        self.offset = 0
+
+    def flush(self):
+        if self.pcm is not None:
+            self.pcm.flush()
+            self.idx.flush()
+
+    def close(self):
+        if self.pcm is None:
+            return
+        self.pcm.truncate(self.offset)
+        self.pcm.close()
+        self.idx.close()
+        self.pcm = self.idx = None
+
+
+class AudioArchiver:
+
+    def __init__(self, root, segment_seconds=60, maxsize=2000):
+        self.root          = Path(root)
+        self.segment_bytes = int(segment_seconds * BYTES_PER_SECOND)
+        self.queue         = queue.Queue(maxsize)
+        self.writers       = {}       # (room, speaker) -> _SegmentWriter, writer thread only
+        self.dropped       = 0
+        self.late_closes   = set()    # (room, speaker) closes that found the queue full
+        self._thread       = threading.Thread(target=self._run, name="audio-archive", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, room, speaker, data, received_at):
+        """Queue a chunk; returns False (and counts it) if the writer is behind."""
+        try:
+            self.queue.put_nowait(((room, speaker), bytes(data), received_at))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            metrics.AUDIO_ARCHIVE_DROPPED.labels().inc()
+            return False
+
+    def describe(self, room, speaker, **meta):
+        """Record metadata (e.g. the display label) next to the stream's segments."""
+        try:
+            self.queue.put_nowait(((room, speaker), _META, meta))
+        except queue.Full:
+            pass
+
+    def close_stream(self, room, speaker):
+        """Finish the stream's current segment once everything queued before it is written."""
+        try:
+            self.queue.put_nowait(((room, speaker), _CLOSE, 0.0))
+        except queue.Full:
+            # Called from disconnect() on the event loop, so never wait for
+            # the disk; the writer closes it once it has drained the queue.
+            self.late_closes.add((room, speaker))
+
+    def close(self):
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout=10)
+
+    def _run(self):
+        written = metrics.AUDIO_ARCHIVE_BYTES.labels()
+        while True:
+            try:
+                item = self.queue.get(timeout=_IDLE_SECONDS)
+            except queue.Empty:
+                self._close_late()
+                continue
+            try:
+                if item is None:
+                    break
+                key, data, received_at = item
+                if data is _CLOSE:
+                    writer = self.writers.pop(key, None)
+                    if writer is not None:
+                        writer.close()
+                    continue
+                if data is _META:
+                    directory = self.root / safe_name(key[0]) / safe_name(key[1])
+                    directory.mkdir(parents=True, exist_ok=True)
+                    (directory / "meta.json").write_text(json.dumps(received_at))
+                    continue
+                writer = self.writers.get(key)
+                if writer is None:
+                    room, speaker = key
+                    writer = self.writers[key] = _SegmentWriter(
+                        self.root / safe_name(room) / safe_name(speaker), self.segment_bytes,
+                    )
+                writer.append(data, received_at)
+                written.inc(len(data))
+                if self.queue.empty():
+                    writer.flush()   # readers see complete indexes while idle
+            except Exception as exc:
+                logger.warning("archive.write_failed", extra={"error": str(exc)})
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
+
+    def _close_late(self):
+        while self.late_closes:
+            writer = self.writers.pop(self.late_closes.pop(), None)
+            if writer is not None:
+                writer.close()
+
+
+class ArchiveReader:
+    """
+    Reads one archived stream (``room``/``speaker``). Times are epoch
+    seconds as recorded on receipt; each chunk is taken to cover
+    ``length / BYTES_PER_SECOND`` seconds from its receive time.
+    """
+
+    def __init__(self, room, speaker, root=None):
+        root           = Path(root or settings.AUDIO_ARCHIVE_ROOT)
+        self.directory = root / safe_name(room) / safe_name(speaker)
+        self.chunks    = []   # (received_at, segment path, offset, length), by time
+        for idx_path in sorted(self.directory.glob("*.idx")):
+            pcm_path = idx_path.with_suffix(".pcm")
+            raw      = idx_path.read_bytes()
+            usable   = len(raw) - len(raw) % INDEX_RECORD.size   # ignore a torn last record
+            for received_at, offset, length in INDEX_RECORD.iter_unpack(raw[:usable]):
+                self.chunks.append((received_at, pcm_path, offset, length))
+        self.chunks.sort(key=lambda chunk: chunk[0])
+        self._times = [chunk[0] for chunk in self.chunks]
+        self._maps  = {}
+
+    @staticmethod
+    def speakers(room, root=None):
+        directory = Path(root or settings.AUDIO_ARCHIVE_ROOT) / safe_name(room)
+        return sorted(p.name for p in directory.iterdir() if p.is_dir()) if directory.is_dir() else []
+
+    def meta(self):
+        """What describe() recorded for this stream ({} if nothing)."""
+        try:
+            return json.loads((self.directory / "meta.json").read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def span(self):
+        """(first, last) epoch seconds covered, or None if nothing was archived."""
+        if not self.chunks:
+            return None
+        first, last = self.chunks[0], self.chunks[-1]
+        return first[0], last[0] + last[3] / BYTES_PER_SECOND
+
+    def read(self, start=None, end=None):
+        """PCM for chunks overlapping [start, end), cut to the range at sample precision."""
+        return b"".join(self.iter_range(start, end))
+
+    def iter_range(self, start=None, end=None):
+        if not self.chunks:
+            return
+        first, last = self.span()
+        start = first if start is None else start
+        end   = last if end is None else end
+        # The chunk received just before ``start`` may still be playing at ``start``.
+        i = max(0, bisect.bisect_right(self._times, start) - 1)
+        for received_at, path, offset, length in self.chunks[i:]:
+            if received_at >= end:
+                break
+            chunk_end = received_at + length / BYTES_PER_SECOND
+            if chunk_end <= start:
+                continue
+            skip = _to_bytes(max(0.0, start - received_at))
+            stop = min(length, _to_bytes(end - received_at))
+            if stop > skip:
+                yield self._map(path)[offset + skip:offset + stop]
+
+    def close(self):
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps.clear()
+
+    def _map(self, path):
+        mapped = self._maps.get(path)
+        if mapped is None:
+            with open(path, "rb") as fh:
+                mapped = self._maps[path] = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapped
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _to_bytes(seconds):
+    """Byte count for ``seconds`` of audio, aligned to whole samples."""
+    n = round(seconds * BYTES_PER_SECOND)
+    return n - n % 2
+
+
+_archiver      = None
+_archiver_lock = threading.Lock()
+
+
+def get_archiver():
+    """The process-wide AudioArchiver, or None unless AUDIO_ARCHIVE_ENABLED."""
+    global _archiver
+    if not getattr(settings, "AUDIO_ARCHIVE_ENABLED", False):
+        return None
+    if _archiver is None:
+        with _archiver_lock:
+            if _archiver is None:
+                _archiver = AudioArchiver(
+                    settings.AUDIO_ARCHIVE_ROOT,
+                    getattr(settings, "AUDIO_ARCHIVE_SEGMENT_SECONDS", 60),
+                    getattr(settings, "AUDIO_ARCHIVE_QUEUE", 2000),
+                )
+    return _archiver
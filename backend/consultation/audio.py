@@ -0,0 +1,157 @@
+"""
+consultation/audio.py
+=====================
+PCM helpers for the STT consumers.
+
+ReplayBuffer keeps the recent audio of one upstream stream so nothing
+spoken during a Deepgram outage is lost, and drops transcripts of audio
+that was already delivered once the stream is replayed.
+
+StereoInterleaver merges two mono linear16 streams that arrive as separate
+WebSocket frames (prefix 0x01 / 0x02) into one 2-channel interleaved
+stream, so a two-speaker session needs a single Deepgram connection
+(``channels=2&multichannel=true``) instead of two.
+
+Samples are paired in arrival order. When one side runs more than
+``max_lag`` seconds ahead of the other (muted mic, tab in background) the
+lagging side is filled with silence so the active speaker is never held
+back. Deepgram reports each result with ``channel_index = [ch, 2]``.
+"""
+
+from collections import deque
+
+import numpy as np
+
+SAMPLE_RATE  = 16000
+SAMPLE_BYTES = 2
+_PCM_DTYPE   = np.dtype("<i2")
+
+
+class ReplayBuffer:
+    """
+    Time-bounded record of the audio sent (or due to be sent) upstream.
+
+    Positions are "session seconds": audio time since the consumer
+    connected, independent of how many upstream connections it took.
+
+      * append() records every chunk the client sends, whether or not the
+        upstream socket is currently usable; mark_sent() advances the send
+        cursor once a chunk actually went out.
+      * After a reconnect, rewind() moves the cursor back to the oldest
+        chunk not yet covered by a final transcript and next_unsent()
+        drains the backlog: that utterance plus everything received while
+        the socket was down.
+      * accept() maps a result's start/duration on the new connection back
+        to session time and rejects results that end inside audio already
+        finalised (per channel for multichannel streams).
+
+    Audio older than ``window`` seconds, or fully covered by finals, is
+    discarded; append() returns how many unsent chunks expired that way.
+    """
+
+    def __init__(self, window=20.0, bytes_per_second=SAMPLE_RATE * SAMPLE_BYTES, channels=1):
+        self.window           = window
+        self.bytes_per_second = bytes_per_second
+        self.chunks           = deque()   # (seq, start, end, received_at, data)
+        self.next_seq         = 0
+        self.cursor           = 0         # seq of the next chunk to send
+        self.total            = 0.0       # session seconds appended so far
+        self.base             = 0.0       # session time of the current connection's t=0
+        self.final_end        = [0.0] * channels
+
+    def append(self, data, received_at):
+        start       = self.total
+        self.total += len(data) / self.bytes_per_second
+        self.chunks.append((self.next_seq, start, self.total, received_at, data))
+        self.next_seq += 1
+        return self._trim()
+
+    def mark_sent(self):
+        self.cursor = self.next_seq
+
+    def rewind(self):
+        """Restart sending from the oldest retained chunk; returns seconds to replay."""
+        if self.chunks:
+            self.cursor = self.chunks[0][0]
+            self.base   = self.chunks[0][1]
+        else:
+            self.cursor = self.next_seq
+            self.base   = self.total
+        return self.total - self.base
+
+    def next_unsent(self):
+        """(data, received_at) of the next chunk to send and advance, or None."""
+        if not self.chunks:
+            return None
+        index = self.cursor - self.chunks[0][0]
+        if index >= len(self.chunks):
+            return None
+        _, _, _, received_at, data = self.chunks[index]
+        self.cursor += 1
+        return data, received_at
+
+    def accept(self, start, duration, is_final, channel=0):
+        """False if this result only covers audio that was already finalised."""
+        end = self.base + start + duration
+        if end <= self.final_end[channel] + 1e-3:
+            return False
+        if is_final:
+            self.final_end[channel] = end
+            self._trim()
+        return True
+
+    def _trim(self):
+        limit   = max(min(self.final_end), self.total - self.window)
+        expired = 0
+        chunks  = self.chunks
+        while chunks and chunks[0][2] <= limit:
+            seq = chunks.popleft()[0]
+            if seq >= self.cursor:
+                expired    += 1
+                self.cursor = seq + 1
+        return expired
+
+
+class StereoInterleaver:
+
+    def __init__(self, max_lag=0.1, sample_rate=SAMPLE_RATE):
+        self.max_lag_bytes = int(max_lag * sample_rate) * SAMPLE_BYTES
+        self.pending       = (bytearray(), bytearray())
+        self.silence_bytes = 0   # bytes of silence inserted so far, for stats
+
+    def push(self, channel, pcm):
+        """
+        Queue mono ``pcm`` for ``channel`` (0 or 1). Returns interleaved
+        stereo bytes ready to send, or b"" if nothing can be emitted yet.
+        """
+        self.pending[channel].extend(pcm)
+        a, b  = self.pending
+        ready = min(len(a), len(b))
+        lead  = max(len(a), len(b))
+        if lead - ready > self.max_lag_bytes:
+            ready = lead
+        return self._emit(ready - ready % SAMPLE_BYTES)
+
+    def flush(self):
+        """Emit everything still queued, silence-filling the shorter side."""
+        lead = max(len(self.pending[0]), len(self.pending[1]))
+        return self._emit(lead - lead % SAMPLE_BYTES)
+
+    def reset(self):
+        for buf in self.pending:
+            buf.clear()
+
+    def _emit(self, nbytes):
+        if nbytes <= 0:
+            return b""
+        out = np.zeros((nbytes // SAMPLE_BYTES, 2), dtype=_PCM_DTYPE)
+        for ch, buf in enumerate(self.pending):
+            take = min(len(buf), nbytes)
+            take -= take % SAMPLE_BYTES
+            if take:
+                # Copy into the output before trimming: a live frombuffer()
+                # view would stop the bytearray from being resized.
+                out[:take // SAMPLE_BYTES, ch] = np.frombuffer(buf, dtype=_PCM_DTYPE, count=take // SAMPLE_BYTES)
+                del buf[:take]
+            self.silence_bytes += nbytes - take
+        return out.tobytes()
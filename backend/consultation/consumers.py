@@ -16,12 +16,27 @@ Bug fixes in this file:
 import asyncio
 import datetime
 import json
+import logging
 import os
+import time
 import uuid
 from urllib.parse import unquote_plus
 
 import websockets
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.exceptions import ChannelFull
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from . import metrics
+from .archive import get_archiver
+from .audio import ReplayBuffer, StereoInterleaver
+from .resilience import backoff_delay, deepgram_breaker
+from .encoding import MSGPACK_SUBPROTOCOL, encode, event_frames, json_safe, msgpack_enabled, pack, pick_frame, unpack
+from .outbound import CHAT, FINAL, INTERIM, PRIORITY_NAMES, SIGNALLING, OutboundQueue
+from .ratelimit import PeerLimiter
+from .services import CaptionPublisher, RoomManager, SocketStatusService, SocketStatusStream, is_admin, is_participant
 
 DEEPGRAM_API_KEY = os.getenv("DEEPGRAM_API_KEY", "241891d132965abc6b1488661f56229bc0d70f47")
 
@@ -31,36 +46,41 @@ except Exception:
     _WS_MAJOR = 10
 
 _HEADERS_KWARG = "additional_headers" if _WS_MAJOR >= 14 else "extra_headers"
-print(f"ℹ️  websockets {websockets.__version__}  ->  header kwarg = '{_HEADERS_KWARG}'")
+
+logger            = logging.getLogger("consultation.consumers")
+transcript_logger = logging.getLogger("consultation.stt.transcript")
+# Interim transcripts arrive several times a second per stream; settings.LOGGING samples this logger.
+interim_logger    = logging.getLogger("consultation.stt.interim")
+
+logger.info("websockets.version", extra={"version": websockets.__version__, "header_kwarg": _HEADERS_KWARG})
 
 # FIX: Use nova-2 (general) for ALL roles.
 # nova-2-medical is so narrowly tuned that it silently drops audio from
 # doctors, patients, and sales reps alike unless the acoustic conditions
 # exactly match its training data. nova-2 works reliably for everyone.
-DEEPGRAM_URI_GENERAL = (
-    "wss://api.deepgram.com/v1/listen"
-    "?model=nova-2"
-    "&punctuate=true"
-    "&interim_results=true"
-    "&encoding=linear16"
-    "&sample_rate=16000"
-    "&channels=1"
-    "&smart_format=true"
-    "&endpointing=300"
-)
+#
+# The endpoint comes from settings.DEEPGRAM_URL so the consumers can be
+# pointed at the local emulator (consultation/deepgram_emulator.py).
+def deepgram_uri(model="nova-2", channels=1):
+    base = getattr(settings, "DEEPGRAM_URL", "wss://api.deepgram.com/v1/listen")
+    return (
+        f"{base}"
+        f"?model={model}"
+        "&punctuate=true"
+        "&interim_results=true"
+        "&encoding=linear16"
+        "&sample_rate=16000"
+        f"&channels={channels}"
+        f"{'&multichannel=true' if channels > 1 else ''}"
+        "&smart_format=true"
+        "&endpointing=300"
+    )
+
+
+DEEPGRAM_URI_GENERAL = deepgram_uri("nova-2")
 
 # Keep medical URI available for future opt-in but don't use it by default
-DEEPGRAM_URI_MEDICAL = (
-    "wss://api.deepgram.com/v1/listen"
-    "?model=nova-2-medical"
-    "&punctuate=true"
-    "&interim_results=true"
-    "&encoding=linear16"
-    "&sample_rate=16000"
-    "&channels=1"
-    "&smart_format=true"
-    "&endpointing=300"
-)
+DEEPGRAM_URI_MEDICAL = deepgram_uri("nova-2-medical")
 
 # All consumers use the general URI now
 DEEPGRAM_URI = DEEPGRAM_URI_GENERAL
@@ -69,8 +89,181 @@ DOCTOR_PREFIX  = 0x01
 PATIENT_PREFIX = 0x02
 KEEPALIVE_MSG  = json.dumps({"type": "KeepAlive"})
 
-# In-memory room registry  { room_name: { peer_id: { name, role, channel } } }
-_room_peers: dict = {}
+# Pre-bound metric series for CallConsumer.receive; unknown client-supplied
+# types collapse into "other" so they cannot blow up label cardinality.
+_SIGNAL_TYPES = ("join", "offer", "answer", "ice", "ice_batch", "chat", "pong", "invalid", "other")
+_SIGNAL_COUNTERS   = {t: metrics.SIGNALLING_MESSAGES.labels(t) for t in _SIGNAL_TYPES}
+_THROTTLE_COUNTERS = {t: metrics.SIGNALLING_THROTTLED.labels(t) for t in _SIGNAL_TYPES}
+_ICE_RELAYED       = {u: metrics.ICE_RELAYED.labels(u) for u in ("candidates", "sends")}
+
+_ICE_BATCH_WINDOW = float(getattr(settings, "CALL_ICE_BATCH_WINDOW", 0.03))
+_ICE_BATCH_MAX    = int(getattr(settings, "CALL_ICE_BATCH_MAX", 20))
+_ICE_BATCHABLE    = {"type", "to", "from", "candidate"}   # keys of an ice message a batch can carry
+
+
+def _query_params(scope):
+    """Decode the WebSocket query string with unquote_plus (names may contain '+', '%27', accents...)."""
+    params = {}
+    for part in scope.get("query_string", b"").decode().split("&"):
+        if "=" in part:
+            k, v = part.split("=", 1)
+            params[k] = unquote_plus(v)
+    return params
+
+
+def _user_id(scope):
+    """Primary key of the authenticated user on this socket, or None."""
+    user = scope.get("user")
+    return user.pk if getattr(user, "is_authenticated", False) else None
+
+
+async def _caption_room(consumer, tag):
+    """
+    The ``?room=`` an STT socket asks to caption into, "" for none, or None
+    if the user may not: only the meeting's own people (and admins) can
+    publish captions into its call.
+    """
+    room = _query_params(consumer.scope).get("room", "").strip()
+    if room and not await database_sync_to_async(is_participant)(consumer.scope.get("user"), room):
+        logger.warning("stt.room_refused", extra={"tag": tag, "room": room, "user": _user_id(consumer.scope)})
+        return None
+    return room
+
+
+def _bind_stt_metrics(consumer, tag):
+    """Attach this consumer's metric series once so hot paths skip label lookups."""
+    consumer._m_in         = metrics.STT_AUDIO_BYTES.labels(tag, "in")
+    consumer._m_out        = metrics.STT_AUDIO_BYTES.labels(tag, "out")
+    consumer._m_expired    = metrics.STT_DROPPED_CHUNKS.labels(tag, "replay_expired")
+    consumer._m_replayed   = metrics.STT_REPLAYED_BYTES.labels(tag)
+    consumer._m_dedup      = metrics.STT_DEDUPED_RESULTS.labels(tag)
+    consumer._m_connect    = metrics.DEEPGRAM_CONNECT_SECONDS.labels(tag)
+    consumer._m_reconn_ok  = metrics.DEEPGRAM_RECONNECTS.labels(tag, "ok")
+    consumer._m_reconn_err = metrics.DEEPGRAM_RECONNECTS.labels(tag, "failed")
+    consumer._m_latency    = {
+        True : metrics.TRANSCRIPT_LATENCY_SECONDS.labels(tag, "true"),
+        False: metrics.TRANSCRIPT_LATENCY_SECONDS.labels(tag, "false"),
+    }
+
+
+def _observe_transcript_latency(latency, clock, data, is_final):
+    """Record audio-received → transcript-sent time for a Deepgram Results message."""
+    try:
+        audio_end = float(data.get("start", 0)) + float(data.get("duration", 0))
+    except (TypeError, ValueError):
+        return
+    received = clock.received_at(audio_end)
+    if received is not None:
+        latency[bool(is_final)].observe(time.monotonic() - received)
+
+
+def _accept_result(consumer, replay, data, is_final, channel=0):
+    """False for results covering audio already finalised before a replay."""
+    try:
+        start, duration = float(data.get("start", 0)), float(data.get("duration", 0))
+    except (TypeError, ValueError):
+        return True
+    if replay.accept(start, duration, is_final, channel):
+        return True
+    consumer._m_dedup.inc()
+    return False
+
+
+async def _notify(consumer, message):
+    try:
+        await _push(consumer, json.dumps(message))
+    except Exception:
+        pass
+
+
+def _open_outbox(consumer, tag):
+    """OutboundQueue for ``consumer``, or None when WS_OUTBOUND_BUDGET is 0 (inline sends)."""
+    budget = getattr(settings, "WS_OUTBOUND_BUDGET", 256 * 1024)
+    if not budget:
+        return None
+    drops  = [metrics.WS_OUTBOUND_DROPPED.labels(tag, name) for name in PRIORITY_NAMES]
+    closes = metrics.WS_SLOW_CLIENT_CLOSES.labels(tag)
+
+    async def send(frame):
+        if isinstance(frame, bytes):
+            await AsyncWebsocketConsumer.send(consumer, bytes_data=frame)
+        else:
+            await AsyncWebsocketConsumer.send(consumer, text_data=frame)
+
+    async def overflow():
+        closes.inc()
+        logger.warning("ws.slow_client_closed", extra={"tag": tag, "channel": consumer.channel_name})
+        await consumer.close(code=1013)
+
+    return OutboundQueue(
+        send, budget, getattr(settings, "WS_OUTBOUND_HARD_LIMIT", 1024 * 1024),
+        on_drop=lambda priority, count: drops[priority].inc(count),
+        on_overflow=overflow,
+    )
+
+
+async def _push(consumer, frame, priority=SIGNALLING, key=None):
+    """Queue a text (JSON) or bytes (msgpack) frame on the consumer's outbox, or send it inline."""
+    if consumer.outbox is not None:
+        consumer.outbox.put(frame, priority, key)
+    elif isinstance(frame, bytes):
+        await consumer.send(bytes_data=frame)
+    else:
+        await consumer.send(text_data=frame)
+
+
+async def _connect_upstream(consumer, tag, label):
+    """
+    Re-open a Deepgram connection with jittered exponential backoff. While
+    the process-wide breaker is open nothing is dialled and the client is
+    told once that transcription is degraded (its audio is still kept for
+    replay). Returns the socket, or None if the consumer closed meanwhile.
+    """
+    base     = getattr(settings, "STT_RECONNECT_BACKOFF", 0.5)
+    cap      = getattr(settings, "STT_RECONNECT_BACKOFF_MAX", 30.0)
+    attempt  = 0
+    degraded = False
+    while not consumer._closing:
+        if not deepgram_breaker.allow():
+            if not degraded:
+                degraded = True
+                retry_in = deepgram_breaker.retry_after()
+                logger.warning("deepgram.degraded", extra={"tag": tag, "speaker": label, "retry_in": round(retry_in, 1)})
+                await _notify(consumer, {"type": "stt_degraded", "speaker": label, "retry_in": round(retry_in, 1)})
+            await asyncio.sleep(max(deepgram_breaker.retry_after(), 0.5) + backoff_delay(0, base, cap))
+            continue
+        await asyncio.sleep(backoff_delay(attempt, base, cap))
+        try:
+            ws = await asyncio.wait_for(consumer._open_deepgram(), timeout=20.0)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            deepgram_breaker.record_failure()
+            consumer._m_reconn_err.inc()
+            logger.error("deepgram.reconnect_failed", extra={
+                "tag": tag, "speaker": label, "attempt": attempt, "error": str(exc)[:120] or type(exc).__name__,
+            })
+            attempt += 1
+            continue
+        deepgram_breaker.record_success()
+        consumer._m_reconn_ok.inc()
+        if degraded:
+            await _notify(consumer, {"type": "stt_recovered", "speaker": label})
+        return ws
+    return None
+
+
+async def _drain_replay(ws, replay, clock):
+    """Send every chunk past the replay cursor to ``ws``; returns bytes sent."""
+    sent = 0
+    while True:
+        item = replay.next_unsent()
+        if item is None:
+            return sent
+        data, received_at = item
+        await ws.send(data)
+        clock.on_audio(len(data), received_at)
+        sent += len(data)
 
 
 # =============================================================================
@@ -85,116 +278,235 @@ class CallConsumer(AsyncWebsocketConsumer):
         self.peer_id         = str(uuid.uuid4())[:8]
         self.peer_name       = "Participant"
         self.peer_role       = "participant"
-
-        if self.room_name not in _room_peers:
-            _room_peers[self.room_name] = {}
+        self.peer            = None   # RoomManager record once joined
+        self.outbox          = _open_outbox(self, "call")
+        self.limiter         = PeerLimiter()
+        self.throttle_logged = False
+        self.binary          = msgpack_enabled() and MSGPACK_SUBPROTOCOL in self.scope.get("subprotocols", ())
+        self.ice_pending     = {}     # target peer id -> candidates held for the batch window
+        self.ice_timer       = None
+        self.user_id         = _user_id(self.scope)
 
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
-        print(f"✅ [Call] peer={self.peer_id} connected  room={self.room_name}")
+        await self.accept(subprotocol=MSGPACK_SUBPROTOCOL if self.binary else None)
+        SocketStatusService.register_socket(
+            self.channel_name, "call",
+            user_info={"peer_id": self.peer_id}, room=self.room_name,
+        )
+        RoomManager.ensure_sweeper()
+        logger.info("call.connected", extra={"peer": self.peer_id, "room": self.room_name})
+
+    async def _throttled(self, msg_type):
+        _THROTTLE_COUNTERS.get(msg_type, _THROTTLE_COUNTERS["other"]).inc()
+        strikes = self.limiter.strikes
+        if not self.throttle_logged:
+            self.throttle_logged = True
+            logger.warning("call.throttled", extra={"peer": self.peer_id, "room": self.room_name, "type": msg_type})
+        close_after = getattr(settings, "CALL_FLOOD_CLOSE_AFTER", 0)
+        if close_after and strikes == close_after:
+            metrics.SIGNALLING_FLOOD_CLOSES.labels().inc()
+            logger.warning("call.flood_closed", extra={"peer": self.peer_id, "room": self.room_name, "type": msg_type})
+            await self.close(code=1008)
 
     async def disconnect(self, close_code):
-        room = _room_peers.get(self.room_name, {})
-        room.pop(self.peer_id, None)
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type"   : "relay_message",
-                "payload": {"type": "peer_left", "id": self.peer_id},
-                "exclude": self.channel_name,
-            },
-        )
+        SocketStatusService.unregister_socket(self.channel_name)
+        if self.outbox is not None:
+            self.outbox.close()
+        if self.ice_timer is not None:
+            self.ice_timer.cancel()
+        self.ice_pending = {}
+        # False if never joined or already evicted (peer_left was sent then).
+        if RoomManager.leave(self.room_name, self.peer_id):
+            await self.broadcast({"type": "peer_left", "id": self.peer_id})
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
-        print(f"❌ [Call] peer={self.peer_id} left  room={self.room_name}  code={close_code}")
+        logger.info("call.left", extra={"peer": self.peer_id, "room": self.room_name, "code": close_code})
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            data = json.loads(text_data)
+            data = unpack(bytes_data) if bytes_data is not None and self.binary else json.loads(text_data)
+            if not isinstance(data, dict):
+                raise ValueError("not an object")
+            if self.binary and not json_safe(data):
+                raise ValueError("not representable as JSON")   # bytes/ext values can't reach JSON peers
         except Exception:
-            return
+            data = {"type": "invalid"}
 
         msg_type = data.get("type")
+        if not isinstance(msg_type, str):   # a list or dict here would break the lookups below
+            msg_type = "other"
+        _SIGNAL_COUNTERS.get(msg_type, _SIGNAL_COUNTERS["other"]).inc()
+        if self.peer is not None:
+            # Any message counts as a heartbeat, throttled ones too: a peer
+            # over its limit is still alive and must not be evicted as a ghost.
+            self.peer.last_seen = time.monotonic()
+        if not self.limiter.allow(msg_type):
+            await self._throttled(msg_type)
+            return
+        if msg_type == "invalid":
+            return
 
         if msg_type == "join":
             self.peer_name = data.get("name", "Participant")
             self.peer_role = data.get("role", "participant")
-            room = _room_peers.setdefault(self.room_name, {})
+            features       = data.get("features")
+            batch_ice      = isinstance(features, list) and "ice_batch" in features
             existing_peers = [
-                {"id": pid, "name": info["name"], "role": info["role"]}
-                for pid, info in room.items()
+                peer.as_dict() for peer in RoomManager.peers(self.room_name).values()
+                if peer.id != self.peer_id
             ]
-            room[self.peer_id] = {
-                "name"   : self.peer_name,
-                "role"   : self.peer_role,
-                "channel": self.channel_name,
-            }
-            await self.send(json.dumps({
+            self.peer = RoomManager.join(
+                self.room_name, self.peer_id, self.peer_name, self.peer_role, self.channel_name,
+                binary=self.binary, batch_ice=batch_ice, user_id=self.user_id,
+            )
+            SocketStatusService.update_socket(self.channel_name, name=self.peer_name, role=self.peer_role)
+            await _push(self, self.frame({
                 "type" : "assigned",
                 "id"   : self.peer_id,
                 "peers": existing_peers,
             }))
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type"   : "relay_message",
-                    "payload": {
-                        "type": "peer_joined",
-                        "id"  : self.peer_id,
-                        "name": self.peer_name,
-                        "role": self.peer_role,
-                    },
-                    "exclude": self.channel_name,
-                },
-            )
-            print(f"📋 [Call] {self.peer_name} ({self.peer_role}) joined — room={self.room_name}  peers={len(room)}")
+            await self.broadcast({
+                "type": "peer_joined",
+                "id"  : self.peer_id,
+                "name": self.peer_name,
+                "role": self.peer_role,
+            })
+            logger.info("call.joined", extra={
+                "peer": self.peer_id, "peer_name": self.peer_name, "role": self.peer_role,
+                "room": self.room_name, "peers": len(existing_peers) + 1,
+            })
             return
 
-        if msg_type in ("offer", "answer", "ice"):
-            to_id  = data.get("to")
-            room   = _room_peers.get(self.room_name, {})
-            target = room.get(to_id)
-            if not target:
+        if msg_type in ("offer", "answer", "ice", "ice_batch"):
+            target = RoomManager.get(self.room_name, data.get("to"))
+            if target is None:
+                return
+            if msg_type == "ice_batch":
+                candidates = data.get("candidates")
+                if isinstance(candidates, list):
+                    await self._queue_ice(target, candidates)   # split into batches of _ICE_BATCH_MAX
                 return
+            # An ice message with more than its candidate is forwarded whole,
+            # after anything held for the target, since a batch carries only
+            # candidates.
+            if msg_type == "ice" and _ICE_BATCH_WINDOW > 0 and target.batch_ice and data.keys() <= _ICE_BATCHABLE:
+                await self._queue_ice(target, [data.get("candidate")])
+                return
+            # Candidates still waiting for this target must not overtake
+            # (or be overtaken by) the description they belong to.
+            if target.id in self.ice_pending:
+                await self._flush_ice(target.id)
             fwd = dict(data)
             fwd["from"] = self.peer_id
             fwd.pop("to", None)
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type"          : "relay_to_channel",
-                    "payload"       : fwd,
-                    "target_channel": target["channel"],
-                },
-            )
+            if msg_type == "ice":
+                _ICE_RELAYED["candidates"].inc()
+            await self._relay(target, fwd)
             return
 
         if msg_type == "chat":
-            await self.channel_layer.group_send(
-                self.room_group_name,
+            await self.broadcast({
+                "type": "chat",
+                "from": self.peer_id,
+                "name": self.peer_name,
+                "role": self.peer_role,
+                "text": str(data.get("text", ""))[:500],
+                "ts"  : datetime.datetime.utcnow().isoformat() + "Z",
+            }, CHAT)
+            return
+
+    async def _relay(self, target, payload):
+        """Unicast ``payload`` to ``target``, encoded once in its format; its consumer forwards it as-is."""
+        frame = {"bytes": pack(payload)} if target.binary else {"text": encode(payload)}
+        if payload.get("type") in ("ice", "ice_batch"):
+            _ICE_RELAYED["sends"].inc()
+        try:
+            await self.channel_layer.send(
+                target.channel,
                 {
-                    "type"   : "relay_message",
-                    "payload": {
-                        "type": "chat",
-                        "from": self.peer_id,
-                        "name": self.peer_name,
-                        "role": self.peer_role,
-                        "text": str(data.get("text", ""))[:500],
-                        "ts"  : datetime.datetime.utcnow().isoformat() + "Z",
-                    },
-                    "exclude": self.channel_name,
+                    "type"          : "relay_to_channel",
+                    **frame,
+                    "target_channel": target.channel,
                 },
             )
+        except ChannelFull:
+            # The target is not reading its channel; heartbeat eviction
+            # or its outbound queue will close it — don't take us down too.
+            logger.warning("call.channel_full", extra={"room": self.room_name, "peer": target.id, "type": payload.get("type")})
+
+    async def _queue_ice(self, target, candidates):
+        """
+        Hold trickled candidates for ``target`` for up to CALL_ICE_BATCH_WINDOW
+        and deliver them as one ice_batch: one channel-layer send per
+        (from, to) pair and window instead of one per candidate.
+        """
+        _ICE_RELAYED["candidates"].inc(len(candidates))
+        if not target.batch_ice:
+            # Target can't read ice_batch (older client): one ice per candidate.
+            for candidate in candidates:
+                await self._relay(target, {"type": "ice", "candidate": candidate, "from": self.peer_id})
             return
+        pending = self.ice_pending.setdefault(target.id, [])
+        pending.extend(candidates)
+        if len(pending) >= _ICE_BATCH_MAX or _ICE_BATCH_WINDOW <= 0:
+            await self._flush_ice(target.id)
+        elif self.ice_timer is None:
+            self.ice_timer = asyncio.get_running_loop().call_later(
+                _ICE_BATCH_WINDOW, lambda: asyncio.ensure_future(self._flush_ice()),
+            )
+
+    async def _flush_ice(self, target_id=None):
+        """Send the held candidates for ``target_id`` (or every target, when the window closes)."""
+        if target_id is None:
+            self.ice_timer = None
+            batches, self.ice_pending = self.ice_pending, {}
+        else:
+            batches = {target_id: self.ice_pending.pop(target_id, [])}
+            if not self.ice_pending and self.ice_timer is not None:
+                self.ice_timer.cancel()
+                self.ice_timer = None
+        for peer_id, candidates in batches.items():
+            target = RoomManager.get(self.room_name, peer_id)
+            if target is None:
+                continue
+            for i in range(0, len(candidates), _ICE_BATCH_MAX):
+                batch = candidates[i:i + _ICE_BATCH_MAX]
+                if len(batch) == 1:
+                    await self._relay(target, {"type": "ice", "candidate": batch[0], "from": self.peer_id})
+                else:
+                    await self._relay(target, {"type": "ice_batch", "candidates": batch, "from": self.peer_id})
 
+    def frame(self, payload):
+        """``payload`` encoded for this socket: msgpack bytes or JSON text."""
+        return pack(payload) if self.binary else encode(payload)
+
+    async def broadcast(self, payload, priority=SIGNALLING):
+        """Encode ``payload`` once per format in use and fan it out to every other peer in the room."""
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                "type"    : "relay_message",
+                **event_frames(payload, RoomManager.has_binary(self.room_name)),
+                "exclude" : self.channel_name,
+                "priority": priority,
+            },
+        )
+
+    # Receivers forward the sender's pre-encoded frame as-is through their
+    # outbox. "payload" is still accepted for events queued by workers
+    # running older code; events without "priority" count as signalling.
     async def relay_message(self, event):
-        if event.get("exclude") and self.channel_name == event["exclude"]:
+        if self.channel_name == event.get("exclude"):
             return
-        await self.send(text_data=json.dumps(event["payload"]))
+        await _push(self, pick_frame(event, self.binary), event.get("priority", SIGNALLING), event.get("key"))
 
     async def relay_to_channel(self, event):
         if self.channel_name != event["target_channel"]:
             return
-        await self.send(text_data=json.dumps(event["payload"]))
+        await _push(self, pick_frame(event, self.binary))
+
+    async def evict(self, event):
+        """Sent by RoomManager.sweep() after heartbeat timeout; peer_left is already out."""
+        await self.close(code=4408)
 
 
 # =============================================================================
@@ -202,25 +514,64 @@ class CallConsumer(AsyncWebsocketConsumer):
 # =============================================================================
 
 class _BaseSTTConsumer(AsyncWebsocketConsumer):
-    LABEL_A = "Speaker1"
-    LABEL_B = "Speaker2"
-    LOG_TAG  = "STT"
+    LABEL_A     = "Speaker1"
+    LABEL_B     = "Speaker2"
+    LOG_TAG     = "STT"
+    SOCKET_TYPE = "stt"
 
     async def connect(self):
+        # With ?room=<call room> captions are also relayed to everyone in the call.
+        room = await _caption_room(self, self.LOG_TAG)
+        if room is None:
+            await self.close()
+            return
         await self.accept()
-        print(f"✅ [{self.LOG_TAG}] client accepted")
+        SocketStatusService.register_socket(self.channel_name, self.SOCKET_TYPE)
+        logger.info("stt.accepted", extra={"tag": self.LOG_TAG})
+        # dg_a / dg_b are None until connected and while reconnecting; audio
+        # received meanwhile is only recorded in the replay buffers.
         self.dg_a     = None
-        self.dg_b     = None
-        self.buf_a    = []
-        self.buf_b    = []
-        self.dg_ready = False
+        self.dg_b     = None   # unused in multichannel mode: both speakers share dg_a
         self._tasks   = []
         self._closing = False
+        self.outbox   = _open_outbox(self, self.LOG_TAG)
+        _bind_stt_metrics(self, self.LOG_TAG)
+        self.captions = {
+            label: CaptionPublisher(room, label, label.lower()) for label in (self.LABEL_A, self.LABEL_B)
+        } if room else {}
+        self.room     = room
+        self.archive  = get_archiver() if room else None
+        if self.archive is not None:
+            for label in (self.LABEL_A, self.LABEL_B):
+                self.archive.describe(room, label, label=label, role=label.lower())
+        window = getattr(settings, "STT_REPLAY_SECONDS", 20.0)
+        self.multichannel = getattr(settings, "STT_MULTICHANNEL", False)
+        if self.multichannel:
+            stereo        = metrics.AUDIO_BYTES_PER_SECOND * 2
+            self.mixer    = StereoInterleaver(getattr(settings, "STT_MULTICHANNEL_MAX_LAG", 0.1))
+            self.clock_a  = self.clock_b  = metrics.AudioClock(bytes_per_second=stereo)
+            self.replay_a = self.replay_b = ReplayBuffer(window, bytes_per_second=stereo, channels=2)
+        else:
+            self.mixer    = None
+            self.clock_a  = metrics.AudioClock()
+            self.clock_b  = metrics.AudioClock()
+            self.replay_a = ReplayBuffer(window)
+            self.replay_b = ReplayBuffer(window)
         self._tasks.append(asyncio.ensure_future(self._init_deepgram()))
 
     async def disconnect(self, close_code):
-        print(f"❌ [{self.LOG_TAG}] disconnected  code={close_code}")
+        if not hasattr(self, "_tasks"):
+            return   # refused during the handshake
+        logger.info("stt.disconnected", extra={"tag": self.LOG_TAG, "code": close_code})
+        SocketStatusService.unregister_socket(self.channel_name)
         self._closing = True
+        for publisher in self.captions.values():
+            publisher.close()
+        if self.archive is not None:
+            for label in (self.LABEL_A, self.LABEL_B):
+                self.archive.close_stream(self.room, label)
+        if self.outbox is not None:
+            self.outbox.close()
         for t in self._tasks:
             if not t.done():
                 t.cancel()
@@ -234,31 +585,50 @@ class _BaseSTTConsumer(AsyncWebsocketConsumer):
     async def receive(self, text_data=None, bytes_data=None):
         if not bytes_data or len(bytes_data) < 2:
             return
-        prefix = bytes_data[0]
-        audio  = bytes_data[1:]
-        if prefix == 0x01:
-            if self.dg_ready and self.dg_a:
-                try:    await self.dg_a.send(audio)
-                except Exception: pass
-            elif len(self.buf_a) < 120:
-                self.buf_a.append(audio)
+        received = time.monotonic()
+        prefix   = bytes_data[0]
+        audio    = bytes_data[1:]
+        self._m_in.inc(len(audio))
+        if self.archive is not None and prefix in (0x01, 0x02):
+            self.archive.write(self.room, self.LABEL_A if prefix == 0x01 else self.LABEL_B, audio, time.time())
+        if self.mixer is not None:
+            if prefix not in (0x01, 0x02):
+                return
+            audio = self.mixer.push(prefix - 1, audio)
+            if audio:
+                await self._forward(self.dg_a, self.replay_a, self.clock_a, audio, received)
+        elif prefix == 0x01:
+            await self._forward(self.dg_a, self.replay_a, self.clock_a, audio, received)
         elif prefix == 0x02:
-            if self.dg_ready and self.dg_b:
-                try:    await self.dg_b.send(audio)
-                except Exception: pass
-            elif len(self.buf_b) < 120:
-                self.buf_b.append(audio)
+            await self._forward(self.dg_b, self.replay_b, self.clock_b, audio, received)
+
+    async def _forward(self, ws, replay, clock, audio, received):
+        expired = replay.append(audio, received)
+        if expired:
+            self._m_expired.inc(expired)
+        if ws is None:
+            return
+        try:
+            await ws.send(audio)
+        except Exception:
+            return   # left unsent: replayed once the relay loop reconnects
+        replay.mark_sent()
+        self._m_out.inc(len(audio))
+        clock.on_audio(len(audio), received)
 
     async def _open_deepgram(self, uri=None):
         if uri is None:
-            uri = DEEPGRAM_URI   # now always nova-2 general
-        auth = {"Authorization": f"Token {DEEPGRAM_API_KEY}"}
+            # nova-2 general, resolved per call so DEEPGRAM_URL overrides apply
+            uri = deepgram_uri(channels=2 if self.multichannel else 1)
+        auth    = {"Authorization": f"Token {DEEPGRAM_API_KEY}"}
+        started = time.monotonic()
         for kwarg in (_HEADERS_KWARG, "additional_headers", "extra_headers"):
             try:
                 ws = await asyncio.wait_for(
                     websockets.connect(uri, **{kwarg: auth}, ping_interval=None, close_timeout=2),
                     timeout=15.0,
                 )
+                self._m_connect.observe(time.monotonic() - started)
                 return ws
             except TypeError:
                 continue
@@ -268,6 +638,29 @@ class _BaseSTTConsumer(AsyncWebsocketConsumer):
                 raise exc
         raise RuntimeError("No compatible websockets header kwarg found")
 
+    def _labels(self):
+        """Labels with their own upstream connection (one in multichannel mode)."""
+        return (self.LABEL_A,) if self.multichannel else (self.LABEL_A, self.LABEL_B)
+
+    def _stream(self, label):
+        """(replay, clock) of the upstream connection that carries ``label``."""
+        if label == self.LABEL_A:
+            return self.replay_a, self.clock_a
+        return self.replay_b, self.clock_b
+
+    def _set_upstream(self, label, ws):
+        if label == self.LABEL_A:
+            self.dg_a = ws
+        else:
+            self.dg_b = ws
+
+    def _channel(self, data):
+        """Audio channel of a Results message; multichannel results carry channel_index [ch, n]."""
+        if not self.multichannel:
+            return 0
+        index = data.get("channel_index") or (0,)
+        return 1 if index[0] == 1 else 0
+
     async def _keepalive_loop(self, label):
         while not self._closing:
             await asyncio.sleep(5)
@@ -281,55 +674,83 @@ class _BaseSTTConsumer(AsyncWebsocketConsumer):
 
     async def _init_deepgram(self):
         try:
-            print(f"🔌 [{self.LOG_TAG}] Connecting to Deepgram (2 connections)…")
-            try:
-                self.dg_a = await asyncio.wait_for(self._open_deepgram(), timeout=20.0)
-                print(f"✅ [{self.LOG_TAG}] {self.LABEL_A} connection established")
-            except Exception as e:
-                await self.send(json.dumps({"type": "stt_error", "message": f"{self.LABEL_A} Deepgram failed: {str(e)}"}))
-                return
-            try:
-                self.dg_b = await asyncio.wait_for(self._open_deepgram(), timeout=20.0)
-                print(f"✅ [{self.LOG_TAG}] {self.LABEL_B} connection established")
-            except Exception as e:
-                await self.send(json.dumps({"type": "stt_error", "message": f"{self.LABEL_B} Deepgram failed: {str(e)}"}))
-                return
+            labels = self._labels()
+            logger.debug("deepgram.connecting", extra={"tag": self.LOG_TAG, "connections": len(labels)})
+            results = [None] * len(labels)
+            if deepgram_breaker.allow():
+                # Open the upstream connections concurrently rather than one after the other.
+                results = await asyncio.gather(
+                    *(asyncio.wait_for(self._open_deepgram(), timeout=20.0) for _ in labels),
+                    return_exceptions=True,
+                )
+                for i, (label, result) in enumerate(zip(labels, results)):
+                    if isinstance(result, Exception):
+                        deepgram_breaker.record_failure()
+                        logger.warning("deepgram.connect_failed", extra={
+                            "tag": self.LOG_TAG, "speaker": label, "error": str(result)[:120] or type(result).__name__,
+                        })
+                        results[i] = None
+                    else:
+                        deepgram_breaker.record_success()
+                        logger.debug("deepgram.connected", extra={"tag": self.LOG_TAG, "speaker": label})
+            # Connections that failed, or were not tried because the breaker is
+            # open, retry with backoff like a dropped one (degraded meanwhile).
+            missing = [i for i, ws in enumerate(results) if ws is None]
+            if missing:
+                retried = await asyncio.gather(*(_connect_upstream(self, self.LOG_TAG, labels[i]) for i in missing))
+                for i, ws in zip(missing, retried):
+                    results[i] = ws
+                if None in results:   # closed meanwhile
+                    for ws in results:
+                        if ws is not None:
+                            try:    await ws.close()
+                            except Exception: pass
+                    return
 
-            self.dg_ready = True
-            print(f"✅ [{self.LOG_TAG}] Both Deepgram connections open")
-
-            for chunk in self.buf_a:
-                try:    await self.dg_a.send(chunk)
-                except Exception: break
-            self.buf_a.clear()
-            for chunk in self.buf_b:
-                try:    await self.dg_b.send(chunk)
-                except Exception: break
-            self.buf_b.clear()
-
-            await self.send(json.dumps({"type": "stt_ready"}))
-            self._tasks.append(asyncio.ensure_future(self._keepalive_loop(self.LABEL_A)))
-            self._tasks.append(asyncio.ensure_future(self._keepalive_loop(self.LABEL_B)))
-            await asyncio.gather(
-                self._relay_loop(self.LABEL_A),
-                self._relay_loop(self.LABEL_B),
-            )
+            # Audio that arrived while connecting goes out first, then live audio.
+            for label, ws in zip(labels, results):
+                replay, clock = self._stream(label)
+                self._m_out.inc(await _drain_replay(ws, replay, clock))
+                self._set_upstream(label, ws)
+            logger.info("deepgram.ready", extra={"tag": self.LOG_TAG, "multichannel": self.multichannel})
+
+            await _push(self, json.dumps({"type": "stt_ready"}))
+            for label in labels:
+                self._tasks.append(asyncio.ensure_future(self._keepalive_loop(label)))
+            await asyncio.gather(*(self._relay_loop(label) for label in labels))
         except asyncio.CancelledError:
             pass
         except Exception as exc:
-            print(f"❌ [{self.LOG_TAG}] init error: {exc}")
+            logger.error("stt.init_failed", extra={"tag": self.LOG_TAG, "error": str(exc)})
             try:
-                await self.send(json.dumps({"type": "stt_error", "message": str(exc)}))
+                await _push(self, json.dumps({"type": "stt_error", "message": str(exc)}))
             except Exception:
                 pass
 
+    async def _resume(self, label):
+        """Reconnect ``label``'s upstream and replay the audio it has not transcribed yet."""
+        ws = await _connect_upstream(self, self.LOG_TAG, label)
+        if ws is None:
+            return None
+        replay, clock = self._stream(label)
+        clock.reset()
+        seconds = replay.rewind()
+        sent    = await _drain_replay(ws, replay, clock)
+        self._m_out.inc(sent)
+        self._m_replayed.inc(sent)
+        self._set_upstream(label, ws)
+        logger.info("deepgram.reconnected", extra={"tag": self.LOG_TAG, "speaker": label, "replayed_s": round(seconds, 2)})
+        return ws
+
     async def _relay_loop(self, label):
+        ws     = self.dg_a if label == self.LABEL_A else self.dg_b
+        replay = self._stream(label)[0]
         while not self._closing:
-            ws = self.dg_a if label == self.LABEL_A else self.dg_b
-            if ws is None:
-                await asyncio.sleep(0.5)
-                continue
             try:
+                if ws is None:
+                    ws = await self._resume(label)
+                    if ws is None:
+                        break
                 async for raw in ws:
                     if self._closing:
                         break
@@ -344,14 +765,21 @@ class _BaseSTTConsumer(AsyncWebsocketConsumer):
                         continue
                     text     = alts[0].get("transcript", "").strip()
                     is_final = data.get("is_final", False)
-                    if text:
-                        await self.send(json.dumps({
+                    channel  = self._channel(data)
+                    if text and _accept_result(self, replay, data, is_final, channel):
+                        speaker = self.LABEL_B if channel else label
+                        await _push(self, json.dumps({
                             "type"    : "transcript",
                             "text"    : text,
                             "is_final": is_final,
-                            "speaker" : label,
-                        }))
-                        print(f"📝 [{self.LOG_TAG}] [{label}] {'FINAL' if is_final else 'interim'}: {text[:70]}")
+                            "speaker" : speaker,
+                        }), FINAL if is_final else INTERIM, speaker)
+                        _observe_transcript_latency(self._m_latency, self._stream(speaker)[1], data, is_final)
+                        if self.captions:
+                            await self.captions[speaker].publish(text, is_final)
+                        (transcript_logger if is_final else interim_logger).info("stt.transcript", extra={
+                            "tag": self.LOG_TAG, "speaker": speaker, "final": is_final, "text": text[:70],
+                        })
                 if self._closing:
                     break
                 raise ConnectionResetError("stream closed")
@@ -360,18 +788,12 @@ class _BaseSTTConsumer(AsyncWebsocketConsumer):
             except Exception as exc:
                 if self._closing:
                     break
-                print(f"⚠️  [{self.LOG_TAG}] [{label}] dropped ({str(exc)[:60]}) — reconnecting in 1 s…")
-                await asyncio.sleep(1)
-                try:
-                    new_ws = await asyncio.wait_for(self._open_deepgram(), timeout=20.0)
-                    if label == self.LABEL_A:
-                        self.dg_a = new_ws
-                    else:
-                        self.dg_b = new_ws
-                    print(f"✅ [{self.LOG_TAG}] [{label}] reconnected")
-                except Exception as re_err:
-                    print(f"❌ [{self.LOG_TAG}] [{label}] reconnect failed: {re_err} — retrying in 3 s")
-                    await asyncio.sleep(3)
+                logger.warning("deepgram.dropped", extra={"tag": self.LOG_TAG, "speaker": label, "error": str(exc)[:60]})
+                self._set_upstream(label, None)   # receive() now only records audio for replay
+                if ws is not None:
+                    try:    await ws.close()
+                    except Exception: pass
+                ws = None
 
 
 # =============================================================================
@@ -380,21 +802,24 @@ class _BaseSTTConsumer(AsyncWebsocketConsumer):
 
 class STTConsumer(_BaseSTTConsumer):
     """Doctor + Patient  ->  ws/stt/"""
-    LABEL_A = "Doctor"
-    LABEL_B = "Patient"
-    LOG_TAG  = "STT"
+    LABEL_A     = "Doctor"
+    LABEL_B     = "Patient"
+    LOG_TAG     = "STT"
+    SOCKET_TYPE = "stt"
 
 class STTConsumerSales(_BaseSTTConsumer):
     """Agent + Client  ->  ws/stt/sales/"""
-    LABEL_A = "Agent"
-    LABEL_B = "Client"
-    LOG_TAG  = "STT-Sales"
+    LABEL_A     = "Agent"
+    LABEL_B     = "Client"
+    LOG_TAG     = "STT-Sales"
+    SOCKET_TYPE = "stt_sales"
 
 class STTConsumerAdmin(_BaseSTTConsumer):
     """Admin + Participant  ->  ws/stt/admin/"""
-    LABEL_A = "Admin"
-    LABEL_B = "Participant"
-    LOG_TAG  = "STT-Admin"
+    LABEL_A     = "Admin"
+    LABEL_B     = "Participant"
+    LOG_TAG     = "STT-Admin"
+    SOCKET_TYPE = "stt_admin"
 
 
 # =============================================================================
@@ -406,12 +831,7 @@ class STTConsumerRoom(AsyncWebsocketConsumer):
 
     async def connect(self):
         # FIX: use unquote_plus for proper percent-decoding
-        qs_raw = self.scope.get("query_string", b"").decode()
-        qs     = {}
-        for part in qs_raw.split("&"):
-            if "=" in part:
-                k, v = part.split("=", 1)
-                qs[k] = unquote_plus(v)
+        qs = _query_params(self.scope)
 
         role       = qs.get("role", "participant").strip()
         name       = qs.get("name", "").strip()
@@ -421,23 +841,53 @@ class STTConsumerRoom(AsyncWebsocketConsumer):
         # FIX: ALL roles use nova-2 general model.
         # nova-2-medical silently drops audio that doesn't match its narrow
         # training distribution — causing zero transcription for everyone.
-        self.deepgram_uri = DEEPGRAM_URI_GENERAL
-        print(f"🎙 [{self.log}] Using nova-2 general model — speaker: {self.label}")
+        self.deepgram_uri = deepgram_uri("nova-2")
+        logger.debug("stt.model", extra={"tag": self.log, "model": "nova-2", "speaker": self.label})
 
+        # With ?room=<call room> captions are also relayed to everyone in the call.
+        room = await _caption_room(self, self.log)
+        if room is None:
+            await self.close()
+            return
         await self.accept()
-        print(f"✅ [{self.log}] client accepted")
+        SocketStatusService.register_socket(
+            self.channel_name, "stt_room", user_info={"role": role, "name": name},
+        )
+        logger.info("stt.accepted", extra={"tag": self.log, "speaker": self.label})
 
-        self.dg       = None
-        self.buf      = []
-        self.dg_ready = False
+        self.dg       = None   # None until connected and while reconnecting
         self._tasks   = []
         self._closing = False
+        self.outbox   = _open_outbox(self, "STT-Room")
+        self.clock    = metrics.AudioClock()
+        self.replay   = ReplayBuffer(getattr(settings, "STT_REPLAY_SECONDS", 20.0))
+        _bind_stt_metrics(self, "STT-Room")
+        # ?peer= only says which of the user's call tabs this is; the id
+        # captions carry comes from the RoomManager record it must match.
+        record        = RoomManager.peer_of(room, _user_id(self.scope), qs.get("peer")) if room else None
+        peer          = record.id if record is not None else None
+        self.captions = CaptionPublisher(room, self.label, role, peer) if room else None
+        self.room     = room
+        self.archive  = get_archiver() if room else None
+        # Same label on two tabs must not share files: the call peer id tells them apart.
+        self.speaker  = f"{self.label} {peer}" if peer else self.label
+        if self.archive is not None:
+            self.archive.describe(room, self.speaker, label=self.label, role=role, peer=peer)
 
         self._tasks.append(asyncio.ensure_future(self._init()))
 
     async def disconnect(self, close_code):
-        print(f"❌ [{self.log}] disconnected  code={close_code}")
+        if not hasattr(self, "_tasks"):
+            return   # refused during the handshake
+        logger.info("stt.disconnected", extra={"tag": self.log, "code": close_code})
+        SocketStatusService.unregister_socket(self.channel_name)
         self._closing = True
+        if self.captions:
+            self.captions.close()
+        if self.archive is not None:
+            self.archive.close_stream(self.room, self.speaker)
+        if self.outbox is not None:
+            self.outbox.close()
         for t in self._tasks:
             if not t.done():
                 t.cancel()
@@ -450,15 +900,27 @@ class STTConsumerRoom(AsyncWebsocketConsumer):
     async def receive(self, text_data=None, bytes_data=None):
         if not bytes_data or len(bytes_data) < 2:
             return
-        audio = bytes_data[1:]   # strip the single prefix byte (0x01)
-        if self.dg_ready and self.dg:
-            try:    await self.dg.send(audio)
-            except Exception: pass
-        elif len(self.buf) < 120:
-            self.buf.append(audio)
+        received = time.monotonic()
+        audio    = bytes_data[1:]   # strip the single prefix byte (0x01)
+        self._m_in.inc(len(audio))
+        if self.archive is not None:
+            self.archive.write(self.room, self.speaker, audio, time.time())
+        expired = self.replay.append(audio, received)
+        if expired:
+            self._m_expired.inc(expired)
+        if self.dg is None:
+            return
+        try:
+            await self.dg.send(audio)
+        except Exception:
+            return   # left unsent: replayed once the relay loop reconnects
+        self.replay.mark_sent()
+        self._m_out.inc(len(audio))
+        self.clock.on_audio(len(audio), received)
 
     async def _open_deepgram(self):
-        auth = {"Authorization": f"Token {DEEPGRAM_API_KEY}"}
+        auth    = {"Authorization": f"Token {DEEPGRAM_API_KEY}"}
+        started = time.monotonic()
         for kwarg in (_HEADERS_KWARG, "additional_headers", "extra_headers"):
             try:
                 ws = await asyncio.wait_for(
@@ -470,6 +932,7 @@ class STTConsumerRoom(AsyncWebsocketConsumer):
                     ),
                     timeout=15.0,
                 )
+                self._m_connect.observe(time.monotonic() - started)
                 return ws
             except TypeError:
                 continue
@@ -491,31 +954,31 @@ class STTConsumerRoom(AsyncWebsocketConsumer):
 
     async def _init(self):
         try:
-            print(f"🔌 [{self.log}] Connecting to Deepgram…")
-            try:
-                self.dg = await asyncio.wait_for(self._open_deepgram(), timeout=20.0)
-                print(f"✅ [{self.log}] Connected to Deepgram")
-            except asyncio.TimeoutError:
-                await self.send(json.dumps({
-                    "type"   : "stt_error",
-                    "message": "Deepgram connection timed out. Check API key and network.",
-                }))
-                return
-            except Exception as e:
-                await self.send(json.dumps({
-                    "type"   : "stt_error",
-                    "message": f"Deepgram connection failed: {str(e)}",
-                }))
-                return
-
-            self.dg_ready = True
+            logger.debug("deepgram.connecting", extra={"tag": self.log, "connections": 1})
+            ws = None
+            if deepgram_breaker.allow():
+                try:
+                    ws = await asyncio.wait_for(self._open_deepgram(), timeout=20.0)
+                    deepgram_breaker.record_success()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    deepgram_breaker.record_failure()
+                    logger.warning("deepgram.connect_failed", extra={
+                        "tag": self.log, "speaker": self.label, "error": str(exc)[:120] or type(exc).__name__,
+                    })
+            if ws is None:
+                # First attempt failed, or the breaker is open: retry with
+                # backoff like a dropped connection (degraded meanwhile).
+                ws = await _connect_upstream(self, self.log, self.label)
+                if ws is None:
+                    return
 
-            for chunk in self.buf:
-                try:    await self.dg.send(chunk)
-                except Exception: break
-            self.buf.clear()
+            self._m_out.inc(await _drain_replay(ws, self.replay, self.clock))
+            self.dg = ws
+            logger.info("deepgram.ready", extra={"tag": self.log})
 
-            await self.send(json.dumps({"type": "stt_ready"}))
+            await _push(self, json.dumps({"type": "stt_ready"}))
             self._tasks.append(asyncio.ensure_future(self._keepalive_loop()))
             await self._relay_loop()
 
@@ -523,17 +986,33 @@ class STTConsumerRoom(AsyncWebsocketConsumer):
             pass
         except Exception as exc:
             try:
-                await self.send(json.dumps({"type": "stt_error", "message": str(exc)}))
+                await _push(self, json.dumps({"type": "stt_error", "message": str(exc)}))
             except Exception:
                 pass
 
+    async def _resume(self):
+        """Reconnect upstream and replay the audio that has not been transcribed yet."""
+        ws = await _connect_upstream(self, self.log, self.label)
+        if ws is None:
+            return None
+        self.clock.reset()
+        seconds = self.replay.rewind()
+        sent    = await _drain_replay(ws, self.replay, self.clock)
+        self._m_out.inc(sent)
+        self._m_replayed.inc(sent)
+        self.dg = ws
+        logger.info("deepgram.reconnected", extra={"tag": self.log, "replayed_s": round(seconds, 2)})
+        return ws
+
     async def _relay_loop(self):
+        ws = self.dg
         while not self._closing:
-            if self.dg is None:
-                await asyncio.sleep(0.5)
-                continue
             try:
-                async for raw in self.dg:
+                if ws is None:
+                    ws = await self._resume()
+                    if ws is None:
+                        break
+                async for raw in ws:
                     if self._closing:
                         break
                     try:
@@ -547,14 +1026,19 @@ class STTConsumerRoom(AsyncWebsocketConsumer):
                         continue
                     text     = alts[0].get("transcript", "").strip()
                     is_final = data.get("is_final", False)
-                    if text:
-                        await self.send(json.dumps({
+                    if text and _accept_result(self, self.replay, data, is_final):
+                        await _push(self, json.dumps({
                             "type"    : "transcript",
                             "text"    : text,
                             "is_final": is_final,
                             "speaker" : self.label,
-                        }))
-                        print(f"📝 [{self.log}] {'FINAL' if is_final else 'interim'}: {text[:70]}")
+                        }), FINAL if is_final else INTERIM, self.label)
+                        _observe_transcript_latency(self._m_latency, self.clock, data, is_final)
+                        if self.captions:
+                            await self.captions.publish(text, is_final)
+                        (transcript_logger if is_final else interim_logger).info("stt.transcript", extra={
+                            "tag": self.log, "speaker": self.label, "final": is_final, "text": text[:70],
+                        })
                 if self._closing:
                     break
                 raise ConnectionResetError("stream closed")
@@ -563,14 +1047,48 @@ class STTConsumerRoom(AsyncWebsocketConsumer):
             except Exception as exc:
                 if self._closing:
                     break
-                print(f"⚠️  [{self.log}] dropped ({str(exc)[:60]}) — reconnecting in 1 s…")
-                await asyncio.sleep(1)
-                try:
-                    self.dg = await asyncio.wait_for(self._open_deepgram(), timeout=20.0)
-                    print(f"✅ [{self.log}] reconnected")
-                except asyncio.TimeoutError:
-                    print(f"❌ [{self.log}] reconnect timeout — retrying in 3 s")
-                    await asyncio.sleep(3)
-                except Exception as re_err:
-                    print(f"❌ [{self.log}] reconnect failed: {re_err} — retrying in 3 s")
-                    await asyncio.sleep(3)
\ No newline at end of file
+                logger.warning("deepgram.dropped", extra={"tag": self.log, "error": str(exc)[:60]})
+                self.dg = None   # receive() now only records audio for replay
+                if ws is not None:
+                    try:    await ws.close()
+                    except Exception: pass
+                ws = None
+
+
+# =============================================================================
+# 7. SocketStatusConsumer — live socket status for admin dashboards
+#    URL: ws/status/?token=<JWT access token>   (staff / admin only)
+#    Sends a full snapshot on connect (and on {"type": "resync"}), then
+#    coalesced status_diff events from SocketStatusStream.
+# =============================================================================
+
+class SocketStatusConsumer(AsyncWebsocketConsumer):
+
+    async def connect(self):
+        if not await database_sync_to_async(is_admin)(self.scope.get("user")):
+            logger.warning("status.rejected", extra={"client": self.scope.get("client")})
+            await self.close()
+            return
+        await self.channel_layer.group_add(SocketStatusStream.GROUP, self.channel_name)
+        await self.accept()
+        await self._send_snapshot()
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(SocketStatusStream.GROUP, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data or "")
+        except Exception:
+            return
+        if data.get("type") == "resync":
+            await self._send_snapshot()
+
+    async def _send_snapshot(self):
+        # The summary may read Redis (cluster mode), so keep it off the loop.
+        summary = await sync_to_async(SocketStatusService.get_socket_info_summary)()
+        summary["type"] = "status_snapshot"
+        await self.send(text_data=json.dumps(summary))
+
+    async def status_diff(self, event):
+        await self.send(text_data=event["text"])
@@ -0,0 +1,260 @@
+"""
+consultation/deepgram_emulator.py
+=================================
+A local WebSocket server that speaks the subset of the Deepgram streaming
+protocol the STT consumers use, for offline load, latency and failure
+testing.
+
+Supported:
+  * ``/v1/listen?...&sample_rate=16000&channels=N&interim_results=true``
+    with binary linear16 audio (multichannel audio is interleaved).
+  * ``Results`` messages — interims every ``interim_interval`` seconds of
+    audio, a final (is_final / speech_final) every ``utterance_seconds``.
+    ``start``/``duration`` are in audio seconds since the stream opened and
+    ``channel_index`` is ``[channel, channels]``. Channels whose audio is
+    all zeros (silence fill) produce no results.
+  * ``KeepAlive`` (resets the idle timer) and ``CloseStream`` (flushes a
+    final, sends ``Metadata`` and closes). Streams idle for
+    ``idle_timeout`` seconds are closed with 1011, as Deepgram does.
+
+Knobs: fixed + jittered response latency, disconnect after N seconds of
+audio or with a per-result probability, scripted transcript lines, and a
+seed for deterministic runs.
+
+Run standalone with ``python manage.py deepgram_emulator`` or embed:
+
+    async with DeepgramEmulator(EmulatorConfig(latency=0.05)) as emu:
+        settings.DEEPGRAM_URL = emu.url
+"""
+
+import asyncio
+import json
+import random
+import time
+import uuid
+from array import array
+from urllib.parse import parse_qs, urlsplit
+
+from websockets.asyncio.server import serve
+
+DEFAULT_SCRIPT = (
+    "good morning how are you feeling today",
+    "i have had a mild headache for about three days",
+    "any nausea or sensitivity to light",
+    "a little sensitivity to light in the evenings",
+    "let us check your blood pressure first",
+)
+
+
+class EmulatorConfig:
+    def __init__(
+        self,
+        latency=0.0,
+        jitter=0.0,
+        interim_interval=0.5,
+        utterance_seconds=2.0,
+        idle_timeout=10.0,
+        disconnect_after=None,
+        disconnect_probability=0.0,
+        script=DEFAULT_SCRIPT,
+        seed=None,
+    ):
+        self.latency                = latency
+        self.jitter                 = jitter
+        self.interim_interval       = interim_interval
+        self.utterance_seconds      = utterance_seconds
+        self.idle_timeout           = idle_timeout
+        self.disconnect_after       = disconnect_after
+        self.disconnect_probability = disconnect_probability
+        self.script                 = tuple(script) or DEFAULT_SCRIPT
+        self.seed                   = seed
+
+
+class _Stream:
+    """State for one upstream connection."""
+
+    def __init__(self, emulator, connection, channels, sample_rate, interim):
+        self.emulator     = emulator
+        self.cfg          = emulator.config
+        self.connection   = connection
+        self.channels     = channels
+        self.interim      = interim
+        self.bytes_per_s  = sample_rate * 2 * channels
+        self.request_id   = str(uuid.uuid4())
+        self.audio_secs   = 0.0
+        self.utt_start    = 0.0
+        self.last_interim = 0.0
+        self.voiced       = [False] * channels
+        self.lines        = [emulator.next_line_index() for _ in range(channels)]
+        self.outbox       = asyncio.Queue()
+        self.rng          = emulator.rng
+
+    # ── inbound ──────────────────────────────────────────────────────────────
+    def on_audio(self, chunk):
+        if len(chunk) % 2:
+            chunk = chunk[:-1]
+        samples = array("h")
+        samples.frombytes(chunk)
+        for ch in range(self.channels):
+            if not self.voiced[ch] and any(samples[ch::self.channels]):
+                self.voiced[ch] = True
+        self.audio_secs += len(chunk) / self.bytes_per_s
+
+        if self.interim and self.audio_secs - self.last_interim >= self.cfg.interim_interval:
+            self.last_interim = self.audio_secs
+            self._emit(is_final=False)
+        if self.audio_secs - self.utt_start >= self.cfg.utterance_seconds:
+            self._finalise()
+
+    def _finalise(self):
+        self._emit(is_final=True)
+        self.utt_start    = self.audio_secs
+        self.last_interim = self.audio_secs
+        self.voiced       = [False] * self.channels
+        self.lines        = [self.emulator.next_line_index() for _ in range(self.channels)]
+
+    def _emit(self, is_final):
+        duration = self.audio_secs - self.utt_start
+        if duration <= 0:
+            return
+        progress = min(1.0, duration / self.cfg.utterance_seconds)
+        for ch in range(self.channels):
+            if not self.voiced[ch]:
+                continue
+            words = self.cfg.script[self.lines[ch]].split()
+            shown = words if is_final else words[:max(1, int(len(words) * progress))]
+            self._queue({
+                "type"         : "Results",
+                "channel_index": [ch, self.channels],
+                "duration"     : round(duration, 3),
+                "start"        : round(self.utt_start, 3),
+                "is_final"     : is_final,
+                "speech_final" : is_final,
+                "channel"      : {"alternatives": [{
+                    "transcript": " ".join(shown),
+                    "confidence": 0.98,
+                    "words"     : [],
+                }]},
+                "metadata"     : {"request_id": self.request_id, "model_info": {"name": "emulator"}},
+            })
+
+    def _queue(self, message):
+        delay = self.cfg.latency + (self.rng.uniform(0, self.cfg.jitter) if self.cfg.jitter else 0.0)
+        self.outbox.put_nowait((time.monotonic() + delay, message))
+
+    # ── outbound ─────────────────────────────────────────────────────────────
+    async def sender(self):
+        while True:
+            due, message = await self.outbox.get()
+            if message is None:
+                return
+            wait = due - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if (message.get("type") == "Results" and self.cfg.disconnect_probability
+                    and self.rng.random() < self.cfg.disconnect_probability):
+                self.emulator.stats["injected_disconnects"] += 1
+                await self.connection.close(1011, "injected disconnect")
+                return
+            await self.connection.send(json.dumps(message))
+            if message.get("type") == "Results":
+                self.emulator.stats["results_sent"] += 1
+
+    async def close_stream(self):
+        if self.audio_secs > self.utt_start:
+            self._finalise()
+        self._queue({
+            "type"      : "Metadata",
+            "request_id": self.request_id,
+            "duration"  : round(self.audio_secs, 3),
+            "channels"  : self.channels,
+        })
+        self.outbox.put_nowait((0, None))
+
+
+class DeepgramEmulator:
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config  = config or EmulatorConfig()
+        self.host    = host
+        self.port    = port
+        self.rng     = random.Random(self.config.seed)
+        self.stats   = {"connections": 0, "active": 0, "audio_bytes": 0,
+                        "results_sent": 0, "keepalives": 0, "injected_disconnects": 0}
+        self._line   = 0
+        self._server = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}/v1/listen"
+
+    def next_line_index(self):
+        index      = self._line % len(self.config.script)
+        self._line += 1
+        return index
+
+    async def start(self):
+        self._server = await serve(self._handle, self.host, self.port, max_size=None)
+        self.port    = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def serve_forever(self):
+        await self.start()
+        await self._server.serve_forever()
+
+    async def _handle(self, connection):
+        query = parse_qs(urlsplit(connection.request.path).query)
+        stream = _Stream(
+            self, connection,
+            channels    = int(query.get("channels", ["1"])[0]),
+            sample_rate = int(query.get("sample_rate", ["16000"])[0]),
+            interim     = query.get("interim_results", ["false"])[0] == "true",
+        )
+        self.stats["connections"] += 1
+        self.stats["active"]      += 1
+        sender = asyncio.ensure_future(stream.sender())
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(connection.recv(), timeout=self.config.idle_timeout)
+                except asyncio.TimeoutError:
+                    await connection.close(1011, "NET-0001: no audio received within timeout")
+                    break
+                if isinstance(message, bytes):
+                    self.stats["audio_bytes"] += len(message)
+                    stream.on_audio(message)
+                    if (self.config.disconnect_after is not None
+                            and stream.audio_secs >= self.config.disconnect_after):
+                        self.stats["injected_disconnects"] += 1
+                        await connection.close(1011, "injected disconnect")
+                        break
+                    continue
+                try:
+                    control = json.loads(message)
+                except json.JSONDecodeError:
+                    continue
+                if control.get("type") == "KeepAlive":
+                    self.stats["keepalives"] += 1
+                elif control.get("type") == "CloseStream":
+                    await stream.close_stream()
+                    await sender
+                    await connection.close()
+                    break
+        except Exception:
+            pass  # client went away
+        finally:
+            self.stats["active"] -= 1
+            if not sender.done():
+                sender.cancel()
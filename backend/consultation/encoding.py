@@ -0,0 +1,134 @@
+"""
+consultation/encoding.py
+========================
+JSON encoding for messages fanned out over the channel layer.
+
+Broadcast senders encode a payload once with ``encode()`` and put the
+resulting text on the event, so each receiving consumer only forwards a
+string instead of re-encoding the same dict. The encoder is picked by
+``settings.SIGNALLING_JSON_ENCODER``:
+
+  json    stdlib json, compact separators (default, always available)
+  ujson   ujson.dumps, if installed
+  orjson  orjson.dumps, if installed (returns bytes, decoded to str)
+
+An unknown or missing encoder falls back to stdlib json with a warning.
+
+Call sockets may instead negotiate the ``msgpack`` subprotocol and then
+send and receive binary msgpack frames; what they send must pass
+json_safe(), since the same message may go on to a JSON peer.
+Channel-layer events carry each payload in every format a receiver in the
+room needs — "text" (JSON, always) and "bytes" (msgpack, when a binary
+peer is present) — so receivers still just forward bytes they were
+handed. pick_frame() converts only for events that arrived without the
+receiver's format (sent by older workers).
+"""
+
+import json
+import logging
+import math
+
+from django.conf import settings
+
+try:
+    import msgpack
+except ImportError:   # optional: without it the subprotocol is never accepted
+    msgpack = None
+
+logger = logging.getLogger("consultation.encoding")
+
+MSGPACK_SUBPROTOCOL = "msgpack"
+
+
+def _stdlib_encoder():
+    return json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+
+def _ujson_encoder():
+    import ujson
+    return lambda obj: ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+
+
+def _orjson_encoder():
+    import orjson
+    return lambda obj: orjson.dumps(obj).decode()
+
+
+ENCODERS = {
+    "json"  : _stdlib_encoder,
+    "ujson" : _ujson_encoder,
+    "orjson": _orjson_encoder,
+}
+
+
+def get_encoder(name=None):
+    """Return an ``obj -> str`` callable for ``name`` (default: the settings value)."""
+    name = name or getattr(settings, "SIGNALLING_JSON_ENCODER", "json")
+    factory = ENCODERS.get(name)
+    if factory is None:
+        logger.warning("encoding.unknown", extra={"encoder": name})
+        return _stdlib_encoder()
+    try:
+        return factory()
+    except ImportError:
+        logger.warning("encoding.unavailable", extra={"encoder": name})
+        return _stdlib_encoder()
+
+
+encode = get_encoder()
+
+
+def pack(obj):
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def unpack(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+def json_safe(obj):
+    """
+    True if ``obj`` survives JSON: str-keyed dicts, lists, str, int, finite
+    float, bool and None only. msgpack can also carry bytes, ext types and
+    non-str keys, which the JSON peers in a room could not be sent.
+    """
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            if not all(isinstance(key, str) for key in item):
+                return False
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+        elif isinstance(item, float):
+            if not math.isfinite(item):
+                return False
+        elif item is not None and not isinstance(item, (str, int)):
+            return False
+    return True
+
+
+def msgpack_enabled():
+    return msgpack is not None and getattr(settings, "SIGNALLING_MSGPACK", True)
+
+
+def event_frames(payload, binary=False):
+    """Channel-layer event fields holding ``payload`` pre-encoded for the formats in use."""
+    if binary:
+        return {"text": encode(payload), "bytes": pack(payload)}
+    return {"text": encode(payload)}
+
+
+def pick_frame(event, binary):
+    """The frame a receiver sends on: its own format from ``event``, converted only if missing."""
+    if binary:
+        data = event.get("bytes")
+        if data is not None:
+            return data
+        text = event.get("text")
+        return pack(json.loads(text) if text is not None else event["payload"])
+    text = event.get("text")
+    if text is not None:
+        return text
+    return encode(event["payload"] if "payload" in event else unpack(event["bytes"]))
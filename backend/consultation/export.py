@@ -0,0 +1,165 @@
+"""
+consultation/export.py
+======================
+Streaming export of meetings (and optionally their transcripts) as CSV or
+NDJSON, shared by ``GET /api/meetings/export.<csv|ndjson>`` and
+``manage.py export_meetings``.
+
+Rows come from a flat values_list() over the meeting and its joined
+people/clinic, read with ``.iterator(chunk_size=...)`` — a server-side
+cursor on PostgreSQL — and are encoded by generators a batch at a time.
+Nothing holds more than one batch, so a year of a large clinic exports in
+the same memory as a day (under ASGI the body must be the aiter_sync()
+wrapper for that to hold). Compacted transcripts (TranscriptArchive) are
+decompressed row by row as they stream past.
+"""
+
+import csv
+import io
+from datetime import datetime, time
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Meeting, TranscriptArchive
+
+CHUNK_SIZE    = 500   # rows per database fetch
+BATCH_ROWS    = 200   # rows per yielded piece of output
+CONTENT_TYPES = {
+    "csv"   : "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+# (output column, values_list path)
+COLUMNS = [
+    ("meeting_id",         "meeting_id"),
+    ("room_id",            "room_id"),
+    ("scheduled_time",     "scheduled_time"),
+    ("duration",           "duration"),
+    ("status",             "status"),
+    ("meeting_type",       "meeting_type"),
+    ("appointment_type",   "appointment_type"),
+    ("clinic_id",          "clinic_id"),
+    ("clinic_name",        "clinic__name"),
+    ("doctor_id",          "doctor_id"),
+    ("doctor_first_name",  "doctor__first_name"),
+    ("doctor_last_name",   "doctor__last_name"),
+    ("patient_id",         "patient_id"),
+    ("patient_first_name", "patient__first_name"),
+    ("patient_last_name",  "patient__last_name"),
+    ("sales_id",           "sales_id"),
+    ("sales_first_name",   "sales__first_name"),
+    ("sales_last_name",    "sales__last_name"),
+    ("appointment_reason", "appointment_reason"),
+    ("department",         "department"),
+    ("remark",             "remark"),
+    ("created_at",         "created_at"),
+]
+_TRANSCRIPT_PATHS = ("speech_to_text", "transcript_compacted", "transcript_archive__codec", "transcript_archive__data")
+
+
+def filter_meetings(clinic=None, doctor=None, sales=None, status=None, date_from=None, date_to=None, user=None):
+    """
+    Meetings matching the export filters. ``status`` may list several
+    values; ``date_from``/``date_to`` are inclusive dates on
+    scheduled_time. ``user`` restricts to meetings that user took part in.
+    """
+    meetings = Meeting.objects.all()
+    if clinic:
+        meetings = meetings.filter(clinic_id=clinic)
+    if doctor:
+        meetings = meetings.filter(doctor_id=doctor)
+    if sales:
+        meetings = meetings.filter(sales_id=sales)
+    if status:
+        meetings = meetings.filter(status__in=status)
+    if date_from:
+        meetings = meetings.filter(scheduled_time__gte=timezone.make_aware(datetime.combine(date_from, time.min)))
+    if date_to:
+        meetings = meetings.filter(scheduled_time__lte=timezone.make_aware(datetime.combine(date_to, time.max)))
+    if user is not None:
+        meetings = meetings.filter(Q(patient=user) | Q(doctor=user) | Q(sales=user))
+    return meetings.order_by("scheduled_time", "meeting_id")
+
+
+def header(transcripts=False):
+    return [name for name, _ in COLUMNS] + (["transcript"] if transcripts else [])
+
+
+def iter_rows(meetings, transcripts=False, chunk_size=CHUNK_SIZE):
+    """Flat tuples in header() order, one per meeting, streamed from the database."""
+    paths = [path for _, path in COLUMNS]
+    if not transcripts:
+        yield from meetings.values_list(*paths).iterator(chunk_size=chunk_size)
+        return
+    codecs = TranscriptArchive.CODECS
+    for row in meetings.values_list(*paths, *_TRANSCRIPT_PATHS).iterator(chunk_size=chunk_size):
+        text, compacted, codec, data = row[-4:]
+        if compacted and data is not None:
+            text = codecs[codec][1](bytes(data)).decode("utf-8")
+        yield row[:-4] + (text,)
+
+
+def iter_csv(rows, columns):
+    """CSV text in batches of BATCH_ROWS rows, header first."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow(value.isoformat() if isinstance(value, datetime) else value for value in row)
+        count += 1
+        if count % BATCH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(rows, columns):
+    """One JSON object per line, in batches of BATCH_ROWS rows."""
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    lines   = []
+    for row in rows:
+        lines.append(encoder.encode(dict(zip(columns, row))))
+        if len(lines) == BATCH_ROWS:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+ENCODERS = {
+    "csv"   : iter_csv,
+    "ndjson": iter_ndjson,
+}
+
+
+def stream(meetings, fmt, transcripts=False):
+    """Generator of output text for ``meetings`` in ``fmt`` ("csv" or "ndjson")."""
+    return ENCODERS[fmt](iter_rows(meetings, transcripts), header(transcripts))
+
+
+async def aiter_sync(chunks):
+    """
+    Async iterator over a sync generator, one item per thread hop. Under
+    ASGI (daphne) Django reads a sync StreamingHttpResponse body with
+    list() before sending anything; this keeps the export streaming. The
+    thread-sensitive executor keeps every step, and so the server-side
+    cursor, on the request's database thread. A body the client stops
+    reading is closed there as well.
+    """
+    step = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await step(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=True)()
@@ -0,0 +1,223 @@
+"""
+consultation/jobs.py
+====================
+A small job queue in the database, for work that should not hold up the
+request that triggers it (post-meeting indexing today; summaries and the
+like later). ``manage.py run_jobs`` is the worker.
+
+  * enqueue() inserts a Job row in the caller's transaction, so a job
+    exists exactly when the change that asked for it committed. With
+    JOBS_INLINE (no worker running: development, tests, small installs)
+    jobs due now run in-process once that transaction commits instead;
+    one that fails is queued for a worker to retry.
+  * Workers claim due jobs with SELECT ... FOR UPDATE SKIP LOCKED
+    (PostgreSQL), so any number of them share the queue without handing a
+    job out twice or waiting on each other's rows. A claim is a lease: if
+    a worker dies mid-job, the job is claimed again once
+    JOB_LEASE_SECONDS have passed.
+  * A failed job is retried after an exponential backoff
+    (resilience.backoff_delay) until its type's ``max_attempts``, then
+    left "failed" with the traceback.
+  * A type may cap how many of its jobs run at once across all workers;
+    claims of capped types are serialised per type with an advisory lock.
+
+Types register with ``@job_type(name, ...)``; the handler gets the payload
+dict and runs in a transaction that also marks the job done. Handlers must
+be idempotent — a job whose worker is lost after the work is done runs again.
+"""
+
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import search
+from .models import Job, Meeting
+from .resilience import backoff_delay
+
+logger = logging.getLogger("consultation.jobs")
+
+
+class JobType:
+    __slots__ = ("name", "handler", "concurrency", "max_attempts", "backoff", "dedicated")
+
+    def __init__(self, name, handler, concurrency=None, max_attempts=5, backoff=10.0, dedicated=False):
+        self.name         = name
+        self.handler      = handler
+        self.concurrency  = concurrency    # max running at once across workers; None = no cap
+        self.max_attempts = max_attempts
+        self.backoff      = backoff        # seconds before the first retry, doubled each time
+        self.dedicated    = dedicated      # only claimed by workers that name it in ``kinds``
+
+
+TYPES = {}
+
+
+def job_type(name, concurrency=None, max_attempts=5, backoff=10.0, dedicated=False):
+    """Decorator registering ``handler(payload)`` as the job type ``name``."""
+    def register(handler):
+        TYPES[name] = JobType(name, handler, concurrency, max_attempts, backoff, dedicated)
+        return handler
+    return register
+
+
+def _lease():
+    return timedelta(seconds=getattr(settings, "JOB_LEASE_SECONDS", 300))
+
+
+# ===== 1. Producer side =====
+
+def enqueue(kind, payload=None, delay=0):
+    """
+    Queue a ``kind`` job, due in ``delay`` seconds. Call inside the
+    transaction it belongs to. Returns the Job, or None if it will run
+    inline (JOBS_INLINE).
+    """
+    jtype = TYPES.get(kind)
+    if jtype is None:
+        raise ValueError(f"unknown job type {kind!r}")
+    payload = payload or {}
+    # Dedicated types belong to a particular worker (the scheduler's timers
+    # live in its process), and delayed jobs need something to wait for them.
+    if getattr(settings, "JOBS_INLINE", False) and not jtype.dedicated and delay <= 0:
+        transaction.on_commit(lambda: _run_inline(jtype, payload))
+        return None
+    return Job.objects.create(kind=kind, payload=payload, run_after=timezone.now() + timedelta(seconds=delay))
+
+
+def _run_inline(jtype, payload):
+    try:
+        with transaction.atomic():
+            jtype.handler(payload)
+    except Exception as exc:
+        retry_in = backoff_delay(0, base=jtype.backoff, cap=getattr(settings, "JOB_BACKOFF_CAP", 3600))
+        job      = Job.objects.create(
+            kind=jtype.name, payload=payload, attempts=1, last_error=traceback.format_exc(limit=20),
+            run_after=timezone.now() + timedelta(seconds=retry_in),
+        )
+        logger.warning("job.inline_failed", extra={"job": job.pk, "kind": jtype.name, "error": str(exc)})
+
+
+# ===== 2. Worker side =====
+
+def _due(now):
+    return Q(status="queued", run_after__lte=now) | Q(status="running", locked_until__lte=now)
+
+
+def _serialise(kind):
+    """Hold a per-type lock until commit, so concurrent claims see each other's running count."""
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [f"consultation.jobs:{kind}"])
+
+
+def claim(worker, kinds=None, limit=10):
+    """Lease up to ``limit`` due jobs of ``kinds`` (default: every type not dedicated) to ``worker``."""
+    now     = timezone.now()
+    kinds   = [kind for kind in (kinds or default_kinds()) if kind in TYPES]
+    capped  = [kind for kind in kinds if TYPES[kind].concurrency is not None]
+    free    = [kind for kind in kinds if TYPES[kind].concurrency is None]
+    claimed = []
+    with transaction.atomic():
+        for kind in capped:
+            _serialise(kind)
+            running = Job.objects.filter(kind=kind, status="running", locked_until__gt=now).count()
+            room    = min(limit - len(claimed), TYPES[kind].concurrency - running)
+            if room > 0:
+                claimed += _lock_due(Q(kind=kind), now, room)
+        if free and len(claimed) < limit:
+            claimed += _lock_due(Q(kind__in=free), now, limit - len(claimed))
+        if claimed:
+            Job.objects.filter(pk__in=claimed).update(
+                status="running", attempts=F("attempts") + 1, locked_by=worker, locked_until=now + _lease(),
+            )
+    return list(Job.objects.filter(pk__in=claimed).order_by("run_after", "pk")) if claimed else []
+
+
+def default_kinds():
+    return [name for name, jtype in TYPES.items() if not jtype.dedicated]
+
+
+def _lock_due(kinds, now, limit):
+    return list(
+        Job.objects.filter(kinds, _due(now)).order_by("run_after", "pk")
+        .select_for_update(skip_locked=True).values_list("pk", flat=True)[:limit]
+    )
+
+
+def run(job):
+    """Run one claimed job and record the outcome. Returns True on success."""
+    jtype = TYPES.get(job.kind)
+    mine  = Job.objects.filter(pk=job.pk, locked_by=job.locked_by)
+    try:
+        if jtype is None:
+            raise LookupError(f"no handler registered for job type {job.kind!r}")
+        if job.attempts > jtype.max_attempts:
+            raise RuntimeError("lease lapsed on every attempt; the job may be killing its worker")
+        with transaction.atomic():
+            jtype.handler(job.payload)
+            mine.update(status="done", finished_at=timezone.now(), locked_until=None, last_error="")
+        return True
+    except Exception as exc:
+        error = traceback.format_exc(limit=20)
+        now   = timezone.now()
+        if jtype is not None and job.attempts < jtype.max_attempts:
+            retry_in = backoff_delay(job.attempts - 1, base=jtype.backoff, cap=getattr(settings, "JOB_BACKOFF_CAP", 3600))
+            mine.update(status="queued", run_after=now + timedelta(seconds=retry_in), locked_until=None, last_error=error)
+            logger.warning("job.retry", extra={"job": job.pk, "kind": job.kind, "attempt": job.attempts,
+                                               "retry_in": round(retry_in, 1), "error": str(exc)})
+        else:
+            mine.update(status="failed", finished_at=now, locked_until=None, last_error=error)
+            logger.error("job.failed", extra={"job": job.pk, "kind": job.kind, "attempt": job.attempts, "error": str(exc)})
+        return False
+
+
+def purge(hours=None):
+    """
+    Delete jobs that finished successfully more than ``hours``
+    (JOBS_KEEP_DONE_HOURS) ago, and scheduler syncs queued that long ago:
+    no scheduler claimed them, and one that starts reloads every meeting.
+    """
+    hours  = getattr(settings, "JOBS_KEEP_DONE_HOURS", 24) if hours is None else hours
+    cutoff = timezone.now() - timedelta(hours=hours)
+    return Job.objects.filter(
+        Q(status="done", finished_at__lt=cutoff) | Q(kind="scheduler.sync", status="queued", created_at__lt=cutoff),
+    ).delete()[0]
+
+
+# ===== 3. Job types =====
+
+@job_type("search.index", concurrency=4)
+def index_transcript(payload):
+    """Re-index a meeting's transcript as it is now (MeetingEndView)."""
+    meeting = Meeting.objects.filter(pk=payload["meeting_id"]).select_related("transcript_archive").first()
+    if meeting is None:
+        search.remove(payload["meeting_id"])
+        return
+    search.replace(meeting.pk, meeting.transcript)
+
+
+@job_type("scheduler.sync", dedicated=True, backoff=1.0)
+def sync_schedule(payload):
+    """Move the timers of meetings saved elsewhere (run by the ``run_jobs --scheduler`` worker only)."""
+    from . import scheduler
+    scheduler.sync(payload["meeting_ids"])
+
+
+@job_type("meeting.reminder")
+def send_reminders(payload):
+    """
+    Reminders for meetings about to start (queued by the scheduler). They
+    are logged for now; e-mail, SMS or push delivery would go here.
+    """
+    for meeting_id, room_id, scheduled_time, *people in Meeting.objects.filter(
+        pk__in=payload["meeting_ids"], status="scheduled",
+    ).values_list("meeting_id", "room_id", "scheduled_time", "patient_id", "doctor_id", "sales_id"):
+        logger.info("meeting.reminder", extra={
+            "meeting": meeting_id, "room": room_id, "scheduled_time": scheduled_time.isoformat(),
+            "users": [user_id for user_id in people if user_id],
+        })
@@ -0,0 +1,97 @@
+"""
+consultation/logs.py
+====================
+Structured logging for the consumers without blocking the event loop.
+
+  * BackgroundStreamHandler — a QueueHandler that owns its QueueListener.
+    The calling thread only resolves the message and enqueues; JSON
+    formatting and the stdout write happen on the listener thread. When the
+    queue is full records are dropped (and counted) instead of blocking.
+  * JsonFormatter — one JSON object per line; anything passed via
+    ``extra={...}`` becomes a top-level field.
+  * SampleFilter — keeps 1 in ``rate`` records; attach it to a
+    high-frequency logger (e.g. consultation.stt.interim).
+
+Wired up in settings.LOGGING.
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+_STANDARD_ATTRS = frozenset(
+    logging.LogRecord("", 0, "", 0, "", None, None).__dict__
+) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            "ts"    : datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level" : record.levelname,
+            "logger": record.name,
+            "event" : record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SampleFilter(logging.Filter):
+    """Pass every ``rate``-th record (rate=1 passes everything)."""
+
+    def __init__(self, rate=10, name=""):
+        super().__init__(name)
+        self.rate     = max(1, int(rate))
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        return next(self._counter) % self.rate == 0
+
+
+class BackgroundStreamHandler(QueueHandler):
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped  = 0
+        self._target  = logging.StreamHandler(stream or sys.stdout)
+        self.listener = QueueListener(self.queue, self._target)
+        self.listener.start()
+        atexit.register(self.close)
+
+    def setFormatter(self, fmt):
+        # Formatting runs on the listener thread, not the caller's.
+        self._target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Resolve %-args now (they may be mutated later) but leave the
+        # expensive JSON encoding to the listener thread.
+        record.msg  = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        super().close()
@@ -0,0 +1,860 @@
+"""
+python manage.py bench <name> [options]
+
+Self-contained micro/macro benchmarks for the realtime paths. Each one
+runs in-process against synthetic load and prints a short report, so
+numbers can be compared before and after a change.
+
+  logging   event-loop lag with print() vs the background JSON logger
+  fanout    CPU per room broadcast: encode per receiver vs encode once
+  rooms     soak: churn --rooms call rooms (with ghost peers) and check
+            that the room registry and process memory stay flat
+  archive   audio archive: event-loop cost per chunk vs the writer thread's
+            disk throughput, then a random-access read of the result
+  codec     bytes and CPU per signalling message: JSON text vs msgpack
+  limiter   cost and memory of the per-peer signalling rate limiter
+  slowpeer  one throttled peer in a call room: room-mates' latency and what
+            the slow peer still receives, inline sends vs outbound queues
+  search    transcript search over --meetings synthetic meetings: index
+            query latency vs an icontains scan, and the cost of an append.
+            Runs in a transaction that is rolled back.
+  analytics utilization over --meetings synthetic meetings: the live
+            GROUP BY over Meeting vs reading the daily rollups, plus what
+            keeping the rollups current adds to book/start/end. Rolled back.
+  jobs      background job queue: enqueue rate and claim/run throughput by
+            batch size, then /api/meeting/end/ latency for a --words-word
+            transcript with indexing queued vs inline. Rolled back.
+  scheduler meeting scheduler: timer heap cost for --meetings meetings, then
+            expiring --meetings/10 overdue meetings in batched UPDATEs vs one
+            save() each, and the startup load. Rolled back.
+"""
+
+import asyncio
+import gc
+import itertools
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+from channels.exceptions import ChannelFull
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from consultation import analytics, jobs, metrics, scheduler, search
+from consultation.archive import ArchiveReader, AudioArchiver
+from consultation.consumers import CallConsumer
+from consultation.encoding import ENCODERS, encode, msgpack, pack, unpack
+from consultation.logs import BackgroundStreamHandler, JsonFormatter, SampleFilter
+from consultation.models import Clinic, DoctorAvailability, Meeting
+from consultation.outbound import CHAT, INTERIM
+from consultation.ratelimit import PeerLimiter
+from consultation.services import RoomManager
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def _measure_loop_lag(emit, streams, rate, duration):
+    """
+    Run ``streams`` coroutines that each call emit() ``rate`` times a second
+    while a probe task measures how late 10 ms sleeps wake up.
+    """
+    stop    = asyncio.Event()
+    lags    = []
+    emitted = [0]
+
+    async def probe():
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - started - 0.01)
+
+    async def stream(i):
+        await asyncio.sleep(i / streams / rate)   # spread start times
+        while not stop.is_set():
+            emit(i)
+            emitted[0] += 1
+            await asyncio.sleep(1.0 / rate)
+
+    tasks = [asyncio.ensure_future(stream(i)) for i in range(streams)]
+    tasks.append(asyncio.ensure_future(probe()))
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return emitted[0], lags
+
+
+def bench_logging(cmd, opts):
+    streams, rate, duration = opts["streams"], opts["rate"], opts["duration"]
+    output = opts["output"] or os.path.join(tempfile.gettempdir(), "bench_logging.out")
+    text   = "so the pain started about two weeks ago after the procedure"
+
+    results = {}
+    with open(output, "w", buffering=1, encoding="utf-8") as out:
+        def emit_print(i):
+            print(f"📝 [STT-Room[doctor]] interim: {text}", file=out)
+        results["print"] = asyncio.run(_measure_loop_lag(emit_print, streams, rate, duration))
+
+    handler = BackgroundStreamHandler(stream=open(output, "a", buffering=1, encoding="utf-8"))
+    handler.setFormatter(JsonFormatter())
+    bench_logger = logging.getLogger("consultation.bench.interim")
+    bench_logger.handlers[:] = [handler]
+    bench_logger.propagate = False
+    bench_logger.setLevel(logging.INFO)
+    bench_logger.filters[:] = [SampleFilter(opts["sample_rate"])]
+
+    def emit_logging(i):
+        bench_logger.info("stt.transcript", extra={"tag": "STT-Room[doctor]", "stream": i, "final": False, "text": text})
+    results["logging"] = asyncio.run(_measure_loop_lag(emit_logging, streams, rate, duration))
+    handler.close()
+
+    cmd.stdout.write(
+        f"{streams} streams x {rate}/s for {duration}s  (sample 1/{opts['sample_rate']} for logging)  -> {output}"
+    )
+    cmd.stdout.write(f"{'mode':<10}{'events':>10}{'lag p50 ms':>12}{'lag p99 ms':>12}{'lag max ms':>12}")
+    for mode, (emitted, lags) in results.items():
+        cmd.stdout.write(
+            f"{mode:<10}{emitted:>10}"
+            f"{statistics.median(lags) * 1000 if lags else 0:>12.2f}"
+            f"{_percentile(lags, 99) * 1000:>12.2f}"
+            f"{max(lags, default=0) * 1000:>12.2f}"
+        )
+    if handler.dropped:
+        cmd.stdout.write(f"logging handler dropped {handler.dropped} records (queue full)")
+
+
+FANOUT_ROOM_SIZES = (2, 5, 10, 25, 50)
+
+
+async def _fanout_cpu(room_size, broadcasts, per_receiver, encode):
+    """
+    CPU seconds per broadcast through an InMemoryChannelLayer group of
+    ``room_size`` members, including the receivers' send-side work.
+    """
+    layer    = InMemoryChannelLayer(capacity=broadcasts * 2)
+    channels = [await layer.new_channel() for _ in range(room_size)]
+    for name in channels:
+        await layer.group_add("bench", name)
+    payload = {
+        "type": "chat", "from": "a1b2c3d4", "name": "Dr Smith", "role": "doctor",
+        "text": "please keep the camera on while I check the dressing " * 3,
+        "ts"  : "2026-01-01T10:00:00.000000Z",
+    }
+    sink = []
+
+    started = time.process_time()
+    for _ in range(broadcasts):
+        if per_receiver:
+            event = {"type": "relay_message", "payload": payload, "exclude": channels[0]}
+        else:
+            event = {"type": "relay_message", "text": encode(payload), "exclude": channels[0]}
+        await layer.group_send("bench", event)
+        for name in channels:
+            event = await layer.receive(name)
+            if name == event["exclude"]:
+                continue
+            sink.append(json.dumps(event["payload"]) if per_receiver else event["text"])
+        sink.clear()
+    return (time.process_time() - started) / broadcasts
+
+
+def bench_fanout(cmd, opts):
+    broadcasts = opts["broadcasts"]
+    modes = [("per-receiver", True, None)]
+    for name, factory in ENCODERS.items():
+        try:
+            modes.append((f"once/{name}", False, factory()))
+        except ImportError:
+            pass
+
+    cmd.stdout.write(f"{broadcasts} broadcasts per cell, CPU microseconds per broadcast")
+    cmd.stdout.write(f"{'mode':<16}" + "".join(f"{f'room={n}':>10}" for n in FANOUT_ROOM_SIZES))
+    for label, per_receiver, encoder in modes:
+        cells = [
+            asyncio.run(_fanout_cpu(n, broadcasts, per_receiver, encoder)) * 1e6
+            for n in FANOUT_ROOM_SIZES
+        ]
+        cmd.stdout.write(f"{label:<16}" + "".join(f"{c:>10.1f}" for c in cells))
+
+
+class _CountingLayer:
+    """Stands in for the channel layer during the rooms soak; counts sends instead of queueing."""
+
+    def __init__(self):
+        self.sends = 0
+
+    async def send(self, channel, message):
+        self.sends += 1
+
+    async def group_send(self, group, message):
+        self.sends += 1
+
+
+async def _churn_rooms(total, peers_per_room, ghost_every, sweep_every, layer):
+    timeout = 10 ** 6   # sweep "now" far enough ahead that every remaining peer is stale
+    samples = []
+    for n in range(total):
+        room  = f"soak-{n}"
+        peers = [f"{n:x}-{i}" for i in range(peers_per_room)]
+        for i, peer_id in enumerate(peers):
+            RoomManager.join(room, peer_id, f"peer {i}", "participant", f"chan.{peer_id}")
+        ghost = ghost_every and n % ghost_every == 0
+        for peer_id in (peers[1:] if ghost else peers):   # a ghost never sends its leave
+            RoomManager.leave(room, peer_id)
+        if (n + 1) % sweep_every == 0:
+            await RoomManager.sweep(now=time.monotonic() + timeout, layer=layer)
+            gc.collect()
+            samples.append((n + 1, tracemalloc.get_traced_memory()[0], RoomManager.stats()))
+    return samples
+
+
+def bench_rooms(cmd, opts):
+    total       = opts["rooms"]
+    sweep_every = max(1, total // 20)
+    layer       = _CountingLayer()
+    if RoomManager.stats()["rooms"]:
+        raise CommandError("RoomManager already has rooms; run the soak in a fresh process")
+
+    tracemalloc.start()
+    samples = asyncio.run(_churn_rooms(total, 3, 10, sweep_every, layer))
+    tracemalloc.stop()
+
+    cmd.stdout.write(f"{total} rooms x 3 peers, 1 ghost peer per 10 rooms, sweep every {sweep_every} rooms")
+    cmd.stdout.write(f"{'rooms done':>12}{'traced KB':>12}{'live rooms':>12}{'live peers':>12}{'registry B':>12}{'evicted':>10}")
+    for done, traced, stats in samples:
+        cmd.stdout.write(
+            f"{done:>12}{traced / 1024:>12.1f}{stats['rooms']:>12}{stats['peers']:>12}"
+            f"{stats['bytes']:>12}{stats['evicted']:>10}"
+        )
+    # Compare against the first sample after warm-up (interned strings, dict resizes).
+    baseline = samples[min(1, len(samples) - 1)][1]
+    growth   = samples[-1][1] - baseline
+    final    = samples[-1][2]
+    cmd.stdout.write(f"growth since warm-up: {growth / 1024:.1f} KB; channel-layer sends: {layer.sends}")
+    if final["rooms"] or final["peers"] or growth > 512 * 1024:
+        raise CommandError("room registry did not stay flat")
+    cmd.stdout.write("OK: registry empty and memory flat")
+
+
+def bench_archive(cmd, opts):
+    streams, duration = opts["streams"], opts["duration"]
+    chunk   = os.urandom(3200)   # 100 ms of 16 kHz linear16
+    chunks  = int(duration * 10)
+    started = time.time()
+    with tempfile.TemporaryDirectory() as root:
+        archiver = AudioArchiver(root, segment_seconds=60, maxsize=opts["queue"])
+        calls    = []
+        t0 = time.perf_counter()
+        for i in range(chunks):
+            for s in range(streams):
+                c0 = time.perf_counter()
+                archiver.write(f"bench-{s}", "Doctor", chunk, started + i * 0.1)
+                calls.append(time.perf_counter() - c0)
+            # Faster than real time, but let the writer keep up as it would with live streams.
+            while archiver.queue.qsize() > opts["queue"] // 2:
+                time.sleep(0.001)
+        enqueued = time.perf_counter() - t0
+        archiver.close()   # waits for the writer to drain
+        drained  = time.perf_counter() - t0
+        total_mb = chunks * streams * len(chunk) / 1e6
+        cmd.stdout.write(
+            f"{streams} streams x {duration:.0f}s of audio ({total_mb:.0f} MB) pushed as fast as the writer drains, "
+            f"queue of {opts['queue']} chunks"
+        )
+        cmd.stdout.write(
+            f"write() on the event loop: p50 {_percentile(calls, 50) * 1e6:.1f} us, "
+            f"p99 {_percentile(calls, 99) * 1e6:.1f} us, max {max(calls) * 1e6:.0f} us"
+        )
+        cmd.stdout.write(
+            f"writer thread: {total_mb / drained:.0f} MB/s "
+            f"(= {total_mb / drained / (metrics.AUDIO_BYTES_PER_SECOND / 1e6):.0f} real-time streams), "
+            f"{archiver.dropped} chunks dropped, enqueueing took {enqueued:.2f}s"
+        )
+        with ArchiveReader("bench-0", "Doctor", root) as reader:
+            first, last = reader.span()
+            t0  = time.perf_counter()
+            pcm = reader.read(first + (last - first) / 3, first + (last - first) / 3 + 10)
+            cmd.stdout.write(f"random 10 s read from stream 0: {len(pcm)} bytes in {(time.perf_counter() - t0) * 1e3:.2f} ms")
+
+
+def _codec_samples():
+    sdp = "".join(
+        f"a=candidate:{i} 1 udp 2122260223 192.168.1.{i} 5{i:04d} typ host generation 0 network-id 1\r\n"
+        for i in range(12)
+    )
+    sdp = "v=0\r\no=- 4611731400430051336 2 IN IP4 127.0.0.1\r\ns=-\r\nt=0 0\r\n" + sdp * 2
+    peers = [{"id": f"{i:08x}", "name": f"Participant {i}", "role": "participant"} for i in range(8)]
+    return {
+        "offer"   : {"type": "offer", "to": "ab12cd34", "sdp": {"type": "offer", "sdp": sdp}},
+        "ice"     : {"type": "ice", "to": "ab12cd34", "candidate": {
+            "candidate": "candidate:842163049 1 udp 1677729535 203.0.113.7 49203 typ srflx raddr 0.0.0.0 rport 0",
+            "sdpMid": "0", "sdpMLineIndex": 0,
+        }},
+        "assigned": {"type": "assigned", "id": "ab12cd34", "peers": peers},
+        "chat"    : {"type": "chat", "from": "ab12cd34", "name": "Dr Smith", "role": "doctor",
+                     "text": "Please take the tablets twice a day after meals.", "ts": "2026-01-01T10:00:00Z"},
+    }
+
+
+def bench_codec(cmd, opts):
+    if msgpack is None:
+        raise CommandError("msgpack is not installed")
+    n = opts["messages"] // 10
+    codecs = (("json", encode, json.loads), ("msgpack", pack, unpack))
+    cmd.stdout.write(f"{n} round trips per cell; one hop = decode the client's frame + encode the forward")
+    cmd.stdout.write(f"{'message':<10}{'codec':<9}{'bytes':>7}{'decode us':>11}{'encode us':>11}{'hop us':>9}")
+    for name, payload in _codec_samples().items():
+        for label, enc, dec in codecs:
+            frame = enc(payload)
+            start = time.perf_counter()
+            for _ in range(n):
+                dec(frame)
+            decode = (time.perf_counter() - start) / n * 1e6
+            start = time.perf_counter()
+            for _ in range(n):
+                enc(payload)
+            encode_us = (time.perf_counter() - start) / n * 1e6
+            size = len(frame.encode() if isinstance(frame, str) else frame)
+            cmd.stdout.write(f"{name:<10}{label:<9}{size:>7}{decode:>11.2f}{encode_us:>11.2f}{decode + encode_us:>9.2f}")
+
+
+def bench_limiter(cmd, opts):
+    n     = opts["messages"]
+    types = ["ice"] * 6 + ["chat", "offer", "answer", "pong"]
+    msgs  = [types[i % len(types)] for i in range(n)]
+    texts = [json.dumps({"type": t, "to": "ab12cd34", "candidate": {"candidate": "c" * 80}}) for t in types]
+
+    start = time.perf_counter()
+    for text in texts * (n // len(texts)):
+        json.loads(text)
+    parse_ns = (time.perf_counter() - start) / n * 1e9
+
+    for label, clock in (("open", lambda: 0.0), ("throttling", time.monotonic)):
+        # "open": a frozen clock with huge buckets never throttles;
+        # "throttling": real limits, so most of the burst is rejected.
+        limits  = {t: (1e9, 1e9) for t in ("*", "ice", "chat", "offer", "answer")} if label == "open" else None
+        limiter = PeerLimiter(limits, clock=clock)
+        allowed = 0
+        start   = time.perf_counter()
+        for t in msgs:
+            allowed += limiter.allow(t)
+        ns = (time.perf_counter() - start) / n * 1e9
+        cmd.stdout.write(f"allow() {label:<11}{ns:>8.0f} ns/message ({allowed}/{n} allowed)")
+    cmd.stdout.write(f"json.loads       {parse_ns:>8.0f} ns/message (the parse receive() already does)")
+
+    gc.collect()
+    tracemalloc.start()
+    base     = tracemalloc.get_traced_memory()[0]
+    limiters = [PeerLimiter() for _ in range(10000)]
+    created  = tracemalloc.get_traced_memory()[0]
+    for limiter in limiters:
+        for t in msgs[:1000]:
+            limiter.allow(t)
+    used     = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    cmd.stdout.write(
+        f"memory per limiter {(created - base) / len(limiters):.0f} bytes new, "
+        f"{(used - base) / len(limiters):.0f} bytes after 1000 messages each"
+    )
+
+
+class _AsgiPeer:
+    """Drives one CallConsumer instance directly over ASGI; ``delay`` throttles its socket writes."""
+
+    def __init__(self, app, room, delay=0.0):
+        self.inbox    = asyncio.Queue()
+        self.delay    = delay
+        self.received = {}        # message type -> count
+        self.latency  = []
+        self.id       = None
+        self.joined   = asyncio.Event()
+        scope = {
+            "type": "websocket", "path": f"/ws/call/{room}/", "query_string": b"", "headers": [],
+            "subprotocols": [], "url_route": {"args": (), "kwargs": {"room": room}},
+        }
+        self.task = asyncio.ensure_future(app(scope, self.inbox.get, self._send))
+
+    async def _send(self, message):
+        if message["type"] != "websocket.send":
+            return
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        data  = json.loads(message["text"])
+        mtype = data.get("type")
+        self.received[mtype] = self.received.get(mtype, 0) + 1
+        if mtype == "assigned":
+            self.id = data["id"]
+            self.joined.set()
+        elif "t" in data:
+            self.latency.append(time.perf_counter() - data["t"])
+
+    async def join(self):
+        await self.inbox.put({"type": "websocket.connect"})
+        await self.inbox.put({"type": "websocket.receive", "text": json.dumps({"type": "join", "name": "bench"})})
+        await self.joined.wait()
+
+    async def close(self):
+        await self.inbox.put({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.wait_for(self.task, 5)
+
+
+async def _slow_peer_room(peers, delay, rate, duration):
+    """
+    One sender broadcasts chat, interim captions and per-peer ICE candidates
+    (signalling) at ``rate`` rounds/s into a room where the last peer's
+    writes take ``delay`` seconds each.
+    """
+    app   = CallConsumer.as_asgi()
+    room  = f"slowpeer-{time.monotonic_ns()}"
+    clients = [_AsgiPeer(app, room) for _ in range(peers - 1)] + [_AsgiPeer(app, room, delay)]
+    for client in clients:
+        await client.join()
+    sender, slow = clients[0], clients[-1]
+    layer        = get_channel_layer()
+    sent         = {"ice": 0, "chat": 0, "caption": 0}
+    channel_full = 0
+
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        now = time.perf_counter()
+        await layer.group_send(f"call_{room}", {
+            "type": "relay_message", "priority": INTERIM, "key": "speaker",
+            "text": encode({"type": "caption", "is_final": False, "text": "interim words " * 8, "t": now}),
+        })
+        await layer.group_send(f"call_{room}", {
+            "type": "relay_message", "priority": CHAT, "exclude": None,
+            "text": encode({"type": "chat", "text": "hello " * 10, "t": now}),
+        })
+        sent["caption"] += 1
+        sent["chat"]    += 1
+        for client in clients[1:]:
+            # What CallConsumer.receive() does for "ice", minus the crash
+            # when the target's channel is full.
+            target = RoomManager.get(room, client.id)
+            text   = encode({"type": "ice", "from": sender.id, "candidate": {"candidate": "c" * 80}, "t": now})
+            try:
+                await layer.send(target.channel, {
+                    "type": "relay_to_channel", "text": text, "target_channel": target.channel,
+                })
+            except ChannelFull:
+                channel_full += client is slow
+        sent["ice"] += 1
+        await asyncio.sleep(1.0 / rate)
+    await asyncio.sleep(0.5)
+    for client in clients:
+        await client.close()
+
+    fast = [lat for client in clients[1:-1] for lat in client.latency]
+    return fast, slow.received, sent, channel_full
+
+
+def bench_slowpeer(cmd, opts):
+    peers, rate, duration = max(3, opts["peers"]), opts["rate"], opts["duration"]
+    delay = opts["slow_delay"]
+    cmd.stdout.write(
+        f"{peers} peers, last peer writes take {delay * 1000:.0f} ms, "
+        f"{rate:.0f} rounds/s of interim+chat broadcast and ICE to every peer for {duration}s"
+    )
+    cmd.stdout.write(f"{'mode':<10}{'mates p50 ms':>14}{'mates p99 ms':>14}{'slow: ice':>12}{'chat':>8}{'interim':>9}{'layer full':>12}")
+    original = settings.WS_OUTBOUND_BUDGET if hasattr(settings, "WS_OUTBOUND_BUDGET") else None
+    try:
+        for mode, budget in (("inline", 0), ("queued", original or 256 * 1024)):
+            settings.WS_OUTBOUND_BUDGET = budget
+            fast, slow, sent, full = asyncio.run(_slow_peer_room(peers, delay, rate, duration))
+            cmd.stdout.write(
+                f"{mode:<10}{_percentile(fast, 50) * 1000:>14.2f}{_percentile(fast, 99) * 1000:>14.2f}"
+                f"{slow.get('ice', 0):>7}/{sent['ice']:<4}{slow.get('chat', 0):>4}/{sent['chat']:<4}"
+                f"{slow.get('caption', 0):>4}/{sent['caption']:<4}{full:>12}"
+            )
+    finally:
+        settings.WS_OUTBOUND_BUDGET = original
+    cmd.stdout.write("slow-peer columns are received/sent; queued mode sheds interims before chat and never ICE")
+
+
+_CLINICAL_WORDS = (
+    "pain chest cough fever headache nausea dizziness fatigue tablets dose morning evening "
+    "breathing pressure sugar insulin allergy rash swelling knee back stomach sleep stress "
+    "scan report blood test ultrasound follow-up review history symptoms week months daily"
+).split()
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _synthetic_transcripts(n, words, rng):
+    """Transcripts of ``words`` words: Zipf-ish common vocabulary plus rarer generated terms."""
+    vocabulary = _CLINICAL_WORDS + [f"term{i}" for i in range(20000)]
+    cumulative = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(vocabulary))))
+    for _ in range(n):
+        lines, drawn = [], rng.choices(vocabulary, cum_weights=cumulative, k=words)
+        for i in range(0, words, 12):
+            speaker = "Doctor (Dr Rao)" if (i // 12) % 2 == 0 else "Patient (A. Shah)"
+            lines.append(f"{speaker}: {' '.join(drawn[i:i + 12])}")
+        yield "\n".join(lines)
+
+
+def bench_search(cmd, opts):
+    n, words, repeat = opts["meetings"], opts["words"], 20
+    rng     = random.Random(7)
+    queries = {
+        "common word"  : "pain",
+        "rare word"    : "term15000",
+        "two words"    : "chest pressure",
+        "phrase"       : '"blood test"',
+        "with negation": "fever -cough",
+    }
+    try:
+        with transaction.atomic():
+            t0  = time.perf_counter()
+            now = timezone.now()
+            batch = []
+            for text in _synthetic_transcripts(n, words, rng):
+                batch.append(Meeting(scheduled_time=now, status="ended", speech_to_text=text,
+                                     room_id=f"bench-search-{len(batch)}-{rng.random()}"))
+                if len(batch) == 2000:
+                    Meeting.objects.bulk_create(batch)
+                    batch = []
+            Meeting.objects.bulk_create(batch)
+            created = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            search.rebuild()
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE consultation_meeting")
+                    cursor.execute("ANALYZE consultation_transcriptsearch")
+            indexed = time.perf_counter() - t0
+            cmd.stdout.write(
+                f"{connection.vendor}: {n} meetings x {words} words, created in {created:.1f}s, "
+                f"indexed in {indexed:.1f}s"
+            )
+            cmd.stdout.write(f"{'query':<15}{'hits':>7}{'index p50 ms':>14}{'p95 ms':>9}{'icontains ms':>14}")
+            for label, query in queries.items():
+                timings = []
+                for _ in range(repeat):
+                    t0   = time.perf_counter()
+                    search.search(query, limit=20)
+                    timings.append(time.perf_counter() - t0)
+                total = len(search.search(query, limit=n))
+                # What admin search would cost with speech_to_text in search_fields:
+                # the changelist counts every match, which scans every transcript.
+                needle = query.strip('"').split(" -")[0]
+                t0 = time.perf_counter()
+                Meeting.objects.filter(speech_to_text__icontains=needle).count()
+                scan = time.perf_counter() - t0
+                cmd.stdout.write(
+                    f"{label:<15}{total:>7}{_percentile(timings, 50) * 1e3:>14.2f}"
+                    f"{_percentile(timings, 95) * 1e3:>9.2f}{scan * 1e3:>14.1f}"
+                )
+            target  = Meeting.objects.filter(room_id__startswith="bench-search-").order_by("-pk").first()
+            timings = []
+            for i in range(200):
+                t0 = time.perf_counter()
+                search.append(target.pk, f"Doctor (Dr Rao): appended line {i} about knee swelling")
+                timings.append(time.perf_counter() - t0)
+            cmd.stdout.write(
+                f"append() one line to a {words}-word transcript: p50 {_percentile(timings, 50) * 1e3:.2f} ms, "
+                f"p95 {_percentile(timings, 95) * 1e3:.2f} ms"
+            )
+            raise _Rollback
+    except _Rollback:
+        cmd.stdout.write("rolled back")
+
+
+def bench_analytics(cmd, opts):
+    n, repeat = opts["meetings"], 10
+    rng       = random.Random(11)
+    today     = timezone.localdate()
+    try:
+        with transaction.atomic():
+            t0      = time.perf_counter()
+            clinics = Clinic.objects.bulk_create([Clinic(clinic_id=f"bench-util-{i}", name=f"Bench {i}") for i in range(5)])
+            users   = User.objects.bulk_create([User(username=f"bench-util-{i}") for i in range(60)])
+            doctors, reps = users[:50], users[50:]
+            home    = {doctor.pk: clinics[i % len(clinics)].pk for i, doctor in enumerate(doctors)}
+            DoctorAvailability.objects.bulk_create(
+                [DoctorAvailability(doctor=doctor, clinic_id=home[doctor.pk], day_of_week=day,
+                                    start_time="09:00", end_time="17:00") for doctor in doctors for day in range(5)]
+                + [DoctorAvailability(doctor=rep, day_of_week=day, start_time="10:00", end_time="16:00")
+                   for rep in reps for day in range(6)]
+            )
+            types     = [choice for choice, _ in Meeting.APPOINTMENT_TYPE_CHOICES]
+            specialty = {doctor.pk: types[i % (len(types) - 1)] for i, doctor in enumerate(doctors)}
+            statuses  = ["ended", "ended", "ended", "cancelled", "scheduled"]
+            now       = timezone.now()
+            batch     = []
+            for i in range(n):
+                when   = now - timedelta(days=rng.randrange(365), minutes=rng.randrange(600))
+                status = statuses[rng.randrange(len(statuses))]
+                doctor = rng.choice(doctors) if rng.random() < 0.85 else None
+                batch.append(Meeting(
+                    room_id=f"bench-util-{i}", scheduled_time=when, duration=rng.choice((15, 30, 45, 60)),
+                    status=status, doctor=doctor, clinic_id=home[doctor.pk] if doctor else None,
+                    sales=rng.choice(reps) if doctor is None or rng.random() < 0.1 else None,
+                    appointment_type="sales_meeting" if doctor is None else (
+                        specialty[doctor.pk] if rng.random() < 0.8 else rng.choice(types[:-1])
+                    ),
+                    started_at=when if status == "ended" else None,
+                    ended_at=when + timedelta(minutes=rng.randrange(5, 70)) if status == "ended" else None,
+                ))
+                if len(batch) == 2000:
+                    Meeting.objects.bulk_create(batch)   # bypasses save(): rollups built below
+                    batch = []
+            Meeting.objects.bulk_create(batch)
+            created = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            analytics.rebuild(today - timedelta(days=366), today)
+            analytics.refresh_availability(start=today - timedelta(days=366), end=today)
+            built = time.perf_counter() - t0
+            cmd.stdout.write(
+                f"{connection.vendor}: {n} meetings for {len(users)} users, created in {created:.1f}s, "
+                f"rollups built in {built:.1f}s"
+            )
+
+            cmd.stdout.write(f"{'range':<10}{'live GROUP BY ms':>18}{'rollups ms':>12}{'speedup':>9}")
+            for days in (7, 30, 365):
+                start = today - timedelta(days=days - 1)
+                live, rolled = [], []
+                for _ in range(repeat):
+                    t0 = time.perf_counter()
+                    expected = _live_utilization(start, today)
+                    live.append(time.perf_counter() - t0)
+                    t0 = time.perf_counter()
+                    summary = analytics.summarize(start, today)
+                    rolled.append(time.perf_counter() - t0)
+                if expected != (summary["totals"]["meetings"], summary["totals"]["ended"], summary["totals"]["booked_minutes"]):
+                    raise CommandError(f"rollups disagree with Meeting for the last {days} days: {expected} vs {summary['totals']}")
+                live_ms, rolled_ms = _percentile(live, 50) * 1e3, _percentile(rolled, 50) * 1e3
+                cmd.stdout.write(f"{f'{days} days':<10}{live_ms:>18.1f}{rolled_ms:>12.1f}{live_ms / rolled_ms:>8.1f}x")
+
+            timings = {"book": [], "start": [], "end": [], "bare save": []}
+            for i in range(200):
+                doctor = doctors[i % len(doctors)]
+                t0 = time.perf_counter()
+                meeting = Meeting.objects.create(scheduled_time=now, doctor=doctor, clinic_id=home[doctor.pk])
+                timings["book"].append(time.perf_counter() - t0)
+                for label, status in (("start", "started"), ("end", "ended")):
+                    meeting.status = status
+                    t0 = time.perf_counter()
+                    meeting.save()
+                    timings[label].append(time.perf_counter() - t0)
+                # The same write without the rollup bookkeeping, for reference.
+                t0 = time.perf_counter()
+                super(Meeting, meeting).save()
+                timings["bare save"].append(time.perf_counter() - t0)
+            cmd.stdout.write("save() with rollup upkeep: " + ", ".join(
+                f"{label} p50 {_percentile(values, 50) * 1e3:.2f} ms" for label, values in timings.items()
+            ))
+            raise _Rollback
+    except _Rollback:
+        cmd.stdout.write("rolled back")
+
+
+def _live_utilization(start, end):
+    """What a dashboard without rollups runs: aggregate Meeting directly."""
+    since, until = analytics._day_bounds(start, end)
+    rows = (
+        Meeting.objects.filter(scheduled_time__gte=since, scheduled_time__lt=until)
+        .values("doctor_id", "sales_id", "appointment_type")
+        .annotate(
+            n=Count("pk"), ended=Count("pk", filter=Q(status="ended")),
+            booked=Sum("duration", filter=~Q(status="cancelled")),
+        )
+        .order_by()
+    )
+    totals = [0, 0, 0]
+    for row in rows:
+        roles = bool(row["doctor_id"]) + bool(row["sales_id"])   # counted once per role, as in the rollups
+        totals[0] += row["n"] * roles
+        totals[1] += row["ended"] * roles
+        totals[2] += (row["booked"] or 0) * roles
+    list(DoctorAvailability.objects.values("doctor_id", "clinic_id", "day_of_week", "start_time", "end_time"))
+    return tuple(totals)
+
+
+def bench_jobs(cmd, opts):
+    from rest_framework.test import APIRequestFactory, force_authenticate
+
+    from consultation.views import MeetingEndView
+
+    n     = opts["messages"] // 100
+    rng   = random.Random(5)
+    words = opts["words"]
+    jobs.job_type("bench.noop")(lambda payload: None)
+    try:
+        with transaction.atomic():
+            cmd.stdout.write(f"{connection.vendor}: {n} no-op jobs per run, one worker, claim + run in-process")
+            cmd.stdout.write(f"{'batch':<8}{'enqueue/s':>12}{'run/s':>10}{'queries/job':>13}")
+            for batch in (1, 10, 50):
+                t0 = time.perf_counter()
+                for i in range(n):
+                    jobs.enqueue("bench.noop", {"i": i})
+                enqueued = time.perf_counter() - t0
+                queries  = _QueryCounter()
+                t0, done = time.perf_counter(), 0
+                with connection.execute_wrapper(queries):
+                    while True:
+                        claimed = jobs.claim("bench", ["bench.noop"], limit=batch)
+                        if not claimed:
+                            break
+                        done += sum(jobs.run(job) for job in claimed)
+                ran = time.perf_counter() - t0
+                cmd.stdout.write(f"{batch:<8}{n / enqueued:>12.0f}{done / ran:>10.0f}{queries.count / done:>13.1f}")
+
+            user    = User.objects.create(username="bench-jobs", is_staff=True)
+            factory = APIRequestFactory()
+            view    = MeetingEndView.as_view()
+            vocab   = [f"term{i}" for i in range(5000)]
+            timings = {"queued": [], "inline": []}
+            for i in range(100):
+                for mode in timings:
+                    meeting = Meeting.objects.create(scheduled_time=timezone.now(), doctor=user, room_id=f"bench-jobs-{mode}-{i}")
+                    text    = " ".join(rng.choice(vocab) for _ in range(words))
+                    request = factory.post("/api/meeting/end/", {"meeting_id": meeting.pk, "speech_to_text": text}, format="json")
+                    force_authenticate(request, user=user)
+                    t0 = time.perf_counter()
+                    view(request)
+                    if mode == "inline":   # what the view did before: index inside the request
+                        search.replace(meeting.pk, text)
+                    timings[mode].append(time.perf_counter() - t0)
+            cmd.stdout.write(f"end view, {words}-word transcript: " + ", ".join(
+                f"{mode} p50 {_percentile(values, 50) * 1e3:.2f} ms / p95 {_percentile(values, 95) * 1e3:.2f} ms"
+                for mode, values in timings.items()
+            ))
+            raise _Rollback
+    except _Rollback:
+        cmd.stdout.write("rolled back")
+    finally:
+        jobs.TYPES.pop("bench.noop", None)
+
+
+def bench_scheduler(cmd, opts):
+    n   = opts["meetings"]
+    rng = random.Random(3)
+    now = timezone.now()
+
+    timers = scheduler.Scheduler()
+    rows   = [
+        (i, now + timedelta(minutes=rng.randrange(-600, 7 * 24 * 60)), rng.choice((15, 30, 60)),
+         rng.choice(("scheduled", "started")), None)
+        for i in range(n)
+    ]
+    t0 = time.perf_counter()
+    for row in rows:
+        timers._schedule(row)
+    scheduled = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for row in rows[: n // 10]:   # a tenth rebooked: superseded entries are skipped lazily
+        timers._schedule((row[0], row[1] + timedelta(minutes=15), *row[2:]))
+    moved = time.perf_counter() - t0
+    cmd.stdout.write(
+        f"heap: {n} meetings / {len(timers._heap)} entries, schedule {scheduled / n * 1e6:.2f} us each, "
+        f"reschedule {moved / max(n // 10, 1) * 1e6:.2f} us each"
+    )
+
+    m = max(n // 10, 1)
+    try:
+        with transaction.atomic():
+            user  = User.objects.create(username="bench-scheduler")
+            batch = []
+            for i in range(2 * m):
+                status = "scheduled" if i % 3 else "started"
+                batch.append(Meeting(
+                    room_id=f"bench-scheduler-{i}", scheduled_time=now - timedelta(hours=2, minutes=rng.randrange(600)),
+                    duration=30, status=status, doctor=user, started_at=now - timedelta(hours=2) if status == "started" else None,
+                ))
+            Meeting.objects.bulk_create(batch, batch_size=2000)
+            ids = list(Meeting.objects.filter(room_id__startswith="bench-scheduler-").order_by("pk").values_list("pk", flat=True))
+            analytics.rebuild(timezone.localdate(now) - timedelta(days=2), timezone.localdate(now))
+
+            t0 = time.perf_counter()
+            loaded = scheduler.Scheduler()
+            loaded.load()
+            load = time.perf_counter() - t0
+
+            queries = _QueryCounter()
+            t0 = time.perf_counter()
+            with connection.execute_wrapper(queries):
+                loaded.fire({scheduler.EXPIRE: ids[:m]}, time.time())
+            batched, batched_queries = time.perf_counter() - t0, queries.count
+
+            queries = _QueryCounter()
+            t0 = time.perf_counter()
+            with connection.execute_wrapper(queries):
+                for meeting in Meeting.objects.filter(pk__in=ids[m:]).iterator(chunk_size=500):
+                    meeting.status = "no_show" if meeting.status == "scheduled" else "ended"
+                    meeting.save()
+            single = time.perf_counter() - t0
+            cmd.stdout.write(f"startup load of {len(loaded)} active meetings: {load * 1e3:.0f} ms")
+            cmd.stdout.write(
+                f"expire {m} overdue meetings: batched {batched * 1e3:.0f} ms ({batched_queries} queries), "
+                f"save() each {single * 1e3:.0f} ms ({queries.count} queries), {single / batched:.1f}x"
+            )
+            raise _Rollback
+    except _Rollback:
+        cmd.stdout.write("rolled back")
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+BENCHMARKS = {
+    "logging"  : bench_logging,
+    "fanout"   : bench_fanout,
+    "rooms"    : bench_rooms,
+    "archive"  : bench_archive,
+    "codec"    : bench_codec,
+    "limiter"  : bench_limiter,
+    "slowpeer" : bench_slowpeer,
+    "search"   : bench_search,
+    "analytics": bench_analytics,
+    "jobs"     : bench_jobs,
+    "scheduler": bench_scheduler,
+}
+
+
+class Command(BaseCommand):
+    help = "Run an in-process benchmark: " + ", ".join(BENCHMARKS)
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", choices=sorted(BENCHMARKS))
+        parser.add_argument("--streams",     type=int,   default=500, help="concurrent synthetic streams")
+        parser.add_argument("--rate",        type=float, default=10,  help="events per second per stream")
+        parser.add_argument("--duration",    type=float, default=5,   help="seconds per run")
+        parser.add_argument("--sample-rate", type=int,   default=20,  help="logging: keep 1 in N interim records")
+        parser.add_argument("--output",      default=None,            help="logging: file the log lines go to")
+        parser.add_argument("--broadcasts",  type=int,   default=1000,  help="fanout: broadcasts per room size")
+        parser.add_argument("--rooms",       type=int,   default=100000, help="rooms: rooms to create and tear down")
+        parser.add_argument("--queue",       type=int,   default=2000,  help="archive: writer queue size in chunks")
+        parser.add_argument("--messages",    type=int,   default=1000000, help="limiter: messages through one limiter (codec: /10 per cell)")
+        parser.add_argument("--peers",       type=int,   default=10,    help="slowpeer: peers in the room")
+        parser.add_argument("--slow-delay",  type=float, default=0.02,  help="slowpeer: seconds per write on the slow peer")
+        parser.add_argument("--meetings",    type=int,   default=100000, help="search/analytics/scheduler: synthetic meetings")
+        parser.add_argument("--words",       type=int,   default=150,    help="search/jobs: words per synthetic transcript")
+
+    def handle(self, *args, **opts):
+        bench = BENCHMARKS.get(opts["name"])
+        if bench is None:
+            raise CommandError(f"unknown benchmark {opts['name']!r}")
+        bench(self, opts)
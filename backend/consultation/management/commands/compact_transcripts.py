@@ -0,0 +1,134 @@
+"""
+python manage.py compact_transcripts [--after-hours H] [--batch-size N] [--limit N] [--dry-run] [--report]
+
+Moves the transcripts of ended meetings out of the hot meeting table into
+TranscriptArchive, zlib-compressed, and blanks Meeting.speech_to_text.
+Meant to run periodically (cron); each batch is its own transaction, so
+it can be stopped at any point.
+
+  * Only meetings ended and untouched for --after-hours
+    (TRANSCRIPT_COMPACT_AFTER_HOURS) are moved, so late appends still land
+    in the hot column. A write after compaction makes the transcript hot
+    again (Meeting.transcript); a later run re-compacts it.
+  * Rows are locked with SKIP LOCKED on PostgreSQL, so an append racing
+    the job waits for the batch instead of being lost.
+  * --report measures the hot transcript bytes, the table sizes and a list
+    query loading full Meeting rows (as the admin changelist and the list
+    endpoints do) before and after.
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from consultation.models import Meeting, TranscriptArchive
+
+
+class Command(BaseCommand):
+    help = "Move transcripts of ended meetings into compressed cold storage"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--after-hours", type=float, default=getattr(settings, "TRANSCRIPT_COMPACT_AFTER_HOURS", 24),
+                            help="only meetings not updated for this long")
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--limit", type=int, default=None, help="stop after this many meetings")
+        parser.add_argument("--dry-run", action="store_true", help="count what would be moved")
+        parser.add_argument("--report", action="store_true", help="measure table size and list-query time before and after")
+        parser.add_argument("--list-rows", type=int, default=1000, help="report: rows the list query loads")
+
+    def handle(self, *args, **opts):
+        cutoff     = timezone.now() - timedelta(hours=opts["after_hours"])
+        candidates = Meeting.objects.filter(
+            status="ended", transcript_compacted=False, updated_at__lt=cutoff,
+        ).exclude(speech_to_text="")
+
+        if opts["dry_run"]:
+            found = candidates.aggregate(n=Count("pk"), chars=Sum(Length("speech_to_text")))
+            self.stdout.write(f"{found['n'] or 0} meetings, {(found['chars'] or 0) / 1e6:.1f}M transcript characters to compact")
+            return
+
+        before  = self._measure(opts["list_rows"]) if opts["report"] else None
+        started = time.perf_counter()
+        moved = raw = stored = 0
+        last_pk = 0
+        while opts["limit"] is None or moved < opts["limit"]:
+            size = opts["batch_size"] if opts["limit"] is None else min(opts["batch_size"], opts["limit"] - moved)
+            with transaction.atomic():
+                batch = list(
+                    candidates.filter(pk__gt=last_pk).order_by("pk")
+                    .select_for_update(skip_locked=True)
+                    .only("meeting_id", "speech_to_text")[:size]
+                )
+                if not batch:
+                    break
+                last_pk  = batch[-1].pk
+                archives = [TranscriptArchive.pack(meeting.pk, meeting.speech_to_text) for meeting in batch]
+                TranscriptArchive.objects.bulk_create(
+                    archives, update_conflicts=True, unique_fields=["meeting"],
+                    update_fields=["codec", "data", "raw_size", "compacted_at"],
+                )
+                # .update() leaves updated_at alone: compaction is not an edit.
+                Meeting.objects.filter(pk__in=[meeting.pk for meeting in batch]).update(
+                    speech_to_text="", transcript_compacted=True,
+                )
+            moved  += len(batch)
+            raw    += sum(archive.raw_size for archive in archives)
+            stored += sum(len(archive.data) for archive in archives)
+
+        elapsed = time.perf_counter() - started
+        ratio   = raw / stored if stored else 0.0
+        self.stdout.write(
+            f"compacted {moved} transcripts in {elapsed:.1f}s: "
+            f"{raw / 1e6:.1f} MB -> {stored / 1e6:.1f} MB ({ratio:.1f}x)"
+        )
+        if before is not None:
+            self._report(before, self._measure(opts["list_rows"]))
+
+    def _measure(self, rows):
+        hot     = Meeting.objects.aggregate(chars=Sum(Length("speech_to_text")))["chars"] or 0
+        archive = TranscriptArchive.objects.aggregate(bytes=Sum(Length("data")))["bytes"] or 0
+        timings = []
+        for _ in range(5):
+            t0 = time.perf_counter()
+            list(Meeting.objects.order_by("-scheduled_time")[:rows])
+            timings.append(time.perf_counter() - t0)
+        return {
+            "hot"     : hot,
+            "archive" : archive,
+            "meeting" : _table_bytes("consultation_meeting"),
+            "list_ms" : min(timings) * 1e3,
+        }
+
+    def _report(self, before, after):
+        self.stdout.write(f"{'':<28}{'before':>12}{'after':>12}")
+        self.stdout.write(f"{'hot transcript chars':<28}{before['hot']:>12,}{after['hot']:>12,}")
+        self.stdout.write(f"{'archive bytes':<28}{before['archive']:>12,}{after['archive']:>12,}")
+        if before["meeting"] is not None:
+            self.stdout.write(f"{'meeting table bytes':<28}{before['meeting']:>12,}{after['meeting']:>12,}")
+        speedup = before["list_ms"] / after["list_ms"] if after["list_ms"] else 0.0
+        self.stdout.write(
+            f"{'list query ms':<28}{before['list_ms']:>12.2f}{after['list_ms']:>12.2f}  ({speedup:.1f}x)"
+        )
+        if connection.vendor == "postgresql":
+            self.stdout.write("freed heap/TOAST space is reused after VACUUM; VACUUM FULL returns it to the OS")
+
+
+def _table_bytes(table):
+    """On-disk size of ``table`` including TOAST and indexes, where the backend can tell."""
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT pg_total_relation_size(%s)", [table])
+            return cursor.fetchone()[0]
+        if connection.vendor == "sqlite":
+            try:
+                cursor.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = %s", [table])
+            except DatabaseError:
+                return None   # sqlite built without the dbstat table
+            return cursor.fetchone()[0]
+    return None
@@ -0,0 +1,54 @@
+"""
+python manage.py deepgram_emulator [--port 8765] [--latency-ms 150] ...
+
+Runs the local Deepgram-compatible server from consultation/deepgram_emulator.py.
+Point the consumers at it with DEEPGRAM_URL=ws://127.0.0.1:<port>/v1/listen.
+"""
+
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from consultation.deepgram_emulator import DeepgramEmulator, EmulatorConfig
+
+
+class Command(BaseCommand):
+    help = "Run a local Deepgram streaming emulator for offline STT testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency-ms", type=float, default=0, help="delay before each response")
+        parser.add_argument("--jitter-ms", type=float, default=0, help="extra uniform random delay")
+        parser.add_argument("--interim-interval", type=float, default=0.5, help="audio seconds between interims")
+        parser.add_argument("--utterance-seconds", type=float, default=2.0, help="audio seconds per final")
+        parser.add_argument("--idle-timeout", type=float, default=10.0)
+        parser.add_argument("--disconnect-after", type=float, default=None,
+                            help="close each stream after this many audio seconds")
+        parser.add_argument("--disconnect-probability", type=float, default=0.0,
+                            help="chance of closing the stream instead of sending a result")
+        parser.add_argument("--script", default=None, help="text file, one transcript line per row")
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **opts):
+        script = ()
+        if opts["script"]:
+            with open(opts["script"], encoding="utf-8") as fh:
+                script = tuple(line.strip() for line in fh if line.strip())
+        config = EmulatorConfig(
+            latency                = opts["latency_ms"] / 1000,
+            jitter                 = opts["jitter_ms"] / 1000,
+            interim_interval       = opts["interim_interval"],
+            utterance_seconds      = opts["utterance_seconds"],
+            idle_timeout           = opts["idle_timeout"],
+            disconnect_after       = opts["disconnect_after"],
+            disconnect_probability = opts["disconnect_probability"],
+            script                 = script,
+            seed                   = opts["seed"],
+        )
+        emulator = DeepgramEmulator(config, opts["host"], opts["port"])
+        self.stdout.write(f"Deepgram emulator listening on {emulator.url}")
+        try:
+            asyncio.run(emulator.serve_forever())
+        except KeyboardInterrupt:
+            self.stdout.write(f"stopped  {emulator.stats}")
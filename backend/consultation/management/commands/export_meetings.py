@@ -0,0 +1,52 @@
+"""
+python manage.py export_meetings [--format csv|ndjson] [--output FILE] [--transcripts]
+                                 [--clinic ID] [--doctor ID] [--sales ID]
+                                 [--status ended,cancelled] [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+
+Same export as GET /api/meetings/export.<fmt> (consultation/export.py),
+written to a file or stdout as it streams from the database.
+"""
+
+import sys
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from consultation import export
+
+
+class Command(BaseCommand):
+    help = "Stream meetings (optionally with transcripts) to CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(export.ENCODERS), default="csv")
+        parser.add_argument("--output", default="-", help="file to write, - for stdout")
+        parser.add_argument("--transcripts", action="store_true", help="include the full transcript column")
+        parser.add_argument("--clinic", type=int)
+        parser.add_argument("--doctor", type=int)
+        parser.add_argument("--sales", type=int)
+        parser.add_argument("--status", help="comma-separated statuses")
+        parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="first scheduled date, inclusive")
+        parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="last scheduled date, inclusive")
+
+    def handle(self, *args, **opts):
+        meetings = export.filter_meetings(
+            clinic=opts["clinic"], doctor=opts["doctor"], sales=opts["sales"],
+            status=opts["status"].split(",") if opts["status"] else None,
+            date_from=opts["date_from"], date_to=opts["date_to"],
+        )
+        started = time.perf_counter()
+        written = 0
+        try:
+            out = sys.stdout if opts["output"] == "-" else open(opts["output"], "w", encoding="utf-8", newline="")
+        except OSError as exc:
+            raise CommandError(f"cannot write {opts['output']}: {exc}")
+        try:
+            for chunk in export.stream(meetings, opts["format"], opts["transcripts"]):
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        self.stderr.write(f"exported {written / 1e6:.1f}M characters of {opts['format']} in {time.perf_counter() - started:.1f}s")
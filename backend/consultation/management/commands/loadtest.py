@@ -0,0 +1,355 @@
+"""
+python manage.py loadtest [--url ws://127.0.0.1:8000] [--rooms 500] [--peers 2] ...
+
+Synthetic WebSocket load against a running server. Every room gets
+``--peers`` asyncio clients on ws/call/<room>/ that run the real
+join → offer → answer → ice → chat flow; a fraction of peers can also
+stream synthetic 16 kHz PCM into ws/stt/room/ (point the server at the
+Deepgram emulator for that).
+
+All clients live in this process, so relay latency is measured by
+stamping each offer/answer/ice/chat with time.perf_counter() on send and
+comparing on receipt.
+
+Reports connection rate, message throughput, p50/p95/p99 relay latency
+per message type, client memory per connection, and — with --server-pid —
+server RSS per connection. --metrics-url adds the server's counter deltas
+from /api/metrics/. Use --format/--output to append CSV rows or write
+JSON so runs can be compared across commits.
+"""
+
+import asyncio
+import csv
+import io
+import json
+import math
+import os
+import resource
+import subprocess
+import time
+import urllib.request
+from array import array
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand
+from websockets.asyncio.client import connect
+
+FRAME_SECONDS = 0.1
+SAMPLE_RATE   = 16000
+RELAYED_TYPES = ("offer", "answer", "ice", "chat")
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _rss_kb(pid="self"):
+    try:
+        with open(f"/proc/{pid}/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if pid == "self":
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None
+
+
+def _scrape_counters(url):
+    """Return {series: value} for every *_total sample at a Prometheus text endpoint."""
+    with urllib.request.urlopen(url, timeout=10) as resp:
+        body = resp.read().decode()
+    counters = {}
+    for line in body.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        series, _, value = line.rpartition(" ")
+        if series.split("{", 1)[0].endswith("_total"):
+            counters[series] = float(value)
+    return counters
+
+
+def _synthetic_pcm_frame():
+    """100 ms of a 220 Hz tone, linear16, prefixed with the 0x01 speaker byte."""
+    n       = int(SAMPLE_RATE * FRAME_SECONDS)
+    samples = array("h", (int(8000 * math.sin(2 * math.pi * 220 * i / SAMPLE_RATE)) for i in range(n)))
+    return b"\x01" + samples.tobytes()
+
+
+class _Stats:
+    def __init__(self):
+        self.connect_times  = []
+        self.latencies      = defaultdict(list)
+        self.sent           = Counter()
+        self.received       = Counter()
+        self.errors         = Counter()
+        self.connected      = 0
+        self.stt_ready      = 0
+        self.ice_candidates = 0
+
+
+class _Peer:
+    def __init__(self, stats, opts):
+        self.stats = stats
+        self.opts  = opts
+        self.ws    = None
+        self.id    = None
+
+    async def send(self, payload):
+        payload["t"] = time.perf_counter()
+        await self.ws.send(json.dumps(payload))
+        self.stats.sent[payload["type"]] += 1
+
+    async def send_ice(self, to):
+        for i in range(self.opts["ice"]):
+            # "t" also rides inside the candidate so latency survives ice_batch.
+            await self.send({
+                "type": "ice", "to": to,
+                "candidate": {"candidate": f"candidate:{i} 1 udp 2122260223 10.0.0.{i} 5{i:04d} typ host",
+                              "sdpMid": "0", "sdpMLineIndex": 0, "t": time.perf_counter()},
+            })
+
+    async def run(self, base_url, room, index, stop):
+        started = time.perf_counter()
+        try:
+            self.ws = await connect(f"{base_url}/ws/call/{room}/", open_timeout=30, max_size=None)
+        except Exception as exc:
+            self.stats.errors[f"connect:{type(exc).__name__}"] += 1
+            return
+        self.stats.connect_times.append(time.perf_counter() - started)
+        self.stats.connected += 1
+        reader = asyncio.ensure_future(self._read())
+        try:
+            join = {"type": "join", "name": f"load-{room}-{index}", "role": "participant"}
+            if not self.opts["no_ice_batch"]:
+                join["features"] = ["ice_batch"]
+            await self.ws.send(json.dumps(join))
+            self.stats.sent["join"] += 1
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=self.opts["chat_interval"])
+                except asyncio.TimeoutError:
+                    await self.ws.send(json.dumps({"type": "chat", "text": f"lt:{time.perf_counter()}"}))
+                    self.stats.sent["chat"] += 1
+        except Exception as exc:
+            self.stats.errors[f"send:{type(exc).__name__}"] += 1
+        finally:
+            reader.cancel()
+            await self.ws.close()
+
+    async def _read(self):
+        now = time.perf_counter
+        try:
+            async for raw in self.ws:
+                if isinstance(raw, bytes):
+                    continue
+                msg   = json.loads(raw)
+                mtype = msg.get("type")
+                self.stats.received[mtype] += 1
+                if mtype == "ice_batch":
+                    # One channel-layer send carrying several candidates.
+                    for candidate in msg.get("candidates", []):
+                        self.stats.ice_candidates += 1
+                        if isinstance(candidate, dict) and "t" in candidate:
+                            self.stats.latencies["ice"].append(now() - candidate["t"])
+                elif mtype == "ice":
+                    self.stats.ice_candidates += 1
+                if "t" in msg:
+                    self.stats.latencies[mtype].append(now() - msg["t"])
+                elif mtype == "chat" and str(msg.get("text", "")).startswith("lt:"):
+                    self.stats.latencies["chat"].append(now() - float(msg["text"][3:]))
+
+                if mtype == "assigned":
+                    self.id = msg["id"]
+                    for peer in msg.get("peers", []):
+                        await self.send({"type": "offer", "to": peer["id"], "sdp": {"type": "offer", "sdp": "v=0"}})
+                elif mtype == "offer":
+                    await self.send({"type": "answer", "to": msg["from"], "sdp": {"type": "answer", "sdp": "v=0"}})
+                    await self.send_ice(msg["from"])
+                elif mtype == "answer":
+                    await self.send_ice(msg["from"])
+                elif mtype == "ping":
+                    await self.send({"type": "pong"})
+        except asyncio.CancelledError:
+            pass
+        except Exception as exc:
+            self.stats.errors[f"recv:{type(exc).__name__}"] += 1
+
+
+async def _run_stt(base_url, index, stats, frame, stop):
+    try:
+        ws = await connect(f"{base_url}/ws/stt/room/?role=patient&name=load-{index}", open_timeout=30)
+    except Exception as exc:
+        stats.errors[f"stt_connect:{type(exc).__name__}"] += 1
+        return
+
+    async def read():
+        async for raw in ws:
+            msg = json.loads(raw)
+            stats.received[f"stt_{msg.get('type')}"] += 1
+            if msg.get("type") == "stt_ready":
+                stats.stt_ready += 1
+
+    reader = asyncio.ensure_future(read())
+    try:
+        next_at = time.perf_counter()
+        while not stop.is_set():
+            await ws.send(frame)
+            stats.sent["stt_audio"] += 1
+            next_at += FRAME_SECONDS
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+    except Exception as exc:
+        stats.errors[f"stt_send:{type(exc).__name__}"] += 1
+    finally:
+        reader.cancel()
+        await ws.close()
+
+
+async def _run(opts):
+    stats   = _Stats()
+    stop    = asyncio.Event()
+    base    = opts["url"].rstrip("/")
+    tasks   = []
+    frame   = _synthetic_pcm_frame()
+    n_stt   = int(opts["rooms"] * opts["peers"] * opts["stt_fraction"])
+    total   = opts["rooms"] * opts["peers"]
+    gap     = 1.0 / opts["connect_rate"] if opts["connect_rate"] else 0.0
+
+    server_pid   = opts["server_pid"]
+    rss_client_0 = _rss_kb()
+    rss_server_0 = _rss_kb(server_pid) if server_pid else None
+    counters_0   = _scrape_counters(opts["metrics_url"]) if opts["metrics_url"] else None
+
+    ramp_started = time.perf_counter()
+    for room in range(opts["rooms"]):
+        room_name = f"{opts['room_prefix']}-{room}"
+        for index in range(opts["peers"]):
+            tasks.append(asyncio.ensure_future(_Peer(stats, opts).run(base, room_name, index, stop)))
+            if gap:
+                await asyncio.sleep(gap)
+    for index in range(n_stt):
+        tasks.append(asyncio.ensure_future(_run_stt(base, index, stats, frame, stop)))
+
+    # Wait until every call client has connected (or failed) before timing the steady state.
+    while stats.connected + sum(v for k, v in stats.errors.items() if k.startswith("connect")) < total:
+        await asyncio.sleep(0.05)
+    ramp_seconds = time.perf_counter() - ramp_started
+    rss_client_1 = _rss_kb()
+    rss_server_1 = _rss_kb(server_pid) if server_pid else None
+
+    sent_before = sum(stats.sent.values())
+    recv_before = sum(stats.received.values())
+    steady_started = time.perf_counter()
+    await asyncio.sleep(opts["duration"])
+    steady_seconds = time.perf_counter() - steady_started
+    sent_steady = sum(stats.sent.values()) - sent_before
+    recv_steady = sum(stats.received.values()) - recv_before
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    counters_delta = None
+    if counters_0 is not None:
+        counters_1     = _scrape_counters(opts["metrics_url"])
+        counters_delta = {k: v - counters_0.get(k, 0.0) for k, v in counters_1.items() if v != counters_0.get(k, 0.0)}
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=5).stdout.strip() or None
+    except Exception:
+        commit = None
+
+    connected = max(stats.connected, 1)
+    summary = {
+        "timestamp"           : time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit"              : commit,
+        "rooms"               : opts["rooms"],
+        "peers_per_room"      : opts["peers"],
+        "stt_clients"         : n_stt,
+        "connected"           : stats.connected,
+        "stt_ready"           : stats.stt_ready,
+        "errors"              : sum(stats.errors.values()),
+        "connect_rate_per_s"  : round(stats.connected / ramp_seconds, 1) if ramp_seconds else 0,
+        "connect_p50_ms"      : round(_percentile(stats.connect_times, 50) * 1000, 2),
+        "connect_p99_ms"      : round(_percentile(stats.connect_times, 99) * 1000, 2),
+        "sent_per_s"          : round(sent_steady / steady_seconds, 1),
+        "ice_candidates"      : stats.ice_candidates,
+        # Each ice / ice_batch frame received is one channel-layer send on the server.
+        "ice_frames"          : stats.received["ice"] + stats.received["ice_batch"],
+        "received_per_s"      : round(recv_steady / steady_seconds, 1),
+        "client_kb_per_conn"  : round((rss_client_1 - rss_client_0) / connected, 2),
+        "server_kb_per_conn"  : (round((rss_server_1 - rss_server_0) / connected, 2)
+                                 if rss_server_0 is not None and rss_server_1 is not None else None),
+    }
+    all_latencies = [v for values in stats.latencies.values() for v in values]
+    for label, values in [("relay", all_latencies)] + [(t, stats.latencies[t]) for t in RELAYED_TYPES]:
+        for pct in (50, 95, 99):
+            summary[f"{label}_p{pct}_ms"] = round(_percentile(values, pct) * 1000, 2)
+    return summary, stats, counters_delta
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic call-signalling / STT WebSocket load and report throughput and latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="ws://127.0.0.1:8000", help="server base URL")
+        parser.add_argument("--rooms", type=int, default=100)
+        parser.add_argument("--peers", type=int, default=2, help="peers per room")
+        parser.add_argument("--duration", type=float, default=30, help="steady-state seconds after ramp-up")
+        parser.add_argument("--connect-rate", type=float, default=200, help="new connections per second (0 = burst)")
+        parser.add_argument("--chat-interval", type=float, default=2.0, help="seconds between chat messages per peer")
+        parser.add_argument("--ice", type=int, default=4, help="ICE candidates per offer/answer")
+        parser.add_argument("--no-ice-batch", action="store_true",
+                            help="don't advertise the ice_batch feature (one relay per candidate)")
+        parser.add_argument("--stt-fraction", type=float, default=0.0,
+                            help="fraction of peers that also stream PCM into ws/stt/room/")
+        parser.add_argument("--room-prefix", default="load")
+        parser.add_argument("--server-pid", type=int, default=None, help="server process for RSS per connection")
+        parser.add_argument("--metrics-url", default=None, help="e.g. http://127.0.0.1:8000/api/metrics/")
+        parser.add_argument("--format", choices=("table", "json", "csv"), default="table")
+        parser.add_argument("--output", default=None, help="file for json (overwrite) or csv (append)")
+
+    def handle(self, *args, **opts):
+        summary, stats, counters_delta = asyncio.run(_run(opts))
+
+        if opts["format"] == "json":
+            body = json.dumps({
+                "summary"        : summary,
+                "sent"           : dict(stats.sent),
+                "received"       : dict(stats.received),
+                "errors"         : dict(stats.errors),
+                "server_counters": counters_delta,
+            }, indent=2)
+            if opts["output"]:
+                with open(opts["output"], "w") as fh:
+                    fh.write(body)
+            else:
+                self.stdout.write(body)
+            return
+
+        if opts["format"] == "csv":
+            path   = opts["output"]
+            exists = bool(path) and os.path.exists(path) and os.path.getsize(path) > 0
+            buf    = io.StringIO()
+            writer = csv.DictWriter(buf, fieldnames=list(summary))
+            if not exists:
+                writer.writeheader()
+            writer.writerow(summary)
+            if path:
+                with open(path, "a", newline="") as fh:
+                    fh.write(buf.getvalue())
+            else:
+                self.stdout.write(buf.getvalue(), ending="")
+            return
+
+        for key, value in summary.items():
+            self.stdout.write(f"{key:<22} {value}")
+        if stats.errors:
+            self.stdout.write(f"{'error breakdown':<22} {dict(stats.errors)}")
+        if counters_delta:
+            self.stdout.write("server counter deltas:")
+            for series, delta in sorted(counters_delta.items()):
+                self.stdout.write(f"  {series} {delta:g}")
@@ -0,0 +1,144 @@
+"""
+python manage.py retranscribe [meeting_id ...] [--missing] [--workers N] ...
+
+Re-transcribes meetings from the raw audio archive (AUDIO_ARCHIVE_ENABLED)
+with the local Whisper model and writes the result back to
+Meeting.speech_to_text. For meetings where live STT failed or lost audio.
+
+  * Without meeting ids every ended meeting with archived audio is taken;
+    --missing limits that to meetings whose transcript is empty.
+  * Work is fanned out over a process pool per meeting, speaker and
+    segment (consultation/retranscribe.py); each worker loads the model
+    once and runs torch with --threads threads.
+  * Finished segments are checkpointed under --checkpoint-dir/<model>/;
+    rerunning the same command resumes. The transcript a meeting had
+    before is kept there as previous_transcript.txt.
+  * Reports audio-hours per wall-clock hour, overall and per core, to
+    size nightly batch windows. --dry-run only plans and reports.
+"""
+
+import importlib.util
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from consultation import search
+from consultation.models import Meeting, TranscriptArchive
+from consultation.retranscribe import Checkpoints, init_worker, merge_transcript, plan_units, transcribe_unit
+
+
+class Command(BaseCommand):
+    help = "Re-transcribe archived meeting audio with Whisper and save it as the meeting transcript"
+
+    def add_arguments(self, parser):
+        parser.add_argument("meeting_ids", nargs="*", type=int)
+        parser.add_argument("--missing", action="store_true", help="only meetings with an empty transcript")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+        parser.add_argument("--threads", type=int, default=1, help="torch threads per worker")
+        parser.add_argument("--model", default="base", help="Whisper model name")
+        parser.add_argument("--language", default="en")
+        parser.add_argument("--segment-seconds", type=float, default=300, help="max audio per work unit")
+        parser.add_argument("--checkpoint-dir", default=None,
+                            help="default: AUDIO_ARCHIVE_ROOT/.retranscribe")
+        parser.add_argument("--dry-run", action="store_true", help="plan and report, transcribe nothing")
+
+    def handle(self, *args, **opts):
+        root = Path(settings.AUDIO_ARCHIVE_ROOT)
+        if not root.is_dir():
+            raise CommandError(f"no audio archive at {root} (enable AUDIO_ARCHIVE_ENABLED)")
+
+        meetings = Meeting.objects.only("meeting_id", "room_id", "speech_to_text", "transcript_compacted")
+        if opts["meeting_ids"]:
+            meetings = meetings.filter(meeting_id__in=opts["meeting_ids"])
+        else:
+            meetings = meetings.filter(status="ended")
+        if opts["missing"]:
+            meetings = meetings.filter(speech_to_text="", transcript_compacted=False)
+
+        checkpoints = Checkpoints(Path(opts["checkpoint_dir"] or root / ".retranscribe") / opts["model"])
+        plan = {}   # meeting -> [unit]
+        for meeting in meetings.iterator(chunk_size=500):
+            units = plan_units(meeting.room_id, root, opts["segment_seconds"])
+            if units:
+                plan[meeting] = units
+
+        all_units = [unit for units in plan.values() for unit in units]
+        results   = {unit: checkpoints.load(unit) for unit in all_units}
+        todo      = [unit for unit in all_units if results[unit] is None]
+        audio_all = sum(unit[4] for unit in all_units)
+        audio_new = sum(unit[4] for unit in todo)
+        self.stdout.write(
+            f"{len(plan)} meetings, {len(all_units)} units, {audio_all / 3600:.2f} audio hours; "
+            f"{len(all_units) - len(todo)} units already checkpointed, "
+            f"{len(todo)} to do ({audio_new / 3600:.2f} h)"
+        )
+        if opts["dry_run"]:
+            return
+        if todo and importlib.util.find_spec("whisper") is None:
+            raise CommandError("openai-whisper is not installed (pip install -r requirements.txt)")
+
+        remaining = {meeting: sum(results[unit] is None for unit in units) for meeting, units in plan.items()}
+        for meeting, count in remaining.items():
+            if count == 0:
+                self._save(meeting, plan[meeting], results, checkpoints)
+
+        workers = max(1, min(opts["workers"], len(todo))) if todo else 0
+        started = time.perf_counter()
+        done    = 0.0
+        failed  = 0
+        if todo:
+            owner = {unit: meeting for meeting, units in plan.items() for unit in units}
+            with ProcessPoolExecutor(
+                workers, initializer=init_worker, initargs=(opts["model"], opts["language"], opts["threads"]),
+            ) as pool:
+                # Longest units first so the pool does not end on one straggler.
+                futures = {
+                    pool.submit(transcribe_unit, unit, str(root)): unit
+                    for unit in sorted(todo, key=lambda unit: -unit[4])
+                }
+                for future in as_completed(futures):
+                    unit    = futures[future]
+                    meeting = owner[unit]
+                    try:
+                        result = future.result()
+                    except Exception as exc:
+                        failed += 1
+                        self.stderr.write(f"meeting {meeting.meeting_id} {unit[1]} @ {unit[2]:.0f}: {exc}")
+                        continue
+                    checkpoints.save(unit, result)
+                    results[unit] = result
+                    done += result["audio_seconds"]
+                    remaining[meeting] -= 1
+                    if remaining[meeting] == 0:
+                        self._save(meeting, plan[meeting], results, checkpoints)
+
+        if not todo:
+            return
+        wall = time.perf_counter() - started
+        rate = done / wall if wall else 0.0   # audio-hours per wall-clock hour
+        self.stdout.write(
+            f"transcribed {done / 3600:.2f} audio hours in {wall / 3600:.3f} h wall "
+            f"with {workers} workers x {opts['threads']} threads: "
+            f"{rate:.1f} audio-h per wall-h, {rate / max(workers * opts['threads'], 1):.2f} per core"
+        )
+        if failed:
+            raise CommandError(f"{failed} units failed; rerun to retry them (finished units are checkpointed)")
+
+    def _save(self, meeting, units, results, checkpoints):
+        text = merge_transcript(results[unit] for unit in units)
+        previous = meeting.transcript
+        if previous and previous != text:
+            checkpoints.save_previous(meeting.room_id, previous)
+        with transaction.atomic():
+            Meeting.objects.filter(pk=meeting.pk).update(
+                speech_to_text=text, transcript_compacted=False, updated_at=timezone.now(),
+            )
+            TranscriptArchive.objects.filter(meeting_id=meeting.pk).delete()
+            search.replace(meeting.pk, text)
+        self.stdout.write(f"meeting {meeting.meeting_id}: {len(text.splitlines())} lines saved")
@@ -0,0 +1,52 @@
+"""
+python manage.py rollup_utilization [--from YYYY-MM-DD] [--to YYYY-MM-DD] [--replace-availability]
+
+Rebuilds the utilization rollups (consultation/analytics.py) for a range
+of local days: UtilizationDaily from the meetings, UtilizationAvailability
+from the current DoctorAvailability. Run once after migrating to backfill
+history, or again after meetings were changed behind the ORM's back.
+
+Without --from the range starts at the first scheduled meeting; without
+--to it ends today (availability is also snapshotted
+UTILIZATION_AVAILABILITY_DAYS ahead). Past availability rows that already
+exist are kept unless --replace-availability, since the hours someone had
+then may not be the hours they have now.
+"""
+
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from consultation import analytics
+from consultation.models import Meeting
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily utilization rollups for a date range"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="first local day, inclusive")
+        parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="last local day, inclusive")
+        parser.add_argument("--replace-availability", action="store_true",
+                            help="re-snapshot past availability from the current hours too")
+
+    def handle(self, *args, **opts):
+        today  = timezone.localdate()
+        bounds = Meeting.objects.aggregate(first=Min("scheduled_time"), last=Max("scheduled_time"))
+        start  = opts["date_from"] or (timezone.localdate(bounds["first"]) if bounds["first"] else today)
+        end    = opts["date_to"] or max(today, timezone.localdate(bounds["last"]) if bounds["last"] else today)
+        if start > end:
+            raise CommandError("--from is after --to")
+
+        started = time.perf_counter()
+        rows    = analytics.rebuild(start, end)
+        self.stdout.write(f"meetings: {rows} rollup rows for {start}..{end} in {time.perf_counter() - started:.1f}s")
+
+        started   = time.perf_counter()
+        hours_end = end if opts["date_to"] else max(end, today + timedelta(days=getattr(settings, "UTILIZATION_AVAILABILITY_DAYS", 90)))
+        rows      = analytics.refresh_availability(start=start, end=hours_end, replace_past=opts["replace_availability"])
+        self.stdout.write(f"availability: {rows} rows for {start}..{hours_end} in {time.perf_counter() - started:.1f}s")
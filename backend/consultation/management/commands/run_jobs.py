@@ -0,0 +1,110 @@
+"""
+python manage.py run_jobs [--threads N] [--kinds search.index,...] [--batch N] [--poll SECONDS] [--once]
+                          [--scheduler]
+
+Worker for the background job queue (consultation/jobs.py). Run one or
+more alongside daphne; each thread claims up to --batch due jobs at a
+time, runs them, and polls again after --poll seconds when the queue is
+empty. Several processes (on several hosts) may share one PostgreSQL
+queue; per-type concurrency caps hold across all of them.
+
+With --scheduler the process also runs the meeting scheduler
+(consultation/scheduler.py: auto-end, no-shows, reminders) and takes the
+"scheduler.sync" jobs that keep it current. Run exactly one such worker,
+and set MEETING_SCHEDULER for every process so meeting saves queue those.
+
+SIGINT/SIGTERM stop claiming; jobs already claimed are finished first.
+--once drains what is due now and exits (cron, or to catch up by hand).
+Finished jobs older than JOBS_KEEP_DONE_HOURS are purged hourly.
+"""
+
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from consultation import jobs, scheduler
+
+PURGE_EVERY = 3600   # seconds
+
+
+class Command(BaseCommand):
+    help = "Run background jobs from the database queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=1, help="worker threads in this process")
+        parser.add_argument("--kinds", help="comma-separated job types to run (default: all but scheduler.sync)")
+        parser.add_argument("--batch", type=int, default=10, help="jobs claimed per round trip")
+        parser.add_argument("--poll", type=float, default=1.0, help="seconds to wait when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="exit once no job is due")
+        parser.add_argument("--scheduler", action="store_true", help="also run the meeting scheduler")
+
+    def handle(self, *args, **opts):
+        kinds = opts["kinds"].split(",") if opts["kinds"] else jobs.default_kinds()
+        unknown = set(kinds) - set(jobs.TYPES)
+        if unknown:
+            raise CommandError(f"unknown job types: {', '.join(sorted(unknown))}; known: {', '.join(sorted(jobs.TYPES))}")
+        if "scheduler.sync" in kinds and not opts["scheduler"]:
+            raise CommandError("scheduler.sync jobs can only run with --scheduler")
+        timers = None
+        if opts["scheduler"]:
+            if opts["once"]:
+                raise CommandError("--scheduler runs until stopped; it cannot be combined with --once")
+            try:
+                timers = scheduler.start()
+            except RuntimeError as exc:
+                raise CommandError(str(exc))
+            if not getattr(settings, "MEETING_SCHEDULER", False):
+                self.stderr.write("MEETING_SCHEDULER is off: meetings saved from now on reach the scheduler "
+                                  "only when it restarts. Set it for every process that saves meetings.")
+            kinds = [*kinds, "scheduler.sync"]
+
+        self.stop  = threading.Event()
+        self.stats = {"done": 0, "failed": 0}
+        self.lock  = threading.Lock()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: self.stop.set())
+
+        prefix  = f"{socket.gethostname()}:{os.getpid()}"
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._work, args=(f"{prefix}:{i}", kinds, opts), name=f"jobs-{i}", daemon=True)
+            for i in range(opts["threads"])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"{prefix}: {len(threads)} worker thread(s) for {', '.join(kinds)}")
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=0.5)
+        if timers is not None:
+            timers.stop()
+        self.stdout.write(
+            f"{self.stats['done']} done, {self.stats['failed']} failed in {time.perf_counter() - started:.1f}s"
+        )
+
+    def _work(self, worker, kinds, opts):
+        last_purge = 0.0
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                claimed = jobs.claim(worker, kinds, limit=opts["batch"])
+                for job in claimed:
+                    ok = jobs.run(job)
+                    with self.lock:
+                        self.stats["done" if ok else "failed"] += 1
+                if claimed:
+                    continue
+                if opts["once"]:
+                    return
+                if time.monotonic() - last_purge > PURGE_EVERY:
+                    last_purge = time.monotonic()
+                    jobs.purge()
+                self.stop.wait(opts["poll"])
+        finally:
+            connection.close()
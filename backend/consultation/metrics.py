@@ -0,0 +1,345 @@
+"""
+consultation/metrics.py
+=======================
+In-process metrics for the WebSocket / STT hot paths, rendered in the
+Prometheus text exposition format by MetricsView (GET /api/metrics/).
+
+Design notes:
+  * Every labelled series is a small __slots__ object created once and
+    cached by the caller (usually in connect()), so the hot path is a
+    single attribute increment — no dict lookups, no label formatting.
+  * Histogram buckets are fixed-size lists allocated up front.
+  * No locks on the consumer side: consumers only touch metrics from the
+    event-loop thread. Series that are also updated from worker threads
+    (per-view DB time) are created with threadsafe=True and take an
+    uncontended lock per observation.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+# Default latency buckets (seconds) — 5 ms … 10 s
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# linear16 mono @ 16 kHz — matches DEEPGRAM_URI in consumers.py
+AUDIO_BYTES_PER_SECOND = 16000 * 2
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _LockedCounterChild(_CounterChild):
+    __slots__ = ("_lock",)
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # last slot is +Inf
+        self.sum    = 0.0
+        self.count  = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum   += value
+        self.count += 1
+
+
+class _LockedHistogramChild(_HistogramChild):
+    __slots__ = ("_lock",)
+
+    def __init__(self, bounds):
+        super().__init__(bounds)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            _HistogramChild.observe(self, value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=(), threadsafe=False):
+        self.name          = name
+        self.documentation = documentation
+        self.labelnames    = tuple(labelnames)
+        self.threadsafe    = threadsafe
+        self._children     = {}
+        self._create_lock  = threading.Lock()
+        _registry.append(self)
+
+    def labels(self, *values):
+        """Return (creating once) the series for these label values. Cache it."""
+        key   = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._create_lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self, out):
+        out.append(f"# HELP {self.name} {self.documentation}")
+        out.append(f"# TYPE {self.name} {self.kind}")
+        for key, child in list(self._children.items()):
+            self._render_child(out, key, child)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _LockedCounterChild() if self.threadsafe else _CounterChild()
+
+    def _render_child(self, out, key, child):
+        out.append(f"{self.name}{_format_labels(self.labelnames, key)} {child.value}")
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, threadsafe=False):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, threadsafe)
+
+    def _new_child(self):
+        cls = _LockedHistogramChild if self.threadsafe else _HistogramChild
+        return cls(self.buckets)
+
+    def _render_child(self, out, key, child):
+        counts, total, n = list(child.counts), child.sum, child.count
+        cumulative = 0
+        for bound, c in zip(self.buckets + (float("inf"),), counts):
+            cumulative += c
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            le_label = 'le="' + le + '"'
+            out.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le_label)} {cumulative}")
+        out.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+        out.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {n}")
+
+
+class GaugeCallback(_Metric):
+    """Gauge whose values are read from a callback returning {label_value: number}."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelname, callback):
+        super().__init__(name, documentation, (labelname,))
+        self.callback = callback
+
+    def render(self, out):
+        out.append(f"# HELP {self.name} {self.documentation}")
+        out.append(f"# TYPE {self.name} {self.kind}")
+        for value, number in self.callback().items():
+            out.append(f"{self.name}{_format_labels(self.labelnames, (value,))} {number}")
+
+
+def render():
+    """Render every registered metric in Prometheus text exposition format."""
+    out = []
+    for metric in _registry:
+        metric.render(out)
+    out.append("")
+    return "\n".join(out)
+
+
+class AudioClock:
+    """
+    Maps Deepgram's audio-time offsets back to when that audio arrived from
+    the browser, so transcript latency is measured frame-received → sent.
+
+    Deepgram reports ``start`` + ``duration`` in seconds of audio since the
+    upstream connection opened; call reset() whenever it is re-opened.
+    Pass ``bytes_per_second`` for interleaved multichannel audio so offsets
+    stay in seconds per channel.
+    """
+    __slots__ = ("offset", "marks", "bytes_per_second")
+
+    def __init__(self, maxlen=1024, bytes_per_second=AUDIO_BYTES_PER_SECOND):
+        self.offset           = 0.0
+        self.marks            = deque(maxlen=maxlen)   # (audio_end_offset, monotonic_received)
+        self.bytes_per_second = bytes_per_second
+
+    def reset(self):
+        self.offset = 0.0
+        self.marks.clear()
+
+    def on_audio(self, nbytes, received_at=None):
+        self.offset += nbytes / self.bytes_per_second
+        self.marks.append((self.offset, received_at if received_at is not None else time.monotonic()))
+
+    def received_at(self, audio_end):
+        """Monotonic time the frame containing ``audio_end`` arrived, or None."""
+        marks = self.marks
+        while marks and marks[0][0] < audio_end:
+            marks.popleft()
+        return marks[0][1] if marks else None
+
+
+# =============================================================================
+# Metric definitions
+# =============================================================================
+
+SIGNALLING_MESSAGES = Counter(
+    "ws_signalling_messages_total",
+    "Messages received by CallConsumer, by message type.",
+    ["type"],
+)
+STT_AUDIO_BYTES = Counter(
+    "stt_audio_bytes_total",
+    "Audio bytes received from clients (in) and forwarded to Deepgram (out).",
+    ["consumer", "direction"],
+)
+STT_DROPPED_CHUNKS = Counter(
+    "stt_dropped_chunks_total",
+    "Audio chunks that never reached Deepgram (e.g. expired from the replay buffer during an outage).",
+    ["consumer", "reason"],
+)
+STT_REPLAYED_BYTES = Counter(
+    "stt_replayed_bytes_total",
+    "Audio bytes re-sent to Deepgram from the replay buffer after a reconnect.",
+    ["consumer"],
+)
+STT_DEDUPED_RESULTS = Counter(
+    "stt_deduped_results_total",
+    "Deepgram results dropped after a replay because their audio was already transcribed.",
+    ["consumer"],
+)
+DEEPGRAM_CONNECT_SECONDS = Histogram(
+    "deepgram_connect_seconds",
+    "Time to open a Deepgram streaming connection.",
+    ["consumer"],
+)
+DEEPGRAM_RECONNECTS = Counter(
+    "deepgram_reconnects_total",
+    "Deepgram reconnect attempts from the relay loop, by outcome.",
+    ["consumer", "result"],
+)
+TRANSCRIPT_LATENCY_SECONDS = Histogram(
+    "stt_transcript_latency_seconds",
+    "Audio frame received from the client to transcript sent back.",
+    ["consumer", "is_final"],
+)
+SIGNALLING_THROTTLED = Counter(
+    "ws_signalling_throttled_total",
+    "Call-socket messages dropped by the per-peer rate limiter, by message type.",
+    ["type"],
+)
+ICE_RELAYED = Counter(
+    "ws_ice_relayed_total",
+    "ICE candidates relayed between peers (unit=candidates) and the channel-layer sends that carried them (unit=sends).",
+    ["unit"],
+)
+SIGNALLING_FLOOD_CLOSES = Counter(
+    "ws_signalling_flood_closes_total",
+    "Call sockets closed for flooding past their rate limit (CALL_FLOOD_CLOSE_AFTER).",
+)
+WS_OUTBOUND_DROPPED = Counter(
+    "ws_outbound_dropped_total",
+    "Frames dropped from a client's outbound queue (over budget or superseded), by priority.",
+    ["consumer", "priority"],
+)
+WS_SLOW_CLIENT_CLOSES = Counter(
+    "ws_slow_client_closes_total",
+    "Connections closed because signalling alone exceeded the outbound hard limit.",
+    ["consumer"],
+)
+AUDIO_ARCHIVE_BYTES = Counter(
+    "stt_archive_bytes_total",
+    "PCM bytes written to the on-disk audio archive.",
+    threadsafe=True,
+)
+AUDIO_ARCHIVE_DROPPED = Counter(
+    "stt_archive_dropped_chunks_total",
+    "Audio chunks not archived because the archive writer queue was full.",
+)
+VIEW_DB_SECONDS = Histogram(
+    "http_view_db_seconds",
+    "Database time spent per HTTP request, by view.",
+    ["view"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+    threadsafe=True,
+)
+VIEW_DB_QUERIES = Counter(
+    "http_view_db_queries_total",
+    "Database queries issued by HTTP requests, by view.",
+    ["view"],
+    threadsafe=True,
+)
+
+
+def _socket_counts():
+    from .services import SocketStatusService
+    return SocketStatusService.get_socket_counts()
+
+
+ACTIVE_SOCKETS = GaugeCallback(
+    "ws_active_sockets",
+    "Open WebSocket connections on this worker, by socket type.",
+    "type",
+    _socket_counts,
+)
+
+
+def _breaker_state():
+    from .resilience import CircuitBreaker, deepgram_breaker
+    current = deepgram_breaker.state
+    return {state: int(state == current) for state in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)}
+
+
+DEEPGRAM_CIRCUIT = GaugeCallback(
+    "deepgram_circuit_state",
+    "Process-wide Deepgram circuit breaker; 1 for the current state.",
+    "state",
+    _breaker_state,
+)
+
+
+def _room_stats():
+    from .services import RoomManager
+    return RoomManager.stats()
+
+
+CALL_ROOMS = GaugeCallback(
+    "ws_call_room_registry",
+    "Call rooms on this worker: rooms, peers, approximate bytes, peers evicted (cumulative).",
+    "measure",
+    _room_stats,
+)
@@ -0,0 +1,133 @@
+"""
+consultation/middleware.py
+"""
+
+import time
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+
+from . import metrics
+
+
+class _QueryTimer:
+    __slots__ = ("elapsed", "queries")
+
+    def __init__(self):
+        self.elapsed = 0.0
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.elapsed += time.perf_counter() - started
+            self.queries += 1
+
+
+def _observe(view, timer):
+    metrics.VIEW_DB_SECONDS.labels(view).observe(timer.elapsed)
+    metrics.VIEW_DB_QUERIES.labels(view).inc(timer.queries)
+
+
+class ViewDBMetricsMiddleware:
+    """
+    Records database time and query count per resolved view (see metrics.py).
+    A streaming body runs its queries after this middleware has returned;
+    views that wrap it in TimedStream (and set ``response.db_stream``) have
+    those counted too, observed once the body is finished.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = _QueryTimer()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        match = getattr(request, "resolver_match", None)
+        if match is not None:
+            view   = match.view_name or match._func_path
+            stream = getattr(response, "db_stream", None)
+            if stream is not None:
+                stream.adopt(view, timer)
+            else:
+                _observe(view, timer)
+        return response
+
+
+class TimedStream:
+    """
+    Sync iterator over a streaming response body that times the queries
+    of each step, so ViewDBMetricsMiddleware counts them with the rest of
+    the request. Each step runs under its own execute_wrapper, which also
+    works when the steps hop to a database thread (export.aiter_sync).
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.timer  = _QueryTimer()
+        self.view   = None
+        self.done   = False
+
+    def adopt(self, view, timer):
+        """Take over the middleware's figures for ``view``; observed by close()."""
+        self.view           = view
+        self.timer.elapsed += timer.elapsed
+        self.timer.queries += timer.queries
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            with connection.execute_wrapper(self.timer):
+                return next(self.chunks)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        if self.done:
+            return
+        self.done = True
+        close = getattr(self.chunks, "close", None)
+        if close is not None:
+            close()
+        if self.view is not None:
+            _observe(self.view, self.timer)
+
+
+@database_sync_to_async
+def _user_for_token(raw):
+    # Imported here: simplejwt's authentication module reads the user model at import time.
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+    auth = JWTAuthentication()
+    try:
+        return auth.get_user(auth.get_validated_token(raw))
+    except (AuthenticationFailed, InvalidToken):
+        return None
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    WebSocket counterpart of DRF's JWTAuthentication: browsers cannot set an
+    Authorization header on a WebSocket, so the access token comes as
+    ``?token=<access>``. A valid token sets scope["user"]; otherwise the
+    user from the session (AuthMiddlewareStack, outside this) is kept.
+    """
+
+    async def __call__(self, scope, receive, send):
+        token = parse_qs(scope.get("query_string", b"").decode()).get("token")
+        if token:
+            user = await _user_for_token(token[0])
+            if user is not None:
+                scope = dict(scope, user=user)
+            elif "user" not in scope:
+                scope = dict(scope, user=AnonymousUser())
+        return await super().__call__(scope, receive, send)
@@ -0,0 +1,55 @@
+# Generated by Django 6.0 on 2026-10-19 09:20
+#
+# Full-text index over Meeting.speech_to_text (consultation/search.py):
+# a tsvector side table with a GIN index on PostgreSQL, an FTS5 table on
+# SQLite. Existing transcripts are indexed as part of the migration.
+
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE TABLE consultation_transcriptsearch ("
+            " meeting_id integer PRIMARY KEY"
+            "  REFERENCES consultation_meeting (meeting_id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,"
+            " document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "INSERT INTO consultation_transcriptsearch (meeting_id, document) "
+            "SELECT meeting_id, to_tsvector('english', speech_to_text) "
+            "FROM consultation_meeting WHERE speech_to_text <> ''"
+        )
+        schema_editor.execute(
+            "CREATE INDEX consultation_transcriptsearch_document_gin "
+            "ON consultation_transcriptsearch USING gin (document)"
+        )
+    elif vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE consultation_transcript_fts USING fts5("
+            " transcript, tokenize = 'porter unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            "INSERT INTO consultation_transcript_fts (rowid, transcript) "
+            "SELECT meeting_id, speech_to_text FROM consultation_meeting WHERE speech_to_text <> ''"
+        )
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("DROP TABLE IF EXISTS consultation_transcriptsearch")
+    elif vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS consultation_transcript_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultation', '0006_alter_doctoravailability_clinic_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-19 09:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultation', '0007_transcript_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranscriptArchive',
+            fields=[
+                ('meeting', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='transcript_archive', serialize=False, to='consultation.meeting')),
+                ('codec', models.CharField(default='zlib', max_length=10)),
+                ('data', models.BinaryField()),
+                ('raw_size', models.PositiveIntegerField()),
+                ('compacted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='meeting',
+            name='transcript_compacted',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 6.0 on 2026-10-19 11:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultation', '0008_transcript_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meeting',
+            name='ended_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='meeting',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='UtilizationAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('role', models.CharField(max_length=10)),
+                ('minutes', models.IntegerField()),
+                ('clinic', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='consultation.clinic')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'day'], name='consultatio_user_id_109062_idx'), models.Index(fields=['clinic', 'day'], name='consultatio_clinic__696310_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UtilizationDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('role', models.CharField(max_length=10)),
+                ('appointment_type', models.CharField(max_length=30)),
+                ('meetings', models.IntegerField(default=0)),
+                ('scheduled', models.IntegerField(default=0)),
+                ('started', models.IntegerField(default=0)),
+                ('ended', models.IntegerField(default=0)),
+                ('cancelled', models.IntegerField(default=0)),
+                ('booked_minutes', models.IntegerField(default=0)),
+                ('held_seconds', models.BigIntegerField(default=0)),
+                ('held_count', models.IntegerField(default=0)),
+                ('clinic', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='consultation.clinic')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'day'], name='consultatio_user_id_0b0c2a_idx'), models.Index(fields=['clinic', 'day'], name='consultatio_clinic__339c5f_idx')],
+                'unique_together': {('day', 'clinic', 'user', 'role', 'appointment_type')},
+            },
+        ),
+    ]
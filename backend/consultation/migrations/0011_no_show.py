@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-19 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultation', '0010_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='utilizationdaily',
+            name='no_show',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='meeting',
+            name='status',
+            field=models.CharField(choices=[('scheduled', 'Scheduled'), ('started', 'Started'), ('ended', 'Ended'), ('cancelled', 'Cancelled'), ('no_show', 'No-show')], default='scheduled', max_length=20),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-19 18:05
+#
+# The unique_together key of UtilizationDaily included the nullable clinic,
+# and NULLs are distinct in a unique index, so rows without a clinic could
+# be duplicated (two first bookings on the same day racing in _increment).
+# Duplicates are merged into one row before the partial constraints go on.
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+COUNTERS = (
+    "meetings", "scheduled", "started", "ended", "cancelled", "no_show",
+    "booked_minutes", "held_seconds", "held_count",
+)
+KEY      = ("day", "user", "role", "appointment_type")
+
+
+def merge_duplicates(apps, schema_editor):
+    UtilizationDaily = apps.get_model("consultation", "UtilizationDaily")
+    rows       = UtilizationDaily.objects.filter(clinic__isnull=True)
+    duplicated = rows.values(*KEY).annotate(n=Count("id")).filter(n__gt=1)
+    for key in duplicated:
+        del key["n"]
+        group  = rows.filter(**key).order_by("id")
+        totals = group.aggregate(**{counter: Sum(counter) for counter in COUNTERS})
+        keep   = group.first()
+        group.exclude(pk=keep.pk).delete()
+        UtilizationDaily.objects.filter(pk=keep.pk).update(**totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultation', '0011_no_show'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='utilizationdaily',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='utilizationdaily',
+            constraint=models.UniqueConstraint(condition=models.Q(('clinic__isnull', False)), fields=('day', 'clinic', 'user', 'role', 'appointment_type'), name='utilization_daily_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='utilizationdaily',
+            constraint=models.UniqueConstraint(condition=models.Q(('clinic__isnull', True)), fields=('day', 'user', 'role', 'appointment_type'), name='utilization_daily_key_no_clinic'),
+        ),
+    ]
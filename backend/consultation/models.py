@@ -1,7 +1,10 @@
 
 
 import uuid
-from django.db import models
+import zlib
+
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 
@@ -69,6 +72,17 @@ class DoctorAvailability(models.Model):
         unique_together = ("doctor", "clinic", "day_of_week")
         ordering        = ["day_of_week", "start_time"]
 
+    def save(self, *args, **kwargs):
+        from . import analytics
+        super().save(*args, **kwargs)
+        analytics.refresh_availability(self.doctor_id)   # upcoming days only; the past keeps its snapshot
+
+    def delete(self, *args, **kwargs):
+        from . import analytics
+        result = super().delete(*args, **kwargs)
+        analytics.refresh_availability(self.doctor_id)
+        return result
+
     def __str__(self):
         clinic_str = self.clinic.name if self.clinic else "Sales (no clinic)"
         return (
@@ -97,6 +111,7 @@ class Meeting(models.Model):
         ("started",   "Started"),
         ("ended",     "Ended"),
         ("cancelled", "Cancelled"),
+        ("no_show",   "No-show"),     # set by the scheduler when nobody started it
     ]
 
     meeting_id         = models.AutoField(primary_key=True)
@@ -116,14 +131,83 @@ class Meeting(models.Model):
     department         = models.CharField(max_length=100, blank=True)
     remark             = models.TextField(blank=True)
     speech_to_text     = models.TextField(blank=True)
+    # True once compact_transcripts has moved speech_to_text into TranscriptArchive.
+    transcript_compacted = models.BooleanField(default=False)
     status             = models.CharField(max_length=20, choices=STATUS_CHOICES, default="scheduled")
+    started_at         = models.DateTimeField(null=True, blank=True)
+    ended_at           = models.DateTimeField(null=True, blank=True)
     created_at         = models.DateTimeField(auto_now_add=True)
     updated_at         = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
+        from . import analytics, scheduler
         if not self.room_id:
             self.room_id = f"meet-{uuid.uuid4()}"
-        super().save(*args, **kwargs)
+        if self.status == "started" and self.started_at is None:
+            self.started_at = timezone.now()
+        if self.status == "ended" and self.ended_at is None:
+            self.ended_at = timezone.now()
+        if kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            kwargs["update_fields"] = analytics.untouched_fields(self)
+        with transaction.atomic():
+            if not analytics.writes_state(self, kwargs.get("update_fields")):
+                # Transcript, remark etc.: no row lock, no rollup writes.
+                super().save(*args, **kwargs)
+            else:
+                # Keep the utilization rollups in step with book/start/end/cancel.
+                previous = analytics.previous_state(self)
+                super().save(*args, **kwargs)
+                current = analytics.state(self)
+                if kwargs.get("update_fields") is None:   # the whole state was written
+                    self._analytics_state = current
+                if previous != current:
+                    analytics.apply(previous, current)
+                    scheduler.notify(self.pk, previous, current)
+        if getattr(self, "_drop_archive", False):
+            TranscriptArchive.objects.filter(meeting_id=self.pk).delete()
+            self._drop_archive = False
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        from . import analytics
+        instance = super().from_db(db, field_names, values)
+        analytics.remember(instance)
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        from . import analytics
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        if fields is None:
+            analytics.remember(self)
+        else:   # unrefreshed fields may hold unsaved changes; let save() compare with the row
+            self._analytics_state = None
+
+    def delete(self, *args, **kwargs):
+        from . import analytics
+        with transaction.atomic():
+            analytics.apply(analytics.previous_state(self), None)
+            return super().delete(*args, **kwargs)
+
+    @property
+    def transcript(self):
+        """
+        The full transcript wherever it lives: speech_to_text while hot, the
+        compressed TranscriptArchive row once compacted. Use this rather
+        than speech_to_text when reading or rewriting a transcript.
+        """
+        if not self.transcript_compacted:
+            return self.speech_to_text
+        try:
+            return self.transcript_archive.text()
+        except TranscriptArchive.DoesNotExist:
+            return ""
+
+    @transcript.setter
+    def transcript(self, text):
+        # Writing makes the transcript hot again; save() drops the stale archive row.
+        self._drop_archive        = getattr(self, "_drop_archive", False) or self.transcript_compacted
+        self.speech_to_text       = text
+        self.transcript_compacted = False
 
     def __str__(self):
         patient_name = self.patient.get_full_name() if self.patient else "Unknown"
@@ -131,4 +215,130 @@ class Meeting(models.Model):
             sales_name = self.sales.get_full_name() if self.sales else "Unknown"
             return f"SalesMeeting {self.meeting_id}: {patient_name} ↔ {sales_name} @ {self.scheduled_time}"
         doctor_name = self.doctor.get_full_name() if self.doctor else "Unknown"
-        return f"Meeting {self.meeting_id}: {patient_name} with Dr.{doctor_name} @ {self.scheduled_time}"
\ No newline at end of file
+        return f"Meeting {self.meeting_id}: {patient_name} with Dr.{doctor_name} @ {self.scheduled_time}"
+
+
+class TranscriptArchive(models.Model):
+    """
+    Cold storage for the transcript of an ended meeting, compressed, so
+    the meeting row itself stays small. Written by compact_transcripts;
+    read through Meeting.transcript.
+    """
+    CODECS = {
+        "zlib": (lambda raw: zlib.compress(raw, 9), zlib.decompress),
+    }
+
+    meeting      = models.OneToOneField(Meeting, on_delete=models.CASCADE, primary_key=True, related_name="transcript_archive")
+    codec        = models.CharField(max_length=10, default="zlib")
+    data         = models.BinaryField()
+    raw_size     = models.PositiveIntegerField()   # UTF-8 bytes before compression
+    compacted_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def pack(cls, meeting_id, text, codec="zlib"):
+        raw = text.encode("utf-8")
+        return cls(meeting_id=meeting_id, codec=codec, data=cls.CODECS[codec][0](raw), raw_size=len(raw))
+
+    def text(self):
+        return self.CODECS[self.codec][1](bytes(self.data)).decode("utf-8")
+
+    def __str__(self):
+        return f"Transcript of meeting {self.meeting_id} ({self.raw_size} bytes, {self.codec})"
+
+
+class UtilizationDaily(models.Model):
+    """
+    Meeting counters per (local day, clinic, user, role, appointment type),
+    kept current by Meeting.save() through consultation/analytics.py.
+    ``role`` says whether ``user`` was the meeting's doctor or sales rep;
+    a consultation booked through a sales rep counts for both.
+    """
+    day              = models.DateField()
+    clinic           = models.ForeignKey(Clinic, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    user             = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    role             = models.CharField(max_length=10)
+    appointment_type = models.CharField(max_length=30)
+
+    meetings         = models.IntegerField(default=0)   # every booking, cancelled included
+    scheduled        = models.IntegerField(default=0)   # still scheduled; no-shows once the day is over
+    started          = models.IntegerField(default=0)   # started, not ended
+    ended            = models.IntegerField(default=0)
+    cancelled        = models.IntegerField(default=0)
+    no_show          = models.IntegerField(default=0)
+    booked_minutes   = models.IntegerField(default=0)   # planned duration, cancellations excluded
+    held_seconds     = models.BigIntegerField(default=0)   # actual started_at -> ended_at
+    held_count       = models.IntegerField(default=0)   # ended meetings with both timestamps
+
+    class Meta:
+        # Two partial constraints rather than one: NULLs never collide in a
+        # unique index, so rows without a clinic need their own.
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "clinic", "user", "role", "appointment_type"],
+                condition=models.Q(clinic__isnull=False), name="utilization_daily_key",
+            ),
+            models.UniqueConstraint(
+                fields=["day", "user", "role", "appointment_type"],
+                condition=models.Q(clinic__isnull=True), name="utilization_daily_key_no_clinic",
+            ),
+        ]
+        indexes     = [models.Index(fields=["user", "day"]), models.Index(fields=["clinic", "day"])]
+
+    def __str__(self):
+        return f"{self.day} {self.role} {self.user_id} @ {self.clinic_id or '-'} {self.appointment_type}"
+
+
+class UtilizationAvailability(models.Model):
+    """
+    Available minutes per (local day, clinic, user) from DoctorAvailability,
+    snapshotted so changing someone's hours does not rewrite the past.
+    """
+    day     = models.DateField()
+    clinic  = models.ForeignKey(Clinic, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    user    = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    role    = models.CharField(max_length=10)
+    minutes = models.IntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "day"]), models.Index(fields=["clinic", "day"])]
+
+    def __str__(self):
+        return f"{self.day} {self.user_id} @ {self.clinic_id or '-'}: {self.minutes} min"
+
+
+class Job(models.Model):
+    """
+    One unit of background work (consultation/jobs.py), run by the
+    ``manage.py run_jobs`` workers. Finished jobs are purged after
+    JOBS_KEEP_DONE_HOURS; failed ones stay for inspection in the admin.
+    """
+    STATUS_CHOICES = [
+        ("queued",  "Queued"),
+        ("running", "Running"),
+        ("done",    "Done"),
+        ("failed",  "Failed"),
+    ]
+
+    kind         = models.CharField(max_length=50)
+    payload      = models.JSONField(default=dict)
+    status       = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    attempts     = models.PositiveIntegerField(default=0)
+    run_after    = models.DateTimeField(default=timezone.now)   # not before; pushed back on retry
+    locked_by    = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)   # lease; a lapsed lease means the worker died
+    last_error   = models.TextField(blank=True)
+    created_at   = models.DateTimeField(auto_now_add=True)
+    finished_at  = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Only the live part of the queue is indexed for claiming.
+            models.Index(
+                fields=["kind", "run_after"], name="consultation_job_due",
+                condition=models.Q(status__in=("queued", "running")),
+            ),
+            models.Index(fields=["status", "finished_at"]),
+        ]
+
+    def __str__(self):
+        return f"Job {self.pk} {self.kind} ({self.status}, attempt {self.attempts})"
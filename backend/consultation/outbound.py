@@ -0,0 +1,135 @@
+"""
+consultation/outbound.py
+========================
+Per-connection outbound queue for the WebSocket consumers.
+
+Consumers put() text frames instead of awaiting self.send() inline; one
+writer task per connection drains the queue to the client. A peer on a
+slow link then only backs up its own queue — the channel-layer handlers
+and the Deepgram relay loops keep running at full speed.
+
+Frames are sent highest priority first, FIFO within a priority:
+
+  SIGNALLING  peer_joined/left, offer/answer/ice, ping, stt_ready/errors
+  FINAL       final transcripts and captions
+  CHAT        chat messages
+  INTERIM     interim transcripts and captions
+
+When the queued bytes exceed ``budget`` the oldest frames of the lowest
+priority present are dropped (interims first, signalling never). A queued
+interim with the same ``key`` (speaker) is replaced rather than kept, since
+only the latest one matters. If signalling alone exceeds ``hard_limit`` the
+client cannot keep up at all and the connection is closed.
+"""
+
+import asyncio
+from collections import deque
+
+SIGNALLING = 0
+FINAL      = 1
+CHAT       = 2
+INTERIM    = 3
+
+PRIORITY_NAMES = ("signalling", "final", "chat", "interim")
+
+
+class OutboundQueue:
+
+    def __init__(self, send, budget=256 * 1024, hard_limit=1024 * 1024, on_drop=None, on_overflow=None):
+        self.send        = send          # async callable(text)
+        self.budget      = budget
+        self.hard_limit  = hard_limit
+        self.on_drop     = on_drop       # callable(priority, count)
+        self.on_overflow = on_overflow   # async callable() — close the connection
+        self.queues      = tuple(deque() for _ in PRIORITY_NAMES)   # (key, text)
+        self.queued      = 0             # bytes waiting
+        self.dropped     = 0
+        self._wakeup     = asyncio.Event()
+        self._writer     = None
+        self._closed     = False
+
+    def put(self, text, priority=SIGNALLING, key=None):
+        """Queue ``text``; returns False if it was dropped on arrival."""
+        if self._closed:
+            return False
+        if priority == INTERIM and key is not None:
+            self._supersede(key)
+        size = len(text)
+        if self.queued + size > self.budget:
+            self._shed(self.queued + size - self.budget, priority)
+            if priority != SIGNALLING and self.queued + size > self.budget:
+                self._count_drop(priority, 1)
+                return False
+        self.queues[priority].append((key, text))
+        self.queued += size
+        if self.queued > self.hard_limit and self.on_overflow is not None:
+            self._closed = True
+            asyncio.ensure_future(self.on_overflow())
+            return False
+        self._start()
+        self._wakeup.set()
+        return True
+
+    def close(self):
+        self._closed = True
+        for queue in self.queues:
+            queue.clear()
+        self.queued = 0
+        if self._writer is not None and not self._writer.done():
+            self._writer.cancel()
+
+    def _start(self):
+        if self._writer is None:
+            self._writer = asyncio.ensure_future(self._drain())
+
+    def _supersede(self, key):
+        queue = self.queues[INTERIM]
+        for i, (queued_key, text) in enumerate(queue):
+            if queued_key == key:
+                del queue[i]
+                self.queued -= len(text)
+                self._count_drop(INTERIM, 1)
+                return
+
+    def _shed(self, excess, incoming):
+        """Drop queued frames of lower priority than ``incoming`` (lowest first) to free ``excess`` bytes."""
+        for priority in range(INTERIM, incoming, -1):
+            queue = self.queues[priority]
+            dropped = 0
+            while queue and excess > 0:
+                _, text = queue.popleft()
+                self.queued -= len(text)
+                excess      -= len(text)
+                dropped     += 1
+            if dropped:
+                self._count_drop(priority, dropped)
+            if excess <= 0:
+                return
+
+    def _count_drop(self, priority, count):
+        self.dropped += count
+        if self.on_drop is not None:
+            self.on_drop(priority, count)
+
+    def _pop(self):
+        for queue in self.queues:
+            if queue:
+                _, text = queue.popleft()
+                self.queued -= len(text)
+                return text
+        return None
+
+    async def _drain(self):
+        try:
+            while not self._closed:
+                text = self._pop()
+                if text is None:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                await self.send(text)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # The socket is gone; disconnect() will close() the queue.
+            self._closed = True
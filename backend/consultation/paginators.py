@@ -0,0 +1,54 @@
+"""
+consultation/paginators.py
+==========================
+EstimatedCountPaginator — for admin changelists over tables that grow
+without bound (Meeting, Job, TranscriptArchive). Paginator.count is an
+exact COUNT(*), which on PostgreSQL reads the whole table (or everything
+the filters match) on every page view. This one asks the planner instead:
+
+  * unfiltered — pg_class.reltuples, the row count ANALYZE/autovacuum
+    last saw; one catalog lookup.
+  * filtered — the row estimate of EXPLAIN for the changelist query.
+
+Estimates below ``exact_below`` are replaced by a real COUNT(*), which is
+cheap at that size, so small tables and narrow filters show exact totals.
+Pair it with ``show_full_result_count = False`` on the ModelAdmin, or the
+"(N total)" link runs the exact count anyway. Other databases count
+exactly.
+"""
+
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if getattr(queryset, "query", None) is None or connections[queryset.db].vendor != "postgresql":
+            return super().count
+        estimate = self._estimate(queryset)
+        return estimate if estimate >= self.exact_below else super().count
+
+    @staticmethod
+    def _estimate(queryset):
+        query = queryset.query
+        with connections[queryset.db].cursor() as cursor:
+            if not query.where and not query.distinct and not query.combinator:
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+                if row and row[0] >= 0:   # -1: never analysed
+                    return row[0]
+                return 0
+            sql, params = query.sql_with_params()
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
@@ -0,0 +1,88 @@
+"""
+consultation/ratelimit.py
+=========================
+Per-connection flood protection for CallConsumer.
+
+Each call socket gets one PeerLimiter: a fixed set of token buckets, one
+per limited message type plus a catch-all "*" bucket that every message
+draws from. A bucket is two floats, so the memory per connection is
+constant no matter how fast or how long a client sends.
+
+Limits come from ``settings.CALL_RATE_LIMITS`` as
+``{type: (rate per second, burst)}``; types without an entry only count
+against "*". A message is dropped when either its own bucket or "*" is
+empty; if only "*" is, the type token is handed back, so a burst that hits
+the shared limit does not also use up the type's budget. ``strikes`` goes up by one per dropped message and down by one per
+accepted one, so it only grows while a client sends well over its limit
+(refills let the odd message through, which would reset a plain
+consecutive count); the consumer closes the socket when it gets too high.
+"""
+
+import time
+
+from django.conf import settings
+
+DEFAULT_LIMITS = {
+    "*"        : (50.0, 200),   # all messages from one peer
+    "offer"    : (2.0, 10),
+    "answer"   : (2.0, 10),
+    "ice"      : (30.0, 100),   # candidate gathering is bursty at call start
+    "ice_batch": (5.0, 20),
+    "chat"     : (2.0, 10),
+    "join"     : (0.2, 3),
+}
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate, burst, now):
+        self.rate   = float(rate)
+        self.burst  = float(burst)
+        self.tokens = float(burst)
+        self.stamp  = now
+
+    def take(self, now):
+        """Spend one token if available; refills lazily from the time elapsed."""
+        tokens = self.tokens + (now - self.stamp) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        self.stamp = now
+        if tokens < 1.0:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - 1.0
+        return True
+
+    def refund(self):
+        """Return the token spent by the last successful take()."""
+        self.tokens = min(self.tokens + 1.0, self.burst)
+
+
+class PeerLimiter:
+
+    def __init__(self, limits=None, clock=time.monotonic):
+        if limits is None:
+            limits = getattr(settings, "CALL_RATE_LIMITS", DEFAULT_LIMITS)
+        now          = clock()
+        self.clock   = clock
+        self.buckets = {t: TokenBucket(rate, burst, now) for t, (rate, burst) in limits.items()}
+        self.total   = self.buckets.get("*")
+        self.strikes = 0   # throttled minus accepted messages, floored at 0
+
+    def allow(self, msg_type):
+        now    = self.clock()
+        bucket = self.buckets.get(msg_type)
+        # Check the per-type bucket first so a throttled type does not also
+        # drain the shared budget the peer's other messages rely on.
+        ok = bucket is None or bucket.take(now)
+        if ok and self.total is not None and not self.total.take(now):
+            if bucket is not None:
+                bucket.refund()
+            ok = False
+        if ok:
+            if self.strikes:
+                self.strikes -= 1
+        else:
+            self.strikes += 1
+        return ok
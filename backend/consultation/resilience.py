@@ -0,0 +1,105 @@
+"""
+consultation/resilience.py
+==========================
+Reconnect policy for the Deepgram upstream connections.
+
+  * backoff_delay() — exponential backoff with jitter, so consumers that
+    lost their sockets at the same moment do not retry in lockstep.
+  * CircuitBreaker — process-wide. After ``failure_threshold`` failed
+    connects within ``window`` seconds it opens and no consumer dials out
+    for ``reset_timeout`` seconds; then a single probe is let through and
+    its outcome closes or re-opens the breaker. While it is open the STT
+    consumers run degraded: audio is kept in their replay buffers and the
+    client is sent ``stt_degraded`` / ``stt_recovered``.
+
+``deepgram_breaker`` is the shared instance, configured from settings.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0, rng=random):
+    """Delay before retry ``attempt`` (0-based): half fixed, half random."""
+    ceiling = min(cap, base * (2 ** attempt))
+    return ceiling / 2 + rng.uniform(0, ceiling / 2)
+
+
+class CircuitBreaker:
+    CLOSED    = "closed"
+    OPEN      = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, window=30.0, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.window            = window
+        self.reset_timeout     = reset_timeout
+        self.clock             = clock
+        self.state             = self.CLOSED
+        self.opened_at         = 0.0
+        self.probe_started     = None
+        self.failures          = deque()
+        self._lock             = threading.Lock()   # consumers may run on several event loops
+
+    def allow(self):
+        """True if the caller may attempt a connection now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = self.clock()
+            if self.state == self.OPEN:
+                if now - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+            # Half-open: one probe at a time. A probe that never reported
+            # back (its consumer went away) is replaced after reset_timeout.
+            if self.probe_started is not None and now - self.probe_started < self.reset_timeout:
+                return False
+            self.probe_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state         = self.CLOSED
+            self.probe_started = None
+            self.failures.clear()
+
+    def record_failure(self):
+        with self._lock:
+            now = self.clock()
+            if self.state == self.HALF_OPEN:
+                self._open(now)
+                return
+            self.failures.append(now)
+            while self.failures and now - self.failures[0] > self.window:
+                self.failures.popleft()
+            if self.state == self.CLOSED and len(self.failures) >= self.failure_threshold:
+                self._open(now)
+
+    def retry_after(self):
+        """Seconds until allow() may return True again (0 if it already would)."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return 0.0
+            if self.state == self.OPEN:
+                return max(0.0, self.reset_timeout - (self.clock() - self.opened_at))
+            if self.probe_started is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (self.clock() - self.probe_started))
+
+    def _open(self, now):
+        self.state         = self.OPEN
+        self.opened_at     = now
+        self.probe_started = None
+        self.failures.clear()
+
+
+deepgram_breaker = CircuitBreaker(
+    failure_threshold = getattr(settings, "DEEPGRAM_BREAKER_THRESHOLD", 5),
+    window            = getattr(settings, "DEEPGRAM_BREAKER_WINDOW", 30.0),
+    reset_timeout     = getattr(settings, "DEEPGRAM_BREAKER_RESET", 30.0),
+)
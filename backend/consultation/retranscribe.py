@@ -0,0 +1,120 @@
+"""
+consultation/retranscribe.py
+============================
+Offline re-transcription of archived meeting audio (consultation/archive.py)
+with the local Whisper model. Driven by ``manage.py retranscribe``.
+
+Each meeting's speaker streams are cut into work units of at most
+``max_seconds`` of audio, preferring to cut where the audio has gaps
+(mic muted, socket reconnecting), so a process pool can spread even one
+long meeting across every core. Each finished unit is checkpointed as a
+JSON file; a rerun skips units that already have one, so an interrupted
+batch resumes where it stopped. When every unit of a meeting is done its
+lines are merged in time order into the meeting transcript, in the
+``Label: text`` format the live client appends.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from .archive import BYTES_PER_SECOND, ArchiveReader, safe_name
+
+
+def plan_units(room, root, max_seconds=300.0, gap_seconds=2.0):
+    """
+    [(room, speaker, start, end, audio_seconds)] covering every archived
+    stream of ``room``. Times are epoch seconds, as in the archive index.
+    """
+    units = []
+    for speaker in ArchiveReader.speakers(room, root):
+        with ArchiveReader(room, speaker, root) as reader:
+            start = prev_end = None
+            audio = 0.0
+            for received_at, _, _, length in reader.chunks:
+                seconds = length / BYTES_PER_SECOND
+                if start is not None and (
+                    received_at - prev_end >= gap_seconds or received_at + seconds - start > max_seconds
+                ):
+                    units.append((room, speaker, start, prev_end, audio))
+                    start, audio = None, 0.0
+                if start is None:
+                    start = received_at
+                prev_end = max(prev_end or 0.0, received_at + seconds)
+                audio   += seconds
+            if start is not None:
+                units.append((room, speaker, start, prev_end, audio))
+    return units
+
+
+class Checkpoints:
+    """One JSON file per finished unit under ``<directory>/<room>/``."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def path(self, unit):
+        room, speaker, start, _, _ = unit
+        return self.directory / safe_name(room) / f"{safe_name(speaker)}-{start:.3f}.json"
+
+    def load(self, unit):
+        try:
+            return json.loads(self.path(unit).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def save(self, unit, result):
+        path = self.path(unit)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(result))
+        os.replace(tmp, path)   # a crash never leaves a half-written checkpoint
+
+    def save_previous(self, room, text):
+        """Keep the transcript being replaced, once, next to the checkpoints."""
+        path = self.directory / safe_name(room) / "previous_transcript.txt"
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(text, encoding="utf-8")
+
+
+def merge_transcript(results):
+    """Transcript text from unit results, lines ordered by the time they were spoken."""
+    lines = sorted((line for result in results for line in result["lines"]), key=lambda line: line[0])
+    return "\n".join(f"{label}: {text}" for _, label, text in lines)
+
+
+# ── Worker process ────────────────────────────────────────────────────────────
+
+_model   = None
+_options = {}
+
+
+def init_worker(model_name, language, threads):
+    """Pool initializer: load the model once per process."""
+    global _model, _options
+    import torch
+    import whisper
+    torch.set_num_threads(threads)
+    _model   = whisper.load_model(model_name, device="cpu")
+    _options = {"language": language, "fp16": False}
+
+
+def transcribe_unit(unit, root):
+    """Transcribe one unit; returns {"lines": [[epoch, label, text]], "audio_seconds"}."""
+    room, speaker, start, end, audio_seconds = unit
+    with ArchiveReader(room, speaker, root) as reader:
+        label = reader.meta().get("label") or speaker
+        pcm   = reader.read(start, end)
+    samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+    if not samples.size:
+        return {"lines": [], "audio_seconds": 0.0}
+    result = _model.transcribe(samples, **_options)
+    lines  = [
+        [start + segment["start"], label, segment["text"].strip()]
+        for segment in result.get("segments", ())
+        if segment["text"].strip()
+    ]
+    return {"lines": lines, "audio_seconds": audio_seconds}
@@ -20,4 +20,7 @@ websocket_urlpatterns = [
 
     # ── STT — Admin (Admin + Participant) ────────────────────────────────────
     re_path(r"ws/stt/admin/$",              consumers.STTConsumerAdmin.as_asgi()),
+
+    # ── Socket status — snapshot + pushed diffs for admin dashboards ─────────
+    re_path(r"ws/status/$",                 consumers.SocketStatusConsumer.as_asgi()),
 ]
\ No newline at end of file
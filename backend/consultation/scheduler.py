@@ -0,0 +1,249 @@
+"""
+consultation/scheduler.py
+=========================
+Automatic meeting transitions, run by ``manage.py run_jobs --scheduler``
+(one such worker per deployment):
+
+  * expire — MEETING_EXPIRE_GRACE_MINUTES after the scheduled end
+    (scheduled_time + duration, or started_at + duration after a late
+    start) a meeting still "scheduled" becomes "no_show" and one still
+    "started" becomes "ended".
+  * remind — MEETING_REMINDER_LEAD_MINUTES before scheduled_time a
+    "meeting.reminder" job is queued.
+
+Timers live in a heap ordered by due time, built from the active meetings
+on startup; the thread sleeps until the earliest one, so the Meeting table
+is never polled. Timers due within MEETING_SCHEDULER_BATCH_SECONDS of each
+other fire together (bookings cluster on the quarter hour) and each kind
+of transition in a batch is one UPDATE through analytics.update_status().
+
+Changes made elsewhere reach the heap through the job queue: Meeting.save()
+calls notify(), which queues a "scheduler.sync" job in the saving
+transaction when the meeting's timers move, and only the scheduler's
+worker claims those. That needs MEETING_SCHEDULER on (it is off by
+default, so installs without a scheduler do not pile up syncs); syncs
+left unclaimed for JOBS_KEEP_DONE_HOURS are purged. A timer re-reads its meeting as it fires, so a late
+sync can delay a transition but not cause a wrong one.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from . import analytics, jobs
+from .models import Job, Meeting
+
+logger = logging.getLogger("consultation.scheduler")
+
+ACTIVE      = ("scheduled", "started")
+EXPIRE      = "expire"
+REMIND      = "remind"
+FIELDS      = ("pk", "scheduled_time", "duration", "status", "started_at")
+CHUNK       = 500   # meetings per UPDATE
+RETRY_AFTER = 30    # seconds, when a batch fails (database unreachable)
+
+_running = None
+
+
+def timers(scheduled_time, duration, status, started_at):
+    """{action: epoch seconds} for a meeting in this state."""
+    if status not in ACTIVE or scheduled_time is None:
+        return {}
+    length = timedelta(minutes=int(duration or 0))
+    end    = scheduled_time + length
+    if started_at is not None:
+        end = max(end, started_at + length)
+    due = {EXPIRE: (end + timedelta(minutes=getattr(settings, "MEETING_EXPIRE_GRACE_MINUTES", 30))).timestamp()}
+    if status == "scheduled":
+        due[REMIND] = (scheduled_time - timedelta(minutes=getattr(settings, "MEETING_REMINDER_LEAD_MINUTES", 15))).timestamp()
+    return due
+
+
+def notify(meeting_id, old, new):
+    """
+    Called by Meeting.save() with its analytics states: queue a sync for the
+    scheduler if the save gave the meeting new timers. Leaving the active
+    states needs none; the pending timers find nothing to do.
+    """
+    if not getattr(settings, "MEETING_SCHEDULER", False) or new is None or new[2] not in ACTIVE:
+        return
+    if old is None or (old[0], old[1], old[2], old[7]) != (new[0], new[1], new[2], new[7]):
+        jobs.enqueue("scheduler.sync", {"meeting_ids": [meeting_id]})
+
+
+def sync(meeting_ids):
+    """Re-read ``meeting_ids`` into this process's scheduler (the "scheduler.sync" job)."""
+    if _running is None:
+        raise RuntimeError("no scheduler runs in this process")
+    _running.sync(meeting_ids)
+
+
+def start():
+    """
+    Load and start the process's scheduler thread. On PostgreSQL a session
+    advisory lock, held by the calling thread's connection, keeps a second
+    scheduler from starting anywhere else.
+    """
+    global _running
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s))", ["consultation.scheduler"])
+            if not cursor.fetchone()[0]:
+                raise RuntimeError("another scheduler is already running")
+    scheduler = Scheduler()
+    scheduler.load()
+    scheduler.thread = threading.Thread(target=scheduler.run, name="scheduler", daemon=True)
+    scheduler.thread.start()
+    _running = scheduler
+    return scheduler
+
+
+def _chunks(ids):
+    for i in range(0, len(ids), CHUNK):
+        yield ids[i:i + CHUNK]
+
+
+class Scheduler:
+    def __init__(self, clock=time.time):
+        self.clock    = clock
+        self.thread   = None
+        self._heap    = []   # (due, seq, meeting_id, action, version)
+        self._version = {}   # meeting_id -> version of its live timers; older entries are skipped
+        self._seq     = itertools.count()
+        self._cond    = threading.Condition()
+        self._stopped = False
+
+    def __len__(self):
+        return len(self._version)
+
+    def load(self):
+        """Schedule every active meeting; queued syncs are covered by this and dropped."""
+        now = timezone.now()
+        Job.objects.filter(kind="scheduler.sync", status="queued", created_at__lte=now).update(
+            status="done", finished_at=now,
+        )
+        rows = Meeting.objects.filter(status__in=ACTIVE).values_list(*FIELDS).iterator(chunk_size=2000)
+        with self._cond:
+            for row in rows:
+                self._schedule(row)
+            self._cond.notify()
+        logger.info("scheduler.loaded", extra={"meetings": len(self._version), "timers": len(self._heap)})
+        return len(self._version)
+
+    def sync(self, meeting_ids):
+        rows = {row[0]: row for row in Meeting.objects.filter(pk__in=meeting_ids).values_list(*FIELDS)}
+        with self._cond:
+            for meeting_id in meeting_ids:
+                if meeting_id in rows:
+                    self._schedule(rows[meeting_id])
+                else:
+                    self._version.pop(meeting_id, None)
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _schedule(self, row):
+        """(Re)place the timers of one meeting row; caller holds the lock."""
+        meeting_id, *state = row
+        now = self.clock()
+        due = {action: when for action, when in timers(*state).items() if action == EXPIRE or when > now}
+        if not due:
+            self._version.pop(meeting_id, None)
+            return
+        version = self._version[meeting_id] = next(self._seq)
+        for action, when in due.items():
+            heapq.heappush(self._heap, (when, next(self._seq), meeting_id, action, version))
+        if len(self._heap) > 4 * len(self._version) + 1000:
+            # Mostly superseded entries: rebuild without them.
+            self._heap = [entry for entry in self._heap if self._version.get(entry[2]) == entry[4]]
+            heapq.heapify(self._heap)
+
+    def run(self):
+        window = getattr(settings, "MEETING_SCHEDULER_BATCH_SECONDS", 5)
+        try:
+            while True:
+                with self._cond:
+                    while not self._stopped:
+                        wait = self._heap[0][0] - self.clock() if self._heap else None
+                        if wait is not None and wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    if self._stopped:
+                        return
+                    horizon = self.clock() + window
+                    due     = defaultdict(list)
+                    while self._heap and self._heap[0][0] <= horizon:
+                        _, _, meeting_id, action, version = heapq.heappop(self._heap)
+                        if self._version.get(meeting_id) == version:
+                            due[action].append(meeting_id)
+                            if action == EXPIRE:   # always a meeting's last timer
+                                del self._version[meeting_id]
+                try:
+                    self.fire(due, horizon)
+                except Exception as exc:
+                    logger.warning("scheduler.fire_failed", extra={"error": str(exc), "retry_in": RETRY_AFTER})
+                    connection.close_if_unusable_or_obsolete()
+                    self._retry(due.get(EXPIRE, []))
+        finally:
+            connection.close()
+
+    def _retry(self, meeting_ids):
+        # Reminders of a failed batch are dropped; expiries come back later.
+        with self._cond:
+            for meeting_id in meeting_ids:
+                version = self._version[meeting_id] = next(self._seq)
+                heapq.heappush(self._heap, (self.clock() + RETRY_AFTER, next(self._seq), meeting_id, EXPIRE, version))
+
+    def fire(self, due, horizon):
+        """Run the ``due`` {action: [meeting_id]} batch; timers up to ``horizon`` count as due."""
+        if due.get(EXPIRE):
+            self._expire(due[EXPIRE], horizon)
+        if due.get(REMIND):
+            self._remind(due[REMIND], horizon)
+
+    def _recheck(self, meeting_ids, action, horizon, statuses):
+        """Rows whose ``action`` is really due now; the others are rescheduled."""
+        ready, moved = [], []
+        for chunk in _chunks(meeting_ids):
+            for row in Meeting.objects.filter(pk__in=chunk, status__in=statuses).values_list(*FIELDS):
+                when = timers(*row[1:]).get(action)
+                if when is not None and when <= horizon:
+                    ready.append(row)
+                else:
+                    moved.append(row)
+        if moved:
+            with self._cond:
+                for row in moved:
+                    self._schedule(row)
+        return ready
+
+    def _expire(self, meeting_ids, horizon):
+        ready = self._recheck(meeting_ids, EXPIRE, horizon, ACTIVE)
+        done  = {}
+        for before, after in (("scheduled", "no_show"), ("started", "ended")):
+            ids = [row[0] for row in ready if row[3] == before]
+            done[after] = sum(
+                analytics.update_status(Meeting.objects.filter(pk__in=chunk, status=before), after)
+                for chunk in _chunks(ids)
+            )
+        logger.info("scheduler.expired", extra=done)
+
+    def _remind(self, meeting_ids, horizon):
+        now = self.clock()
+        ids = [row[0] for row in self._recheck(meeting_ids, REMIND, horizon, ("scheduled",)) if row[1].timestamp() > now]
+        for chunk in _chunks(ids):
+            jobs.enqueue("meeting.reminder", {"meeting_ids": chunk})
+        logger.info("scheduler.reminded", extra={"meetings": len(ids)})
@@ -0,0 +1,225 @@
+"""
+consultation/search.py
+======================
+Full-text index over meeting transcripts (Meeting.speech_to_text).
+
+The index is a side table keyed by meeting_id, created by migration 0007:
+
+  * PostgreSQL — ``consultation_transcriptsearch(meeting_id, document
+    tsvector)`` with a GIN index. Appending a line only parses that line:
+    its tsvector is concatenated onto the stored one, so a growing
+    transcript is never re-parsed as a whole.
+  * SQLite — an FTS5 table ``consultation_transcript_fts`` (rowid =
+    meeting_id), so the same code paths run in tests and local setups.
+    FTS5 re-tokenizes a row when it is updated, so appends cost the
+    length of the transcript there.
+
+Writers call replace() when the whole transcript is set and append()
+for one new line, in the same transaction as the Meeting update.
+search() returns hits ranked best first, each with a highlighted snippet.
+Compaction (compact_transcripts) does not touch the index; only
+PostgreSQL snippets for compacted meetings are built from the archive.
+Queries use web-search syntax on both backends: words are ANDed,
+"quoted phrases", ``or`` and ``-excluded`` words.
+
+On any other database there is no index: supported() is False, the
+writers do nothing and search() finds nothing. TranscriptSearchView
+answers 501 there rather than an empty page.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connection
+
+from .models import TranscriptArchive
+
+HIGHLIGHT = ("«", "»")
+
+_PG_TABLE  = "consultation_transcriptsearch"
+_FTS_TABLE = "consultation_transcript_fts"
+_TERM      = re.compile(r'(-?)"([^"]*)"?|(-?)([^\s"]+)')
+_WORD      = re.compile(r"\w+")
+
+
+class Hit:
+    __slots__ = ("meeting_id", "rank", "snippet")
+
+    def __init__(self, meeting_id, rank, snippet):
+        self.meeting_id = meeting_id
+        self.rank       = rank
+        self.snippet    = snippet
+
+
+def supported():
+    """Whether this database has a transcript index (PostgreSQL or SQLite)."""
+    return connection.vendor in ("postgresql", "sqlite")
+
+
+def _config():
+    return getattr(settings, "TRANSCRIPT_SEARCH_CONFIG", "english")
+
+
+def replace(meeting_id, text):
+    """Index ``text`` as the meeting's whole transcript."""
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                f"INSERT INTO {_PG_TABLE} (meeting_id, document) VALUES (%s, to_tsvector(%s::regconfig, %s)) "
+                f"ON CONFLICT (meeting_id) DO UPDATE SET document = EXCLUDED.document",
+                [meeting_id, _config(), text],
+            )
+        elif connection.vendor == "sqlite":
+            cursor.execute(f"DELETE FROM {_FTS_TABLE} WHERE rowid = %s", [meeting_id])
+            cursor.execute(f"INSERT INTO {_FTS_TABLE} (rowid, transcript) VALUES (%s, %s)", [meeting_id, text])
+
+
+def append(meeting_id, line):
+    """Add one transcript line to the meeting's entry."""
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                f"INSERT INTO {_PG_TABLE} (meeting_id, document) VALUES (%s, to_tsvector(%s::regconfig, %s)) "
+                f"ON CONFLICT (meeting_id) DO UPDATE SET document = {_PG_TABLE}.document || EXCLUDED.document",
+                [meeting_id, _config(), line],
+            )
+        elif connection.vendor == "sqlite":
+            cursor.execute(
+                f"UPDATE {_FTS_TABLE} SET transcript = transcript || char(10) || %s WHERE rowid = %s",
+                [line, meeting_id],
+            )
+            if cursor.rowcount == 0:
+                cursor.execute(f"INSERT INTO {_FTS_TABLE} (rowid, transcript) VALUES (%s, %s)", [meeting_id, line])
+
+
+def rebuild():
+    """Re-index every transcript, e.g. after changing TRANSCRIPT_SEARCH_CONFIG."""
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(f"TRUNCATE {_PG_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {_PG_TABLE} (meeting_id, document) "
+                f"SELECT meeting_id, to_tsvector(%s::regconfig, speech_to_text) "
+                f"FROM consultation_meeting WHERE speech_to_text <> ''",
+                [_config()],
+            )
+        elif connection.vendor == "sqlite":
+            cursor.execute(f"DELETE FROM {_FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {_FTS_TABLE} (rowid, transcript) "
+                f"SELECT meeting_id, speech_to_text FROM consultation_meeting WHERE speech_to_text <> ''"
+            )
+    # Compacted transcripts can only be decompressed here, not in SQL.
+    for archive in TranscriptArchive.objects.iterator(chunk_size=200):
+        replace(archive.meeting_id, archive.text())
+
+
+def remove(meeting_id):
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(f"DELETE FROM {_PG_TABLE} WHERE meeting_id = %s", [meeting_id])
+        elif connection.vendor == "sqlite":
+            cursor.execute(f"DELETE FROM {_FTS_TABLE} WHERE rowid = %s", [meeting_id])
+
+
+def search(query, limit=20, offset=0, participant=None):
+    """
+    [Hit] for ``query``, best match first. ``participant`` (a user id)
+    limits the hits to meetings that user is the patient, doctor or
+    sales rep of.
+    """
+    query = query.strip()
+    if not query:
+        return []
+    where, params = "", []
+    if participant is not None:
+        where  = " AND (m.patient_id = %s OR m.doctor_id = %s OR m.sales_id = %s)"
+        params = [participant] * 3
+    if connection.vendor == "postgresql":
+        return _search_postgresql(query, limit, offset, where, params)
+    if connection.vendor == "sqlite":
+        return _search_sqlite(query, limit, offset, where, params)
+    return []
+
+
+def _search_postgresql(query, limit, offset, where, params):
+    # ts_rank normalisation 1 divides by 1 + log(length), so long meetings
+    # do not outrank short ones just by repeating a word. Headlines re-parse
+    # the transcript, so they are only built for the page being returned.
+    options = f"StartSel={HIGHLIGHT[0]}, StopSel={HIGHLIGHT[1]}, MaxFragments=2, MinWords=8, MaxWords=20"
+    sql = f"""
+        SELECT hit.meeting_id, hit.rank, ts_headline(%s::regconfig, m.speech_to_text, hit.q, %s)
+        FROM (
+            SELECT s.meeting_id, ts_rank(s.document, q, 1) AS rank, q
+            FROM {_PG_TABLE} s
+            JOIN consultation_meeting m ON m.meeting_id = s.meeting_id,
+                 websearch_to_tsquery(%s::regconfig, %s) q
+            WHERE s.document @@ q{where}
+            ORDER BY rank DESC, s.meeting_id DESC
+            LIMIT %s OFFSET %s
+        ) hit
+        JOIN consultation_meeting m ON m.meeting_id = hit.meeting_id
+        ORDER BY hit.rank DESC, hit.meeting_id DESC
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [_config(), options, _config(), query, *params, limit, offset])
+        hits = [Hit(*row) for row in cursor.fetchall()]
+    return _headline_compacted(hits, query, options)
+
+
+def _headline_compacted(hits, query, options):
+    """ts_headline for hits whose transcript was compacted (its snippet came back empty)."""
+    missing = {hit.meeting_id: hit for hit in hits if not hit.snippet}
+    if not missing:
+        return hits
+    with connection.cursor() as cursor:
+        for archive in TranscriptArchive.objects.filter(meeting_id__in=list(missing)):
+            cursor.execute(
+                "SELECT ts_headline(%s::regconfig, %s, websearch_to_tsquery(%s::regconfig, %s), %s)",
+                [_config(), archive.text(), _config(), query, options],
+            )
+            missing[archive.meeting_id].snippet = cursor.fetchone()[0]
+    return hits
+
+
+def _search_sqlite(query, limit, offset, where, params):
+    match = fts5_query(query)
+    if not match:
+        return []
+    # bm25 rank is lower-is-better; negate so both backends sort the same way.
+    sql = f"""
+        SELECT f.rowid, -f.rank, snippet({_FTS_TABLE}, 0, %s, %s, '…', 16)
+        FROM {_FTS_TABLE} f
+        JOIN consultation_meeting m ON m.meeting_id = f.rowid
+        WHERE {_FTS_TABLE} MATCH %s{where}
+        ORDER BY f.rank, f.rowid DESC
+        LIMIT %s OFFSET %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*HIGHLIGHT, match, *params, limit, offset])
+        return [Hit(*row) for row in cursor.fetchall()]
+
+
+def fts5_query(text):
+    """
+    FTS5 MATCH expression for a web-search style query, mirroring
+    websearch_to_tsquery: terms are ANDed, ``or`` separates alternatives,
+    a leading ``-`` excludes a term. Punctuation is dropped so user input
+    can never be an FTS5 syntax error.
+    """
+    groups  = []
+    include, exclude = [], []
+    for minus, phrase, minus_word, word in _TERM.findall(text):
+        if not phrase and word.lower() == "or":
+            groups.append((include, exclude))
+            include, exclude = [], []
+            continue
+        tokens = _WORD.findall(phrase or word)
+        if tokens:
+            term = '"' + " ".join(tokens) + '"'
+            (exclude if (minus or minus_word) else include).append(term)
+    groups.append((include, exclude))
+    return " OR ".join(
+        " AND ".join(include) + "".join(f" NOT {term}" for term in exclude)
+        for include, exclude in groups if include
+    )
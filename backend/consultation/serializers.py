@@ -76,6 +76,8 @@ class MeetingSerializer(serializers.ModelSerializer):
     clinic_name  = serializers.SerializerMethodField()
     # FIX: was missing — SalesHome.js and PatientHome.js both access appt.sales_name
     sales_name   = serializers.SerializerMethodField()
+    # Hot or compacted (Meeting.transcript); list views select_related("transcript_archive").
+    speech_to_text = serializers.CharField(source="transcript", read_only=True)
 
     # Human-readable versions of choice fields
     meeting_type_label     = serializers.CharField(source="get_meeting_type_display",     read_only=True)
@@ -1,14 +1,84 @@
 from .models import *
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
 import threading
+import time
 
-# Thread-safe lock for socket registry
-_socket_registry_lock = threading.Lock()
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import Q
 
-# In-memory registry of active socket connections
-# Format: { socket_id: { url, type, connected, created_at, last_updated, user_info } }
-_socket_registry: Dict[str, Dict[str, Any]] = {}
+from .encoding import event_frames, msgpack, pack
+from .outbound import FINAL, INTERIM
+
+logger = logging.getLogger("consultation.services")
+
+# Offset used to turn monotonic timestamps back into wall-clock time for
+# API output. Records only ever store time.monotonic() floats.
+_WALL_OFFSET = time.time() - time.monotonic()
+
+
+class _SocketRecord:
+    """One registry entry. __slots__ keeps this to ~100 bytes per socket."""
+    __slots__ = ("id", "type", "room", "user_info", "created_at", "last_updated")
+
+    def __init__(self, socket_id, socket_type, room, user_info, now):
+        self.id           = socket_id
+        self.type         = socket_type
+        self.room         = room
+        self.user_info    = user_info
+        self.created_at   = now
+        self.last_updated = now
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'id'          : self.id,
+            'type'        : self.type,
+            'room'        : self.room,
+            'connected'   : True,
+            'created_at'  : datetime.fromtimestamp(self.created_at + _WALL_OFFSET).isoformat(),
+            'last_updated': datetime.fromtimestamp(self.last_updated + _WALL_OFFSET).isoformat(),
+            'user_info'   : dict(self.user_info),
+        }
+
+
+# In-memory registry of active socket connections  { socket_id: _SocketRecord }
+#
+# No lock: every mutation happens on the ASGI event-loop thread inside a
+# consumer's connect/receive/disconnect, and none of the mutators await, so
+# they are atomic with respect to other coroutines. Readers on other threads
+# (sync DRF views) only take single C-level copies (dict(), list()), which
+# are atomic under the GIL.
+_socket_registry: Dict[str, _SocketRecord] = {}
+
+# Per-type and per-room live counts, maintained incrementally by
+# register/unregister/update.
+_socket_counts: Dict[str, int] = {}
+_room_counts: Dict[str, int] = {}
+
+# Bumped on every mutation so the cluster publisher can skip unchanged beats.
+_registry_version = 0
+
+
+def _incr(counts: Dict[str, int], key) -> None:
+    if key is not None:
+        counts[key] = counts.get(key, 0) + 1
+
+
+def _decr(counts: Dict[str, int], key) -> None:
+    if key is None:
+        return
+    remaining = counts.get(key, 1) - 1
+    if remaining > 0:
+        counts[key] = remaining
+    else:
+        counts.pop(key, None)
 
 
 class SocketStatusService:
@@ -18,7 +88,8 @@ class SocketStatusService:
     """
 
     @staticmethod
-    def register_socket(socket_id: str, socket_type: str, user_info: Dict[str, Any] = None) -> None:
+    def register_socket(socket_id: str, socket_type: str, user_info: Dict[str, Any] = None,
+                        room: Optional[str] = None) -> None:
         """
         Register a new socket connection.
         
@@ -26,86 +97,597 @@ class SocketStatusService:
             socket_id: Unique identifier for the socket
             socket_type: Type of socket (e.g., 'call', 'stt', 'stt_room', 'stt_sales', 'stt_admin')
             user_info: Optional user information (role, name, etc.)
+            room: Optional room the socket belongs to (call sockets)
         """
-        with _socket_registry_lock:
-            _socket_registry[socket_id] = {
-                'id': socket_id,
-                'type': socket_type,
-                'connected': True,
-                'created_at': datetime.now().isoformat(),
-                'last_updated': datetime.now().isoformat(),
-                'user_info': user_info or {}
-            }
+        global _registry_version
+        previous = _socket_registry.get(socket_id)
+        if previous is not None:
+            _decr(_socket_counts, previous.type)
+            _decr(_room_counts, previous.room)
+        _socket_registry[socket_id] = _SocketRecord(
+            socket_id, socket_type, room, user_info or {}, time.monotonic(),
+        )
+        _incr(_socket_counts, socket_type)
+        _incr(_room_counts, room)
+        _registry_version += 1
+        ClusterSocketStatus.ensure_publisher()
+        if previous is None:
+            SocketStatusStream.note(socket_id, "added", socket_type)
+        elif previous.type != socket_type:
+            SocketStatusStream.note(socket_id, "updated", socket_type, was=previous.type)
 
     @staticmethod
     def unregister_socket(socket_id: str) -> None:
         """Mark socket as disconnected and remove from registry."""
-        with _socket_registry_lock:
-            if socket_id in _socket_registry:
-                del _socket_registry[socket_id]
+        global _registry_version
+        record = _socket_registry.pop(socket_id, None)
+        if record is None:
+            return
+        _decr(_socket_counts, record.type)
+        _decr(_room_counts, record.room)
+        _registry_version += 1
+        SocketStatusStream.note(socket_id, "removed", record.type)
 
     @staticmethod
     def update_socket(socket_id: str, **kwargs) -> None:
-        """Update socket information."""
-        with _socket_registry_lock:
-            if socket_id in _socket_registry:
-                _socket_registry[socket_id]['last_updated'] = datetime.now().isoformat()
-                _socket_registry[socket_id].update(kwargs)
+        """
+        Update socket information.
+
+        ``room`` replaces the socket's room; any other keyword is merged into
+        its user_info.
+        """
+        global _registry_version
+        record = _socket_registry.get(socket_id)
+        if record is None:
+            return
+        if "room" in kwargs:
+            room = kwargs.pop("room")
+            if room != record.room:
+                _decr(_room_counts, record.room)
+                _incr(_room_counts, room)
+                record.room = room
+                _registry_version += 1
+        if kwargs:
+            record.user_info.update(kwargs)
+        record.last_updated = time.monotonic()
 
     @staticmethod
-    def get_socket_status(socket_id: str) -> Dict[str, Any] or None:
+    def get_socket_status(socket_id: str) -> Optional[Dict[str, Any]]:
         """Get status of a specific socket."""
-        with _socket_registry_lock:
-            return _socket_registry.get(socket_id)
+        record = _socket_registry.get(socket_id)
+        return record.as_dict() if record is not None else None
 
     @staticmethod
     def get_all_sockets() -> Dict[str, Dict[str, Any]]:
         """Get status of all active sockets."""
-        with _socket_registry_lock:
-            return dict(_socket_registry)
+        return {r.id: r.as_dict() for r in list(_socket_registry.values())}
 
     @staticmethod
     def get_sockets_by_type(socket_type: str) -> Dict[str, Dict[str, Any]]:
         """Get all sockets of a specific type."""
-        with _socket_registry_lock:
-            return {
-                sid: info for sid, info in _socket_registry.items()
-                if info['type'] == socket_type
-            }
+        return {
+            r.id: r.as_dict() for r in list(_socket_registry.values())
+            if r.type == socket_type
+        }
 
     @staticmethod
     def get_socket_count() -> int:
         """Get count of active sockets."""
-        with _socket_registry_lock:
-            return len(_socket_registry)
+        return len(_socket_registry)
 
     @staticmethod
-    def get_socket_info_summary() -> Dict[str, Any]:
+    def get_socket_counts() -> Dict[str, int]:
+        """Get a snapshot of active socket counts keyed by type."""
+        return dict(_socket_counts)
+
+    @staticmethod
+    def get_room_counts() -> Dict[str, int]:
+        """Get a snapshot of active socket counts keyed by room."""
+        return dict(_room_counts)
+
+    @staticmethod
+    def get_socket_info_summary(include_rooms: bool = False) -> Dict[str, Any]:
         """
         Get comprehensive WebSocket information summary.
+
+        When SOCKET_STATUS_REDIS_URL is configured the counts are merged
+        across every live worker; otherwise they cover this process only.
+
+        Args:
+            include_rooms: Add ``sockets_by_room``. Room ids are enough to
+                join a live call, so only pass True for admin callers.
         
         Returns:
             Dict with socket status info including active sockets, types, and WS URL
         """
-        with _socket_registry_lock:
-            sockets_by_type = {}
-            for socket_info in _socket_registry.values():
-                socket_type = socket_info['type']
-                sockets_by_type[socket_type] = sockets_by_type.get(socket_type, 0) + 1
-
-            return {
-                'active': len(_socket_registry) > 0,
-                'total_sockets': len(_socket_registry),
-                'sockets_by_type': sockets_by_type,
-                'timestamp': datetime.now().isoformat(),
-                'ws_endpoints': {
-                    'call': '/ws/call/<room>/',
-                    'stt': '/ws/stt/',
-                    'stt_room': '/ws/stt/room/?role=<role>&name=<name>',
-                    'stt_sales': '/ws/stt/sales/',
-                    'stt_admin': '/ws/stt/admin/',
-                }
+        merged = ClusterSocketStatus.merged_counts()
+        if merged is None:
+            sockets_by_type = dict(_socket_counts)
+            sockets_by_room = dict(_room_counts)
+            workers         = 1
+        else:
+            sockets_by_type, sockets_by_room, workers = merged
+        total = sum(sockets_by_type.values())
+
+        summary = {
+            'active': total > 0,
+            'total_sockets': total,
+            'sockets_by_type': sockets_by_type,
+            'workers': workers,
+            'cluster': merged is not None,
+            'call_rooms': RoomManager.stats(),
+            'timestamp': datetime.now().isoformat(),
+            'ws_endpoints': {
+                'status': '/ws/status/',
+                'call': '/ws/call/<room>/',
+                'stt': '/ws/stt/',
+                'stt_room': '/ws/stt/room/?role=<role>&name=<name>',
+                'stt_sales': '/ws/stt/sales/',
+                'stt_admin': '/ws/stt/admin/',
             }
+        }
+        if include_rooms:
+            summary['sockets_by_room'] = sockets_by_room
+        return summary
+
+
+def is_admin(user) -> bool:
+    """Staff, superusers and users whose profile role is "admin" (reads the profile: sync only)."""
+    if not getattr(user, "is_authenticated", False):
+        return False
+    return user.is_superuser or user.is_staff or (hasattr(user, "profile") and user.profile.role == "admin")
+
+
+def is_participant(user, room: str) -> bool:
+    """True if ``user`` is the patient, doctor or sales rep of the meeting held in ``room``, or an admin (sync only)."""
+    if not getattr(user, "is_authenticated", False):
+        return False
+    if is_admin(user):
+        return True
+    return Meeting.objects.filter(room_id=room).filter(Q(patient=user) | Q(doctor=user) | Q(sales=user)).exists()
+
+
+class ClusterSocketStatus:
+    """
+    Shares each worker's socket counts through Redis so the status endpoint
+    reports totals for the whole deployment, not just the process that
+    happened to receive the request.
+
+    Each worker runs one daemon thread that writes a compact JSON snapshot
+    to ``socket_status:worker:<id>`` every SOCKET_STATUS_HEARTBEAT seconds
+    with a SOCKET_STATUS_TTL expiry, so a dead worker drops out on its own.
+    Readers MGET the keys listed in ``socket_status:workers`` — one round
+    trip, O(workers).
+
+    ``client`` may be assigned directly (e.g. a ``fakeredis.FakeRedis``)
+    to bypass SOCKET_STATUS_REDIS_URL.
+    """
+    KEY_PREFIX  = "socket_status:worker:"
+    WORKERS_KEY = "socket_status:workers"
+
+    client       = None
+    worker_id    = f"{socket.gethostname()}:{os.getpid()}"
+    _publisher   = None
+    _start_lock  = threading.Lock()
+
+    @classmethod
+    def get_client(cls):
+        if cls.client is None:
+            url = getattr(settings, "SOCKET_STATUS_REDIS_URL", None)
+            if not url:
+                return None
+            import redis
+            cls.client = redis.Redis.from_url(url, socket_timeout=1.0)
+        return cls.client
+
+    @classmethod
+    def ensure_publisher(cls) -> None:
+        """Start the heartbeat thread once per process (no-op without Redis)."""
+        if cls._publisher is not None:
+            return
+        with cls._start_lock:
+            if cls._publisher is not None or cls.get_client() is None:
+                return
+            cls._publisher = threading.Thread(
+                target=cls._publish_loop, name="socket-status-publisher", daemon=True,
+            )
+            cls._publisher.start()
+
+    @classmethod
+    def snapshot(cls) -> str:
+        return json.dumps({
+            "w"    : cls.worker_id,
+            "ts"   : time.time(),
+            "types": dict(_socket_counts),
+            "rooms": dict(_room_counts),
+        }, separators=(",", ":"))
+
+    @classmethod
+    def publish(cls, client=None) -> None:
+        client = client or cls.get_client()
+        ttl    = int(getattr(settings, "SOCKET_STATUS_TTL", 15))
+        pipe   = client.pipeline(transaction=False)
+        pipe.set(cls.KEY_PREFIX + cls.worker_id, cls.snapshot(), ex=ttl)
+        pipe.sadd(cls.WORKERS_KEY, cls.worker_id)
+        pipe.execute()
+
+    @classmethod
+    def _publish_loop(cls) -> None:
+        interval  = float(getattr(settings, "SOCKET_STATUS_HEARTBEAT", 5))
+        ttl       = int(getattr(settings, "SOCKET_STATUS_TTL", 15))
+        published = None
+        key       = cls.KEY_PREFIX + cls.worker_id
+        while True:
+            try:
+                client  = cls.get_client()
+                version = _registry_version
+                # Unchanged registry: just extend the TTL instead of rewriting.
+                if version != published or not client.expire(key, ttl):
+                    cls.publish(client)
+                    published = version
+            except Exception as exc:
+                logger.warning("socket_status.publish_failed", extra={"error": str(exc)})
+                published = None
+            time.sleep(interval)
+
+    @classmethod
+    def merged_counts(cls):
+        """
+        Merge every live worker's snapshot with this worker's live counts.
+
+        Returns ``(sockets_by_type, sockets_by_room, worker_count)``, or None
+        when Redis is not configured or unreachable.
+        """
+        client = cls.get_client()
+        if client is None:
+            return None
+        try:
+            worker_ids = [
+                w.decode() if isinstance(w, bytes) else w
+                for w in client.smembers(cls.WORKERS_KEY)
+            ]
+            others   = [w for w in worker_ids if w != cls.worker_id]
+            payloads = client.mget([cls.KEY_PREFIX + w for w in others]) if others else []
+        except Exception as exc:
+            logger.warning("socket_status.read_failed", extra={"error": str(exc)})
+            return None
+
+        by_type = dict(_socket_counts)
+        by_room = dict(_room_counts)
+        workers = 1
+        expired = []
+        for worker, raw in zip(others, payloads):
+            if raw is None:
+                expired.append(worker)
+                continue
+            snap = json.loads(raw)
+            workers += 1
+            for k, v in snap.get("types", {}).items():
+                by_type[k] = by_type.get(k, 0) + v
+            for k, v in snap.get("rooms", {}).items():
+                by_room[k] = by_room.get(k, 0) + v
+        if expired:
+            try:
+                client.srem(cls.WORKERS_KEY, *expired)
+            except Exception:
+                pass
+        return by_type, by_room, workers
+
+
+class SocketStatusStream:
+    """
+    Pushes registry changes to ``ws/status/`` subscribers.
+
+    Changes are collected per socket id and flushed as one ``status_diff``
+    event at most SOCKET_STATUS_PUSH_RATE times per second. A socket that
+    connects and disconnects inside the same window never appears. Each diff
+    lists added/removed sockets with their type, and ``updated`` ones (an id
+    registered again as another type) with the type they were, so clients
+    can apply it to totals that came from any worker. Rooms are left out:
+    a room id is enough to join a live call.
+    """
+    GROUP = "socket_status"
+
+    _pending: Dict[str, tuple] = {}   # socket id -> (change, type, type subscribers knew)
+    _scheduled  = False
+    _last_flush = 0.0
+
+    @classmethod
+    def note(cls, socket_id: str, change: str, socket_type: str, was: Optional[str] = None) -> None:
+        """Record an "added", "removed" or "updated" socket; ``was`` is an updated socket's old type."""
+        entry    = (change, socket_type, was)
+        previous = cls._pending.get(socket_id)
+        if previous is not None:
+            entry = cls._merge(previous, entry)
+        if entry is None:
+            cls._pending.pop(socket_id, None)
+        else:
+            cls._pending[socket_id] = entry
+        if cls._scheduled or not cls._pending:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # outside the event loop (management commands, shell)
+        rate  = float(getattr(settings, "SOCKET_STATUS_PUSH_RATE", 2))
+        delay = max(0.0, cls._last_flush + 1.0 / rate - time.monotonic())
+        cls._scheduled = True
+        loop.call_later(delay, lambda: asyncio.ensure_future(cls.flush()))
+
+    @staticmethod
+    def _merge(first, then):
+        """
+        One change equivalent to ``first`` followed by ``then`` within a
+        window, as seen by subscribers; None when they cancel out.
+        """
+        change, socket_type, _ = then
+        if first[0] == "added":
+            # Subscribers never saw it: report the end state, or nothing.
+            return None if change == "removed" else ("added", socket_type, None)
+        known = first[1] if first[0] == "removed" else first[2]   # type subscribers still count it as
+        if change == "removed":
+            return ("removed", known, None)
+        return None if socket_type == known else ("updated", socket_type, known)
+
+    @classmethod
+    async def flush(cls) -> None:
+        pending, cls._pending = cls._pending, {}
+        cls._scheduled  = False
+        cls._last_flush = time.monotonic()
+        if not pending:
+            return
+        diff = {"added": [], "removed": [], "updated": []}
+        for sid, (change, socket_type, was) in pending.items():
+            entry = {"id": sid, "type": socket_type}
+            if change == "updated":
+                entry["was"] = was
+            diff[change].append(entry)
+        text = json.dumps({
+            "type"   : "status_diff",
+            "worker" : ClusterSocketStatus.worker_id,
+            **diff,
+            "ts"     : time.time(),
+        }, separators=(",", ":"))
+        try:
+            await get_channel_layer().group_send(cls.GROUP, {"type": "status_diff", "text": text})
+        except Exception as exc:
+            logger.warning("socket_status.push_failed", extra={"error": str(exc)})
+
+
+class CaptionPublisher:
+    """
+    Publishes one speaker's live captions to a call room, where CallConsumer
+    relays them to every peer as ``caption`` messages.
+
+    Finals go out immediately. Interims are coalesced — the latest text
+    wins — and sent at most CAPTION_INTERIM_RATE times per second, so a
+    fast talker costs each peer a bounded number of messages. ``seq`` lets
+    clients drop an interim that arrives after the final it precedes.
+    """
+
+    def __init__(self, room: str, speaker: str, role: str = "", peer: Optional[str] = None):
+        self.room     = room
+        self.group    = f"call_{room}"
+        self.speaker  = speaker
+        self.role     = role
+        self.peer     = peer
+        self.interval = 1.0 / float(getattr(settings, "CAPTION_INTERIM_RATE", 4))
+        self._pending = None    # latest unpublished interim text
+        self._timer   = None
+        self._last    = 0.0
+        self._seq     = 0
+
+    async def publish(self, text: str, is_final: bool) -> None:
+        if is_final:
+            self._pending = None
+            self._cancel()
+            await self._send(text, True)
+            return
+        self._pending = text
+        if self._timer is not None:
+            return
+        delay = self._last + self.interval - time.monotonic()
+        if delay <= 0:
+            await self._flush()
+        else:
+            loop        = asyncio.get_running_loop()
+            self._timer = loop.call_later(delay, lambda: asyncio.ensure_future(self._flush()))
+
+    def close(self) -> None:
+        self._pending = None
+        self._cancel()
+
+    def _cancel(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    async def _flush(self) -> None:
+        self._timer = None
+        text, self._pending = self._pending, None
+        if text is not None:
+            await self._send(text, False)
+
+    async def _send(self, text: str, is_final: bool) -> None:
+        self._seq += 1
+        self._last = time.monotonic()
+        frames = event_frames({
+            "type"    : "caption",
+            "speaker" : self.speaker,
+            "role"    : self.role,
+            "peer"    : self.peer,
+            "text"    : text,
+            "is_final": is_final,
+            "seq"     : self._seq,
+        }, RoomManager.has_binary(self.room))
+        try:
+            await get_channel_layer().group_send(self.group, {
+                "type"    : "relay_message",
+                **frames,
+                "priority": FINAL if is_final else INTERIM,
+                "key"     : self.peer or self.speaker,   # a newer interim replaces a queued one
+            })
+        except Exception as exc:
+            logger.warning("caption.publish_failed", extra={"group": self.group, "error": str(exc)})
+
+
+class _Peer:
+    """
+    One joined CallConsumer. last_seen is time.monotonic() of its latest
+    message; binary is True if it negotiated the msgpack subprotocol and
+    batch_ice if its join listed the "ice_batch" feature. user_id is the
+    authenticated user behind the socket (None if anonymous).
+    """
+    __slots__ = ("id", "name", "role", "channel", "last_seen", "binary", "batch_ice", "user_id")
+
+    def __init__(self, peer_id, name, role, channel, now, binary=False, batch_ice=False, user_id=None):
+        self.id        = peer_id
+        self.name      = name
+        self.role      = role
+        self.channel   = channel
+        self.last_seen = now
+        self.binary    = binary
+        self.batch_ice = batch_ice
+        self.user_id   = user_id
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "name": self.name, "role": self.role}
+
+
+class RoomManager:
+    """
+    Call rooms for this worker: ``{room: {peer_id: _Peer}}``.
+
+    A room exists only while it has joined peers; the last leave() deletes
+    it. A background sweeper (one asyncio task per process, started on the
+    first connect) runs every CALL_HEARTBEAT_INTERVAL seconds: peers quiet
+    for longer than that are sent ``{"type": "ping"}`` (clients answer
+    ``pong``), and peers quiet for CALL_HEARTBEAT_TIMEOUT are evicted —
+    removed here, ``peer_left`` broadcast to their room and their socket
+    asked to close. A timeout of 0 disables eviction.
+    """
+
+    _rooms: Dict[str, Dict[str, _Peer]] = {}
+    _sweeper = None
+    _evicted = 0
+
+    PING_TEXT  = json.dumps({"type": "ping"})
+    PING_BYTES = pack({"type": "ping"}) if msgpack is not None else None
+
+    @classmethod
+    def join(cls, room: str, peer_id: str, name: str, role: str, channel: str,
+             binary: bool = False, batch_ice: bool = False, user_id: Optional[int] = None) -> _Peer:
+        peers = cls._rooms.get(room)
+        if peers is None:
+            peers = cls._rooms[room] = {}
+        peer = peers[peer_id] = _Peer(peer_id, name, role, channel, time.monotonic(), binary, batch_ice, user_id)
+        return peer
+
+    @classmethod
+    def leave(cls, room: str, peer_id: str) -> bool:
+        """Remove a peer; False if it was not joined (or already evicted)."""
+        peers = cls._rooms.get(room)
+        if peers is None or peers.pop(peer_id, None) is None:
+            return False
+        if not peers:
+            del cls._rooms[room]
+        return True
+
+    @classmethod
+    def peers(cls, room: str) -> Dict[str, _Peer]:
+        return cls._rooms.get(room, {})
+
+    @classmethod
+    def get(cls, room: str, peer_id: str) -> Optional[_Peer]:
+        peers = cls._rooms.get(room)
+        return peers.get(peer_id) if peers else None
+
+    @classmethod
+    def peer_of(cls, room: str, user_id: Optional[int], hint: Optional[str] = None) -> Optional[_Peer]:
+        """
+        ``user_id``'s peer in ``room``: ``hint`` if that peer is theirs, else
+        their only peer here. None for anonymous users, for users with no
+        peer on this worker, or with several and no valid hint.
+        """
+        if user_id is None:
+            return None
+        peers = cls._rooms.get(room) or {}
+        peer  = peers.get(hint) if hint else None
+        if peer is not None and peer.user_id == user_id:
+            return peer
+        mine = [peer for peer in peers.values() if peer.user_id == user_id]
+        return mine[0] if len(mine) == 1 else None
+
+    @classmethod
+    def has_binary(cls, room: str) -> bool:
+        """True if any peer in ``room`` uses msgpack, so broadcasts must carry "bytes" too."""
+        return any(peer.binary for peer in cls._rooms.get(room, {}).values())
+
+    @classmethod
+    def stats(cls) -> Dict[str, int]:
+        """Room/peer counts and the approximate size of the registry in bytes."""
+        rooms = cls._rooms
+        size  = sys.getsizeof(rooms)
+        peers = 0
+        for name, members in list(rooms.items()):
+            size  += sys.getsizeof(name) + sys.getsizeof(members)
+            peers += len(members)
+            for peer_id, peer in list(members.items()):
+                size += (sys.getsizeof(peer_id) + sys.getsizeof(peer)
+                         + sys.getsizeof(peer.name) + sys.getsizeof(peer.role) + sys.getsizeof(peer.channel))
+        return {"rooms": len(rooms), "peers": peers, "bytes": size, "evicted": cls._evicted}
+
+    @classmethod
+    def ensure_sweeper(cls) -> None:
+        """Start the heartbeat sweeper on the running loop once per process."""
+        if float(getattr(settings, "CALL_HEARTBEAT_INTERVAL", 15)) <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        if cls._sweeper is not None and not cls._sweeper.done() and cls._sweeper.get_loop() is loop:
+            return
+        cls._sweeper = loop.create_task(cls._sweep_loop())
+
+    @classmethod
+    async def _sweep_loop(cls) -> None:
+        interval = float(getattr(settings, "CALL_HEARTBEAT_INTERVAL", 15))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await cls.sweep()
+            except Exception as exc:
+                logger.warning("rooms.sweep_failed", extra={"error": str(exc)})
+
+    @classmethod
+    async def sweep(cls, now: Optional[float] = None, layer=None) -> int:
+        """Ping quiet peers and evict dead ones; returns how many were evicted."""
+        interval = float(getattr(settings, "CALL_HEARTBEAT_INTERVAL", 15))
+        timeout  = float(getattr(settings, "CALL_HEARTBEAT_TIMEOUT", 45))
+        now      = time.monotonic() if now is None else now
+        layer    = layer or get_channel_layer()
+        dead, quiet = [], []
+        for room, members in list(cls._rooms.items()):
+            for peer in list(members.values()):
+                idle = now - peer.last_seen
+                if timeout > 0 and idle >= timeout:
+                    dead.append((room, peer))
+                elif idle >= interval:
+                    quiet.append(peer)
+
+        for peer in quiet:
+            ping = {"bytes": cls.PING_BYTES} if peer.binary else {"text": cls.PING_TEXT}
+            await layer.send(peer.channel, {"type": "relay_to_channel", **ping, "target_channel": peer.channel})
+        for room, peer in dead:
+            if not cls.leave(room, peer.id):
+                continue
+            cls._evicted += 1
+            logger.info("call.evicted", extra={"peer": peer.id, "room": room, "idle": round(now - peer.last_seen, 1)})
+            await layer.group_send(f"call_{room}", {
+                "type"   : "relay_message",
+                **event_frames({"type": "peer_left", "id": peer.id}, cls.has_binary(room)),
+                "exclude": peer.channel,
+            })
+            await layer.send(peer.channel, {"type": "evict"})
+        return len(dead)
 
 
 def create_doctor(doctor_data):
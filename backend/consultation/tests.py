@@ -1,3 +1,1690 @@
-from django.test import TestCase
+"""
+consultation/tests.py
+=====================
+Run with ``python manage.py test consultation``. The cluster socket-status
+tests need ``fakeredis`` (backend/requirements-dev.txt) and are skipped
+without it.
+"""
 
-# Create your tests here.
+import asyncio
+import io
+import json
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+import numpy as np
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from websockets.asyncio.client import connect as ws_connect
+from websockets.exceptions import ConnectionClosed
+
+from medical_consultation.asgi import application
+
+from . import archive, consumers, encoding, jobs, metrics, search, services
+from .management.commands import retranscribe as retranscribe_command
+from .management.commands.bench import _AsgiPeer, _CountingLayer, _churn_rooms
+from .audio import ReplayBuffer, StereoInterleaver
+from .deepgram_emulator import DEFAULT_SCRIPT, DeepgramEmulator, EmulatorConfig
+from .encoding import encode, pack, unpack
+from .models import (
+    Clinic, DoctorAvailability, Job, Meeting, TranscriptArchive, UserProfile, UtilizationDaily,
+)
+from .outbound import CHAT, FINAL, INTERIM, SIGNALLING, OutboundQueue
+from .ratelimit import PeerLimiter
+from .retranscribe import Checkpoints, merge_transcript, plan_units
+from .resilience import CircuitBreaker
+from .services import ClusterSocketStatus, RoomManager, SocketStatusService, SocketStatusStream
+
+try:
+    import fakeredis
+except ImportError:   # pragma: no cover
+    fakeredis = None
+
+
+def _reset_registry():
+    services._socket_registry.clear()
+    services._socket_counts.clear()
+    services._room_counts.clear()
+    SocketStatusStream._pending.clear()
+    SocketStatusStream._scheduled = False   # a flush left on a finished test's event loop never runs
+
+
+# ===== 1. Socket status across workers =====
+
+@skipUnless(fakeredis is not None, "fakeredis is not installed")
+class ClusterSocketStatusTests(SimpleTestCase):
+
+    def setUp(self):
+        _reset_registry()
+        self.redis = fakeredis.FakeRedis()
+        # No heartbeat thread: the tests call publish() themselves.
+        patcher = mock.patch.object(ClusterSocketStatus, "ensure_publisher")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(_reset_registry)
+        self.addCleanup(setattr, ClusterSocketStatus, "client", None)
+        ClusterSocketStatus.client = self.redis
+
+    def _other_worker(self, worker_id, types, rooms, ttl=15):
+        self.redis.set(ClusterSocketStatus.KEY_PREFIX + worker_id,
+                       json.dumps({"w": worker_id, "types": types, "rooms": rooms}), ex=ttl)
+        self.redis.sadd(ClusterSocketStatus.WORKERS_KEY, worker_id)
+
+    def test_publish_writes_snapshot_with_ttl(self):
+        SocketStatusService.register_socket("a", "call", room="r1")
+        SocketStatusService.register_socket("b", "stt")
+        with self.settings(SOCKET_STATUS_TTL=15):
+            ClusterSocketStatus.publish()
+
+        key  = ClusterSocketStatus.KEY_PREFIX + ClusterSocketStatus.worker_id
+        snap = json.loads(self.redis.get(key))
+        self.assertEqual(snap["types"], {"call": 1, "stt": 1})
+        self.assertEqual(snap["rooms"], {"r1": 1})
+        self.assertTrue(0 < self.redis.ttl(key) <= 15)
+        self.assertIn(ClusterSocketStatus.worker_id.encode(), self.redis.smembers(ClusterSocketStatus.WORKERS_KEY))
+
+    def test_merged_counts_add_other_workers_to_live_counts(self):
+        SocketStatusService.register_socket("a", "call", room="r1")
+        ClusterSocketStatus.publish()   # our own snapshot is skipped in favour of the live counts
+        self._other_worker("other:1", {"call": 2, "stt_room": 1}, {"r1": 1, "r2": 1})
+
+        by_type, by_room, workers = ClusterSocketStatus.merged_counts()
+        self.assertEqual(by_type, {"call": 3, "stt_room": 1})
+        self.assertEqual(by_room, {"r1": 2, "r2": 1})
+        self.assertEqual(workers, 2)
+
+    def test_expired_worker_is_dropped_and_pruned(self):
+        self._other_worker("gone:1", {"call": 5}, {"r9": 5})
+        self.redis.delete(ClusterSocketStatus.KEY_PREFIX + "gone:1")   # TTL ran out
+
+        by_type, by_room, workers = ClusterSocketStatus.merged_counts()
+        self.assertEqual((by_type, by_room, workers), ({}, {}, 1))
+        self.assertNotIn(b"gone:1", self.redis.smembers(ClusterSocketStatus.WORKERS_KEY))
+
+    def test_summary_reports_cluster_totals(self):
+        SocketStatusService.register_socket("a", "stt")
+        self._other_worker("other:1", {"stt": 1, "call": 2}, {"r1": 2})
+
+        summary = SocketStatusService.get_socket_info_summary()
+        self.assertTrue(summary["cluster"])
+        self.assertEqual(summary["workers"], 2)
+        self.assertEqual(summary["total_sockets"], 4)
+        self.assertNotIn("sockets_by_room", summary)
+        self.assertEqual(SocketStatusService.get_socket_info_summary(include_rooms=True)["sockets_by_room"], {"r1": 2})
+
+    def test_unreachable_redis_falls_back_to_this_worker(self):
+        server = fakeredis.FakeServer()
+        server.connected = False
+        ClusterSocketStatus.client = fakeredis.FakeRedis(server=server)
+        SocketStatusService.register_socket("a", "call", room="r1")
+
+        with self.assertLogs("consultation.services", "WARNING"):
+            self.assertIsNone(ClusterSocketStatus.merged_counts())
+            summary = SocketStatusService.get_socket_info_summary()
+        self.assertFalse(summary["cluster"])
+        self.assertEqual(summary["sockets_by_type"], {"call": 1})
+
+
+class SocketStatusStreamTests(SimpleTestCase):
+    """Coalescing of registry changes; outside an event loop nothing is flushed."""
+
+    def setUp(self):
+        _reset_registry()
+        self.addCleanup(_reset_registry)
+
+    def test_reregistering_as_another_type_is_an_update(self):
+        SocketStatusService.register_socket("s1", "stt")
+        SocketStatusStream._pending.clear()   # as if that diff had gone out
+        SocketStatusService.register_socket("s1", "stt_room")
+        self.assertEqual(SocketStatusStream._pending, {"s1": ("updated", "stt_room", "stt")})
+
+        SocketStatusService.register_socket("s1", "stt_room", room="other")   # nothing subscribers see
+        SocketStatusService.register_socket("s1", "call")
+        self.assertEqual(SocketStatusStream._pending, {"s1": ("updated", "call", "stt")})
+
+        SocketStatusService.register_socket("s1", "stt")   # back to what subscribers know
+        self.assertEqual(SocketStatusStream._pending, {})
+
+    def test_changes_within_a_window_collapse(self):
+        SocketStatusService.register_socket("new", "call")
+        SocketStatusService.register_socket("new", "stt")
+        self.assertEqual(SocketStatusStream._pending["new"], ("added", "stt", None))
+        SocketStatusService.unregister_socket("new")
+        self.assertNotIn("new", SocketStatusStream._pending)
+
+        SocketStatusService.register_socket("old", "call")
+        SocketStatusStream._pending.clear()
+        SocketStatusService.unregister_socket("old")
+        SocketStatusService.register_socket("old", "stt")
+        self.assertEqual(SocketStatusStream._pending["old"], ("updated", "stt", "call"))
+        SocketStatusService.register_socket("old", "stt_room")
+        SocketStatusService.unregister_socket("old")
+        self.assertEqual(SocketStatusStream._pending["old"], ("removed", "call", None))
+
+    def test_flush_lists_updates_with_their_old_type(self):
+        SocketStatusStream._pending.update({
+            "a": ("added", "call", None), "r": ("removed", "stt", None), "u": ("updated", "stt_room", "stt"),
+        })
+        layer = mock.AsyncMock()
+        with mock.patch.object(services, "get_channel_layer", return_value=layer):
+            async_to_sync(SocketStatusStream.flush)()
+        diff = json.loads(layer.group_send.call_args.args[1]["text"])
+        self.assertEqual(diff["added"], [{"id": "a", "type": "call"}])
+        self.assertEqual(diff["removed"], [{"id": "r", "type": "stt"}])
+        self.assertEqual(diff["updated"], [{"id": "u", "type": "stt_room", "was": "stt"}])
+
+
+class SocketCountTests(SimpleTestCase):
+    """The live per-type and per-room counts must always equal a recount of the registry."""
+
+    def setUp(self):
+        _reset_registry()
+        self.addCleanup(_reset_registry)
+        patcher = mock.patch.object(ClusterSocketStatus, "ensure_publisher")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _assert_counts(self, by_type, by_room):
+        self.assertEqual(SocketStatusService.get_socket_counts(), by_type)
+        self.assertEqual(SocketStatusService.get_room_counts(), by_room)
+        self._assert_consistent()
+
+    def _assert_consistent(self):
+        by_type, by_room = {}, {}
+        for record in services._socket_registry.values():
+            by_type[record.type] = by_type.get(record.type, 0) + 1
+            if record.room is not None:
+                by_room[record.room] = by_room.get(record.room, 0) + 1
+        self.assertEqual(services._socket_counts, by_type)
+        self.assertEqual(services._room_counts, by_room)
+
+    def test_counts_follow_register_update_and_unregister(self):
+        SocketStatusService.register_socket("a", "call", room="r1")
+        SocketStatusService.register_socket("b", "call", room="r1")
+        SocketStatusService.register_socket("c", "stt")
+        self._assert_counts({"call": 2, "stt": 1}, {"r1": 2})
+
+        SocketStatusService.update_socket("b", room="r2")
+        SocketStatusService.update_socket("b", name="Bob")   # user_info only
+        self._assert_counts({"call": 2, "stt": 1}, {"r1": 1, "r2": 1})
+
+        SocketStatusService.register_socket("a", "stt_room")   # re-registered: old type and room released
+        self._assert_counts({"call": 1, "stt": 1, "stt_room": 1}, {"r2": 1})
+
+        SocketStatusService.unregister_socket("b")
+        SocketStatusService.unregister_socket("b")
+        SocketStatusService.unregister_socket("never-registered")
+        SocketStatusService.update_socket("never-registered", room="r9")
+        self._assert_counts({"stt": 1, "stt_room": 1}, {})
+
+    def test_counts_survive_random_churn(self):
+        rng = random.Random(26)
+        for _ in range(3000):
+            socket_id = f"s{rng.randrange(40)}"
+            action    = rng.random()
+            if action < 0.45:
+                SocketStatusService.register_socket(
+                    socket_id, rng.choice(("call", "stt", "stt_room")), room=rng.choice((None, "r1", "r2", "r3")),
+                )
+            elif action < 0.7:
+                SocketStatusService.update_socket(socket_id, room=rng.choice((None, "r1", "r2", "r3")))
+            else:
+                SocketStatusService.unregister_socket(socket_id)
+        self._assert_consistent()
+        self.assertEqual(sum(services._socket_counts.values()), len(services._socket_registry))
+
+
+# ===== 2. ws/status/ =====
+
+def _token(user):
+    return str(RefreshToken.for_user(user).access_token)
+
+
+class SocketStatusConsumerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff   = User.objects.create_user("status-staff", password="x", is_staff=True)
+        cls.patient = User.objects.create_user("status-patient", password="x")
+
+    def setUp(self):
+        _reset_registry()
+        self.addCleanup(_reset_registry)
+
+    async def _connect(self, query=""):
+        communicator = WebsocketCommunicator(application, f"/ws/status/{query}")
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def test_refuses_anonymous_and_non_staff(self):
+        for query in ("", "?token=not-a-jwt", f"?token={_token(self.patient)}"):
+            with self.assertLogs("consultation.consumers", "WARNING"):
+                communicator, connected = await self._connect(query)
+            self.assertFalse(connected, query)
+            await communicator.disconnect()
+
+    async def test_staff_get_snapshot_and_diffs_without_rooms(self):
+        communicator, connected = await self._connect(f"?token={_token(self.staff)}")
+        self.assertTrue(connected)
+        snapshot = await communicator.receive_json_from()
+        self.assertEqual(snapshot["type"], "status_snapshot")
+        self.assertNotIn("sockets_by_room", snapshot)
+
+        SocketStatusService.register_socket("call-1", "call", room="meet-secret")
+        diff = await communicator.receive_json_from(timeout=2)
+        self.assertEqual(diff["type"], "status_diff")
+        self.assertEqual(diff["added"], [{"id": "call-1", "type": "call"}])
+        self.assertNotIn("meet-secret", json.dumps(diff))
+        await communicator.disconnect()
+
+
+# ===== 3. STT upstream connects =====
+
+class _FakeUpstream:
+    """Stands in for a Deepgram socket: records what is sent, yields queued messages."""
+
+    def __init__(self):
+        self.sent     = []
+        self.messages = asyncio.Queue()
+
+    async def send(self, data):
+        self.sent.append(data)
+
+    async def close(self):
+        self.messages.put_nowait(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.messages.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+
+class STTConnectTests(SimpleTestCase):
+
+    def setUp(self):
+        _reset_registry()
+        self.addCleanup(_reset_registry)
+        patcher = mock.patch.object(consumers, "deepgram_breaker", CircuitBreaker(failure_threshold=5))
+        self.breaker = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _first_messages(self, communicator, until="stt_ready"):
+        seen = []
+        while not seen or seen[-1]["type"] != until:
+            seen.append(await communicator.receive_json_from(timeout=2))
+        return [message["type"] for message in seen]
+
+    async def test_room_consumer_retries_failed_first_connect(self):
+        upstream = _FakeUpstream()
+        with self.settings(STT_RECONNECT_BACKOFF=0.01, WS_OUTBOUND_BUDGET=0), \
+                mock.patch.object(consumers.STTConsumerRoom, "_open_deepgram",
+                                  side_effect=[OSError("connection refused"), upstream]) as dial:
+            communicator = WebsocketCommunicator(consumers.STTConsumerRoom.as_asgi(), "/ws/stt/room/?role=doctor&name=A")
+            with self.assertLogs("consultation.consumers", "WARNING"):
+                self.assertTrue((await communicator.connect())[0])
+                await communicator.send_to(bytes_data=b"\x01" + b"\x00" * 320)   # buffered for replay
+                self.assertEqual(await self._first_messages(communicator), ["stt_ready"])
+            self.assertEqual(dial.call_count, 2)
+            self.assertEqual(upstream.sent, [b"\x00" * 320])
+            self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+            await communicator.disconnect()
+
+    async def test_two_speaker_consumer_retries_only_the_failed_side(self):
+        doctor, patient = _FakeUpstream(), _FakeUpstream()
+        with self.settings(STT_RECONNECT_BACKOFF=0.01, STT_MULTICHANNEL=False, WS_OUTBOUND_BUDGET=0), \
+                mock.patch.object(consumers.STTConsumer, "_open_deepgram",
+                                  side_effect=[OSError("connection refused"), patient, doctor]) as dial:
+            communicator = WebsocketCommunicator(consumers.STTConsumer.as_asgi(), "/ws/stt/")
+            with self.assertLogs("consultation.consumers", "WARNING"):
+                self.assertTrue((await communicator.connect())[0])
+                self.assertEqual(await self._first_messages(communicator), ["stt_ready"])
+            self.assertEqual(dial.call_count, 3)
+            await communicator.send_to(bytes_data=b"\x01" + b"\x01" * 320)
+            await communicator.send_to(bytes_data=b"\x02" + b"\x02" * 320)
+            await communicator.receive_nothing(timeout=0.05)
+            self.assertEqual((doctor.sent, patient.sent), ([b"\x01" * 320], [b"\x02" * 320]))
+            await communicator.disconnect()
+
+
+# ===== 4. Captions into a call room =====
+
+class CaptionRoomTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor   = User.objects.create_user("caption-doctor", password="x")
+        cls.patient  = User.objects.create_user("caption-patient", password="x")
+        cls.stranger = User.objects.create_user("caption-stranger", password="x")
+        cls.meeting  = Meeting.objects.create(scheduled_time=timezone.now(), doctor=cls.doctor, patient=cls.patient)
+
+    def setUp(self):
+        _reset_registry()
+        self.addCleanup(_reset_registry)
+        self.addCleanup(RoomManager._rooms.clear)
+        self.room = self.meeting.room_id
+        patcher = mock.patch.object(consumers, "deepgram_breaker", CircuitBreaker())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _communicator(self, user, peer="", room=None):
+        query = f"role=patient&name=P&room={room or self.room}&peer={peer}"
+        if user is not None:
+            query += f"&token={_token(user)}"
+        return WebsocketCommunicator(application, f"/ws/stt/room/?{query}")
+
+    async def test_refuses_users_outside_the_meeting(self):
+        for user in (None, self.stranger):
+            communicator = self._communicator(user)
+            with self.assertLogs("consultation.consumers", "WARNING") as logs:
+                connected, _ = await communicator.connect()
+            self.assertFalse(connected)
+            self.assertIn("stt.room_refused", logs.output[0])
+            await communicator.disconnect()
+
+    async def test_caption_peer_comes_from_the_room_record(self):
+        RoomManager.join(self.room, "doctor01", "Dr", "doctor", "chan.doctor", user_id=self.doctor.pk)
+        RoomManager.join(self.room, "patient1", "P", "patient", "chan.patient", user_id=self.patient.pk)
+        layer    = get_channel_layer()
+        listener = await layer.new_channel()
+        await layer.group_add(f"call_{self.room}", listener)
+        upstream = _FakeUpstream()
+
+        with self.settings(WS_OUTBOUND_BUDGET=0), \
+                mock.patch.object(consumers.STTConsumerRoom, "_open_deepgram", return_value=upstream):
+            # Claims to be the doctor's call peer; captions must still carry the patient's.
+            communicator = self._communicator(self.patient, peer="doctor01")
+            self.assertTrue((await communicator.connect())[0])
+            self.assertEqual((await communicator.receive_json_from(timeout=2))["type"], "stt_ready")
+            upstream.messages.put_nowait(json.dumps({
+                "type": "Results", "is_final": True, "start": 0.0, "duration": 1.0,
+                "channel": {"alternatives": [{"transcript": "hello doctor"}]},
+            }))
+            event = await asyncio.wait_for(layer.receive(listener), timeout=2)
+            await communicator.disconnect()
+
+        caption = json.loads(event["text"])
+        self.assertEqual((caption["type"], caption["text"], caption["peer"]), ("caption", "hello doctor", "patient1"))
+
+    def test_peer_of_needs_a_matching_user(self):
+        RoomManager.join("r", "a", "A", "patient", "chan.a", user_id=1)
+        RoomManager.join("r", "b", "B", "patient", "chan.b", user_id=1)
+        RoomManager.join("r", "c", "C", "doctor", "chan.c", user_id=2)
+        RoomManager.join("r", "d", "D", "doctor", "chan.d")
+        self.assertEqual(RoomManager.peer_of("r", 1, "b").id, "b")
+        self.assertIsNone(RoomManager.peer_of("r", 1, "c"))    # someone else's peer, and two of their own
+        self.assertEqual(RoomManager.peer_of("r", 2, "d").id, "c")
+        self.assertIsNone(RoomManager.peer_of("r", None, "d"))
+
+
+# ===== 5. Room registry soak =====
+
+class RoomSoakTests(SimpleTestCase):
+    """A short run of ``manage.py bench rooms``: churn rooms with ghost peers and sweep them."""
+
+    ROOMS       = 4000
+    SWEEP_EVERY = 200
+
+    def setUp(self):
+        self.addCleanup(RoomManager._rooms.clear)
+        RoomManager._rooms.clear()
+
+    def test_registry_and_memory_stay_flat(self):
+        layer = _CountingLayer()
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        evicted = RoomManager._evicted
+        # Silenced rather than captured: kept log records (or mock calls) would count as growth.
+        with mock.patch.object(services.logger, "disabled", True):
+            samples = async_to_sync(_churn_rooms)(self.ROOMS, 3, 10, self.SWEEP_EVERY, layer)
+
+        # Every tenth room leaves one ghost; the sweeps evict all of them.
+        ghosts = self.ROOMS // 10
+        self.assertEqual(samples[-1][2]["evicted"] - evicted, ghosts)
+        self.assertEqual(layer.sends, 2 * ghosts)   # peer_left to the room, evict to the ghost
+        empty = samples[0][2]["bytes"]   # the outer dict keeps its capacity once rooms leave
+        for done, _, stats in samples:
+            self.assertEqual((stats["rooms"], stats["peers"], stats["bytes"]), (0, 0, empty), f"after {done} rooms")
+
+        # Compare against the first sample after warm-up, as the bench does.
+        growth = samples[-1][1] - samples[1][1]
+        self.assertLess(growth, 64 * 1024)
+
+
+# ===== 6. Call-socket flood protection =====
+
+@override_settings(
+    CALL_RATE_LIMITS={"*": (1000.0, 1000), "chat": (0.001, 3)},
+    CALL_FLOOD_CLOSE_AFTER=5,
+    CALL_HEARTBEAT_INTERVAL=0,   # no sweeper task left on the test's event loop
+    WS_OUTBOUND_BUDGET=0,
+)
+class CallFloodTests(SimpleTestCase):
+
+    def setUp(self):
+        _reset_registry()
+        self.addCleanup(_reset_registry)
+        self.addCleanup(RoomManager._rooms.clear)
+
+    async def test_flood_is_throttled_then_closed(self):
+        throttled = consumers._THROTTLE_COUNTERS["chat"].value
+        closes    = metrics.SIGNALLING_FLOOD_CLOSES.labels().value
+        listener  = WebsocketCommunicator(application, "/ws/call/flood/")
+        flooder   = WebsocketCommunicator(application, "/ws/call/flood/")
+        self.assertTrue((await listener.connect())[0])
+        self.assertTrue((await flooder.connect())[0])
+
+        with self.assertLogs("consultation.consumers", "WARNING") as logs:
+            for n in range(8):
+                await flooder.send_json_to({"type": "chat", "text": f"spam {n}"})
+            closed = await flooder.receive_output(timeout=2)
+
+        # The burst of three gets through; the next five are dropped and the fifth strike closes.
+        received = [(await listener.receive_json_from(timeout=2))["text"] for _ in range(3)]
+        self.assertEqual(received, ["spam 0", "spam 1", "spam 2"])
+        self.assertTrue(await listener.receive_nothing())
+        self.assertEqual(closed, {"type": "websocket.close", "code": 1008})
+        self.assertEqual(consumers._THROTTLE_COUNTERS["chat"].value - throttled, 5)
+        self.assertEqual(metrics.SIGNALLING_FLOOD_CLOSES.labels().value - closes, 1)
+        self.assertEqual([record.getMessage() for record in logs.records], ["call.throttled", "call.flood_closed"])   # throttling is logged once per socket
+
+        await flooder.disconnect()
+        await listener.disconnect()
+
+    @override_settings(CALL_RATE_LIMITS={"*": (0.001, 2)})
+    async def test_throttled_messages_still_count_as_heartbeats(self):
+        communicator = WebsocketCommunicator(application, "/ws/call/flood/")
+        self.assertTrue((await communicator.connect())[0])
+        await communicator.send_json_to({"type": "join", "name": "P"})
+        peer = RoomManager.get("flood", (await communicator.receive_json_from(timeout=2))["id"])
+
+        await communicator.send_json_to({"type": "pong"})   # spends the last token
+        self.assertTrue(await communicator.receive_nothing())   # let the consumer handle it
+        peer.last_seen = 0.0
+        with self.assertLogs("consultation.consumers", "WARNING"):
+            await communicator.send_json_to({"type": "pong"})
+            self.assertTrue(await communicator.receive_nothing())
+        self.assertGreater(peer.last_seen, 0.0)
+        await communicator.disconnect()
+
+
+class PeerLimiterTests(SimpleTestCase):
+
+    def test_shared_bucket_rejection_refunds_the_type_token(self):
+        now     = [0.0]
+        limiter = PeerLimiter({"*": (1.0, 2), "chat": (1.0, 2)}, clock=lambda: now[0])
+        self.assertTrue(limiter.allow("ice"))
+        self.assertTrue(limiter.allow("ice"))
+        self.assertFalse(limiter.allow("chat"))   # "*" is empty; chat keeps both its tokens
+        self.assertEqual(limiter.buckets["chat"].tokens, 2.0)
+        now[0] = 2.0
+        self.assertEqual([limiter.allow("chat") for _ in range(3)], [True, True, False])
+
+    def test_strikes_rise_while_dropping_and_fall_while_accepting(self):
+        now     = [0.0]
+        limiter = PeerLimiter({"*": (1.0, 1)}, clock=lambda: now[0])
+        self.assertEqual([limiter.allow("chat") for _ in range(4)], [True, False, False, False])
+        self.assertEqual(limiter.strikes, 3)
+        now[0] = 1.0
+        limiter.allow("chat")
+        self.assertEqual(limiter.strikes, 2)
+
+
+# ===== 7. Audio archive =====
+
+class AudioArchiverTests(SimpleTestCase):
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = Path(root.name)
+
+    def test_close_stream_does_not_block_on_a_full_queue(self):
+        release = threading.Event()
+        append  = archive._SegmentWriter.append
+
+        def slow_append(writer, data, received_at):
+            release.wait(timeout=5)
+            append(writer, data, received_at)
+
+        with mock.patch.object(archive._SegmentWriter, "append", slow_append):
+            archiver = archive.AudioArchiver(self.root, segment_seconds=1, maxsize=1)
+            self.addCleanup(archiver.close)
+            archiver.write("room", "Patient", b"\x01\x00" * 100, 1.0)   # taken by the writer, which stalls
+            deadline = time.monotonic() + 5
+            while not archiver.queue.empty() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(archiver.write("room", "Patient", b"\x02\x00" * 100, 2.0))   # fills the queue
+
+            started = time.monotonic()
+            archiver.close_stream("room", "Patient")
+            self.assertLess(time.monotonic() - started, 0.5)
+            self.assertEqual(archiver.late_closes, {("room", "Patient")})
+            release.set()
+
+            # Both chunks are written first, then the idle writer truncates the segment.
+            segment  = self.root / "room" / "Patient" / "000000.pcm"
+            deadline = time.monotonic() + 5
+            while archiver.writers and time.monotonic() < deadline:
+                time.sleep(0.05)
+        self.assertEqual(archiver.writers, {})
+        self.assertEqual(segment.read_bytes(), b"\x01\x00" * 100 + b"\x02\x00" * 100)
+
+
+# ===== 8. Transcript search (SQLite FTS5) =====
+
+@skipUnless(connection.vendor == "sqlite", "exercises the FTS5 index; PostgreSQL uses tsvector")
+class TranscriptSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor  = User.objects.create_user("search-doctor", password="x")
+        cls.patient = User.objects.create_user("search-patient", password="x")
+        cls.other   = User.objects.create_user("search-other", password="x")
+        filler      = " ".join(f"word{i}" for i in range(200))
+        cls.short   = cls._meeting("Patient reports chest pain since Monday.", cls.patient)
+        cls.long    = cls._meeting(f"Chest feels tight. {filler} Some pain in the knee.", cls.other)
+        cls.cough   = cls._meeting("Dry cough at night, no chest pain.", cls.patient)
+
+    @classmethod
+    def _meeting(cls, text, patient):
+        meeting = Meeting.objects.create(scheduled_time=timezone.now(), doctor=cls.doctor, patient=patient,
+                                         speech_to_text=text)
+        search.replace(meeting.pk, text)
+        return meeting
+
+    def _ids(self, query, **kwargs):
+        return [hit.meeting_id for hit in search.search(query, **kwargs)]
+
+    def test_fts5_query_mirrors_web_search_syntax(self):
+        self.assertEqual(search.fts5_query("chest pain"), '"chest" AND "pain"')
+        self.assertEqual(search.fts5_query('"chest pain" -cough'), '"chest pain" NOT "cough"')
+        self.assertEqual(search.fts5_query("knee or cough"), '"knee" OR "cough"')
+        self.assertEqual(search.fts5_query('NEAR( * "'), '"NEAR"')   # FTS5 syntax is never passed through
+        self.assertEqual(search.fts5_query("-cough"), "")
+
+    def test_matches_rank_best_first_with_highlighted_snippets(self):
+        hits = search.search("chest pain")
+        # All three mention both words; the long meeting's are far apart in a long transcript.
+        self.assertEqual([hit.meeting_id for hit in hits][-1], self.long.pk)
+        self.assertEqual(sorted(hit.meeting_id for hit in hits), sorted([self.short.pk, self.long.pk, self.cough.pk]))
+        self.assertGreater(hits[0].rank, hits[-1].rank)
+        self.assertIn("«chest» «pain»", hits[0].snippet.lower())
+
+        self.assertEqual(self._ids('"chest pain" -cough'), [self.short.pk])
+        self.assertEqual(sorted(self._ids("knee or cough")), sorted([self.long.pk, self.cough.pk]))
+        self.assertEqual(self._ids("chest", participant=self.other.pk), [self.long.pk])
+        self.assertEqual(len(self._ids("chest", limit=2)) + len(self._ids("chest", limit=2, offset=2)), 3)
+        self.assertEqual(search.search("-cough"), [])
+
+    def test_append_replace_and_remove(self):
+        search.append(self.cough.pk, "Prescribed an inhaler.")
+        self.assertEqual(self._ids("inhaler"), [self.cough.pk])
+        self.assertEqual(self._ids("inhaler cough"), [self.cough.pk])   # the earlier text is still indexed
+
+        search.replace(self.cough.pk, "Follow-up in two weeks.")
+        self.assertEqual(self._ids("inhaler"), [])
+        search.remove(self.cough.pk)
+        self.assertEqual(self._ids("weeks"), [])
+
+        search.rebuild()   # back to what speech_to_text holds
+        self.assertEqual(self._ids("cough"), [self.cough.pk])
+
+    def test_view_limits_hits_to_the_users_meetings(self):
+        client = APIClient()
+        client.force_authenticate(self.patient)
+        response = client.get(reverse("transcript-search"), {"q": "chest", "limit": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["has_more"])
+        first = response.data["results"][0]["meeting_id"]
+        rest  = client.get(reverse("transcript-search"), {"q": "chest", "limit": 1, "offset": 1}).data
+        self.assertFalse(rest["has_more"])
+        self.assertEqual({first, rest["results"][0]["meeting_id"]}, {self.short.pk, self.cough.pk})
+        self.assertEqual(client.get(reverse("transcript-search"), {"q": " "}).status_code, 400)
+
+    def test_other_databases_have_no_index(self):
+        with mock.patch.object(connection, "vendor", "mysql"):
+            self.assertFalse(search.supported())
+            search.replace(self.short.pk, "inhaler")   # no index to write to
+            search.append(self.short.pk, "inhaler")
+            self.assertEqual(search.search("chest"), [])
+            client = APIClient()
+            client.force_authenticate(self.patient)
+            response = client.get(reverse("transcript-search"), {"q": "chest"})
+        self.assertEqual(response.status_code, 501)
+        self.assertEqual(self._ids("inhaler"), [])
+
+
+# ===== 9. Meeting export =====
+
+class MeetingExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin  = User.objects.create_superuser("export-admin", password="x")
+        cls.doctor = User.objects.create_user("export-doctor", password="x")
+        for _ in range(3):
+            Meeting.objects.create(scheduled_time=timezone.now(), doctor=cls.doctor)
+
+    def test_streamed_queries_count_towards_the_view(self):
+        series  = (metrics.VIEW_DB_QUERIES.labels("meeting-export"), metrics.VIEW_DB_SECONDS.labels("meeting-export"))
+        before  = (series[0].value, series[1].count)
+        client  = APIClient()
+        client.force_authenticate(self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse("meeting-export", args=["ndjson"]))
+            self.assertEqual(series[1].count, before[1])   # nothing observed until the body is done
+            rows = b"".join(response.streaming_content).splitlines()
+            response.close()
+        self.assertEqual(len(rows), 3)
+        self.assertEqual((series[0].value - before[0], series[1].count - before[1]), (len(queries), 1))
+
+    async def test_asgi_requests_get_an_async_body(self):
+        token    = str(RefreshToken.for_user(self.admin).access_token)
+        response = await self.async_client.get(reverse("meeting-export", args=["csv"]),
+                                               headers={"authorization": f"Bearer {token}"})
+        self.assertTrue(response.is_async)
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(body.splitlines()), 4)   # header and three meetings
+
+
+# ===== 10. Utilization rollups =====
+
+class UtilizationRollupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor  = User.objects.create_user("rollup-doctor", password="x")
+        cls.meeting = Meeting.objects.create(scheduled_time=timezone.now(), doctor=cls.doctor)
+
+    def _row(self):
+        return UtilizationDaily.objects.get(user=self.doctor, clinic=None)
+
+    def test_rows_without_a_clinic_are_unique(self):
+        row = self._row()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            UtilizationDaily.objects.create(day=row.day, user=self.doctor, role=row.role,
+                                            appointment_type=row.appointment_type)
+
+    def test_saves_that_leave_the_state_alone_skip_the_rollups(self):
+        meeting        = Meeting.objects.get(pk=self.meeting.pk)
+        meeting.remark = "bring previous lab results"
+        with CaptureQueriesContext(connection) as queries:
+            meeting.save()
+        statements = [q["sql"] for q in queries if "SAVEPOINT" not in q["sql"]]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith("UPDATE"))
+        self.assertNotIn('"status"', statements[0])
+        self.assertEqual(Meeting.objects.get(pk=self.meeting.pk).remark, "bring previous lab results")
+
+    def test_an_unchanged_save_does_not_undo_a_concurrent_status_change(self):
+        stale = Meeting.objects.get(pk=self.meeting.pk)
+        fresh = Meeting.objects.get(pk=self.meeting.pk)
+        fresh.status = "cancelled"
+        fresh.save()
+        stale.remark = "late note"
+        stale.save()
+
+        self.assertEqual(Meeting.objects.get(pk=self.meeting.pk).status, "cancelled")
+        row = self._row()
+        self.assertEqual((row.meetings, row.scheduled, row.cancelled), (1, 0, 1))
+
+        stale.refresh_from_db()
+        stale.status = "scheduled"   # a real change from what was loaded still goes through the rollups
+        stale.save()
+        row = self._row()
+        self.assertEqual((row.meetings, row.scheduled, row.cancelled), (1, 1, 0))
+
+
+# ===== 11. Background jobs =====
+
+class InlineJobTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor  = User.objects.create_user("jobs-doctor", password="x")
+        cls.meeting = Meeting.objects.create(scheduled_time=timezone.now(), doctor=cls.doctor)
+
+    def _end_meeting(self):
+        client = APIClient()
+        client.force_authenticate(self.doctor)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse("meeting-end"), {
+                "meeting_id": self.meeting.pk, "speech_to_text": "Patient reports a sore throat.",
+            }, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_ended_meetings_wait_for_a_worker_by_default(self):
+        self._end_meeting()
+        self.assertEqual(list(Job.objects.filter(kind="search.index").values_list("status", flat=True)), ["queued"])
+        self.assertEqual(search.search("throat"), [])
+
+    @override_settings(JOBS_INLINE=True)
+    def test_inline_jobs_run_after_commit(self):
+        self._end_meeting()
+        self.assertFalse(Job.objects.filter(kind="search.index").exists())
+        self.assertEqual([hit.meeting_id for hit in search.search("throat")], [self.meeting.pk])
+
+    @override_settings(JOBS_INLINE=True)
+    def test_inline_failures_and_dedicated_or_delayed_jobs_are_queued(self):
+        handler = mock.patch.object(jobs.TYPES["search.index"], "handler", side_effect=RuntimeError("db down"))
+        with handler, self.assertLogs("consultation.jobs", "WARNING"), self.captureOnCommitCallbacks(execute=True):
+            queued = [jobs.enqueue("scheduler.sync", {"meeting_ids": [self.meeting.pk]}),
+                      jobs.enqueue("meeting.reminder", {"meeting_ids": []}, delay=60)]
+            self.assertIsNone(jobs.enqueue("search.index", {"meeting_id": self.meeting.pk}))
+        failed = Job.objects.get(kind="search.index")
+        self.assertEqual((failed.status, failed.attempts), ("queued", 1))
+        self.assertIn("db down", failed.last_error)
+        self.assertEqual(Job.objects.filter(pk__in=[job.pk for job in queued], status="queued").count(), 2)
+
+
+class SchedulerSyncTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user("sync-doctor", password="x")
+
+    def _book(self):
+        return Meeting.objects.create(scheduled_time=timezone.now() + timedelta(hours=1), doctor=self.doctor)
+
+    def test_saves_queue_syncs_only_when_a_scheduler_runs(self):
+        self._book()
+        self.assertFalse(Job.objects.filter(kind="scheduler.sync").exists())
+        with self.settings(MEETING_SCHEDULER=True):
+            meeting = self._book()
+        self.assertEqual(list(Job.objects.filter(kind="scheduler.sync").values_list("payload", flat=True)),
+                         [{"meeting_ids": [meeting.pk]}])
+
+    def test_purge_drops_stale_unclaimed_syncs(self):
+        old   = timezone.now() - timedelta(hours=25)
+        stale = jobs.enqueue("scheduler.sync", {"meeting_ids": [1]})
+        fresh = jobs.enqueue("scheduler.sync", {"meeting_ids": [2]})
+        other = jobs.enqueue("meeting.reminder", {"meeting_ids": [1]})
+        Job.objects.filter(pk__in=[stale.pk, other.pk]).update(created_at=old)
+        self.assertEqual(jobs.purge(hours=24), 1)
+        self.assertEqual(set(Job.objects.values_list("pk", flat=True)), {fresh.pk, other.pk})
+
+
+# ===== 12. Admin changelists =====
+
+class AdminChangelistTests(TestCase):
+    """Changelist query counts must not grow with the rows on the page (no per-row queries)."""
+
+    ROWS = 110
+
+    @classmethod
+    def setUpTestData(cls):
+        now     = timezone.now()
+        clinics = Clinic.objects.bulk_create([Clinic(clinic_id=f"admin-{i}", name=f"Clinic {i}") for i in range(cls.ROWS)])
+        people  = User.objects.bulk_create([
+            User(username=f"admin-{i}", first_name="Test", last_name=str(i)) for i in range(3 * cls.ROWS)
+        ])
+        UserProfile.objects.bulk_create([
+            UserProfile(user=person, role=("doctor", "sales", "patient")[i % 3], clinic=clinics[i % cls.ROWS])
+            for i, person in enumerate(people)
+        ])
+        doctors, reps, patients = people[0::3], people[1::3], people[2::3]
+        DoctorAvailability.objects.bulk_create([
+            DoctorAvailability(doctor=doctor, clinic=clinics[i], day_of_week=i % 5, start_time="09:00", end_time="17:00")
+            for i, doctor in enumerate(doctors)
+        ])
+        meetings = Meeting.objects.bulk_create([
+            Meeting(room_id=f"admin-{i}", scheduled_time=now - timedelta(minutes=i), status="ended",
+                    patient=patients[i], doctor=doctors[i], sales=reps[i], clinic=clinics[i],
+                    speech_to_text="Doctor: how are you feeling today?")
+            for i in range(cls.ROWS)
+        ])
+        TranscriptArchive.objects.bulk_create([TranscriptArchive.pack(m.pk, "Doctor: fine.") for m in meetings])
+        Job.objects.bulk_create([
+            Job(kind="search.index", payload={"meeting_id": m.pk}, status="failed", last_error="Traceback ...")
+            for m in meetings
+        ])
+        cls.staff = User.objects.create_superuser("admin-root", password="x")
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.client.force_login(self.staff)
+        for model in (User, UserProfile, Clinic, DoctorAvailability, Meeting, TranscriptArchive, Job):
+            with self.subTest(model=model._meta.label):
+                url         = reverse(f"admin:{model._meta.app_label}_{model._meta.model_name}_changelist")
+                model_admin = admin.site._registry[model]
+                with mock.patch.object(model_admin, "list_per_page", 10), \
+                        CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(self.client.get(url).status_code, 200)
+                with mock.patch.object(model_admin, "list_per_page", 100), self.assertNumQueries(len(queries)):
+                    response = self.client.get(url)
+                self.assertEqual(len(response.context["cl"].result_list), 100)
+
+
+class AdminTranscriptSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser("search-root", password="x")
+        now       = timezone.now()
+        cls.ended, cls.cancelled, cls.named = Meeting.objects.bulk_create([
+            Meeting(room_id="throat-a", scheduled_time=now, status="ended"),
+            Meeting(room_id="throat-b", scheduled_time=now, status="cancelled"),
+            Meeting(room_id="throat-c", scheduled_time=now, status="ended", appointment_reason="throat"),
+        ])
+        for meeting in (cls.ended, cls.cancelled):
+            search.replace(meeting.pk, "Patient reports a sore throat.")
+
+    def _changelist(self, **params):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("admin:consultation_meeting_changelist"), params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(meeting.pk for meeting in response.context["cl"].result_list)
+
+    def test_transcript_hits_respect_active_filters(self):
+        everything = sorted([self.ended.pk, self.cancelled.pk, self.named.pk])
+        self.assertEqual(self._changelist(q="sore"), sorted([self.ended.pk, self.cancelled.pk]))
+        self.assertEqual(self._changelist(q="throat"), everything)
+        self.assertEqual(self._changelist(q="throat", status__exact="ended"), sorted([self.ended.pk, self.named.pk]))
+        self.assertEqual(self._changelist(q="sore", status__exact="cancelled"), [self.cancelled.pk])
+
+
+# ===== 13. Call signalling =====
+
+@override_settings(CALL_HEARTBEAT_INTERVAL=0)
+class CallSignallingTests(SimpleTestCase):
+
+    def setUp(self):
+        _reset_registry()
+        self.addCleanup(_reset_registry)
+        self.addCleanup(RoomManager._rooms.clear)
+
+    async def _join(self, name, room="signal", subprotocols=None, features=None):
+        communicator = WebsocketCommunicator(application, f"/ws/call/{room}/", subprotocols=subprotocols)
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        communicator.subprotocol = subprotocol
+        join = {"type": "join", "name": name, "role": "patient"}
+        if features is not None:
+            join["features"] = features
+        await self._send(communicator, join)
+        assigned = await self._receive(communicator)
+        self.assertEqual(assigned["type"], "assigned")
+        communicator.peer_id = assigned["id"]
+        return communicator
+
+    async def _send(self, communicator, payload):
+        if communicator.subprotocol == consumers.MSGPACK_SUBPROTOCOL:
+            await communicator.send_to(bytes_data=pack(payload))
+        else:
+            await communicator.send_json_to(payload)
+
+    async def _receive(self, communicator, timeout=2):
+        output = await communicator.receive_output(timeout)
+        self.assertEqual(output["type"], "websocket.send")
+        if output.get("bytes") is not None:
+            return unpack(output["bytes"])
+        return json.loads(output["text"])
+
+    async def _drain_joins(self, *communicators):
+        """Skip the peer_joined announcements later joiners caused."""
+        for communicator in communicators:
+            while not await communicator.receive_nothing(0.05):
+                self.assertEqual((await self._receive(communicator))["type"], "peer_joined")
+
+    async def test_non_string_types_are_ignored(self):
+        alice = await self._join("A")
+        bob   = await self._join("B")
+        await self._drain_joins(alice)
+        other = consumers._SIGNAL_COUNTERS["other"].value
+        for bad in ([], {"nested": 1}, 7, None):
+            await self._send(alice, {"type": bad, "text": "x"})
+        await self._send(alice, {"type": "chat", "text": "still here"})
+        self.assertEqual((await self._receive(bob))["text"], "still here")
+        self.assertEqual(consumers._SIGNAL_COUNTERS["other"].value - other, 4)
+        await alice.disconnect()
+        await bob.disconnect()
+
+    def _candidate(self, n):
+        return {"candidate": f"candidate:{n} 1 udp 2122260223 10.0.0.{n} 5000{n} typ host", "sdpMLineIndex": 0}
+
+    async def test_trickled_candidates_arrive_as_one_batch(self):
+        alice = await self._join("A")
+        bob   = await self._join("B", features=["ice_batch"])
+        await self._drain_joins(alice)
+        for n in range(3):
+            await self._send(alice, {"type": "ice", "to": bob.peer_id, "candidate": self._candidate(n)})
+        batch = await self._receive(bob)
+        self.assertEqual(batch, {
+            "type": "ice_batch", "from": alice.peer_id,
+            "candidates": [self._candidate(n) for n in range(3)],
+        })
+        self.assertTrue(await bob.receive_nothing(0.1))
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_queued_candidates_are_flushed_before_an_offer(self):
+        alice = await self._join("A")
+        bob   = await self._join("B", features=["ice_batch"])
+        await self._drain_joins(alice)
+        with mock.patch.object(consumers, "_ICE_BATCH_WINDOW", 60):
+            for n in range(2):
+                await self._send(alice, {"type": "ice", "to": bob.peer_id, "candidate": self._candidate(n)})
+            await self._send(alice, {"type": "offer", "to": bob.peer_id, "sdp": "v=0"})
+            self.assertEqual((await self._receive(bob))["type"], "ice_batch")
+            self.assertEqual((await self._receive(bob))["type"], "offer")
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_ice_with_extra_fields_is_forwarded_whole(self):
+        alice = await self._join("A")
+        bob   = await self._join("B", features=["ice_batch"])
+        await self._drain_joins(alice)
+        with mock.patch.object(consumers, "_ICE_BATCH_WINDOW", 60):
+            await self._send(alice, {"type": "ice", "to": bob.peer_id, "candidate": self._candidate(0)})
+            await self._send(alice, {"type": "ice", "to": bob.peer_id, "candidate": self._candidate(1), "ufrag": "x1"})
+            held = await self._receive(bob)
+            self.assertEqual(held, {"type": "ice", "candidate": self._candidate(0), "from": alice.peer_id})
+            whole = await self._receive(bob)
+            self.assertEqual(whole, {"type": "ice", "candidate": self._candidate(1), "ufrag": "x1", "from": alice.peer_id})
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_clients_without_batch_support_get_single_candidates(self):
+        alice = await self._join("A", features=["ice_batch"])
+        carol = await self._join("C")
+        await self._drain_joins(alice)
+        candidates = [self._candidate(n) for n in range(3)]
+        await self._send(alice, {"type": "ice_batch", "to": carol.peer_id, "candidates": candidates})
+        received = [await self._receive(carol) for _ in candidates]
+        self.assertEqual(received, [{"type": "ice", "candidate": c, "from": alice.peer_id} for c in candidates])
+        await alice.disconnect()
+        await carol.disconnect()
+
+    async def test_oversized_batches_are_split_not_truncated(self):
+        alice = await self._join("A")
+        bob   = await self._join("B", features=["ice_batch"])
+        await self._drain_joins(alice)
+        candidates = [self._candidate(n) for n in range(2 * consumers._ICE_BATCH_MAX + 1)]
+        await self._send(alice, {"type": "ice_batch", "to": bob.peer_id, "candidates": candidates})
+        received = []
+        while len(received) < len(candidates):
+            message = await self._receive(bob)
+            batch = message["candidates"] if message["type"] == "ice_batch" else [message["candidate"]]
+            self.assertLessEqual(len(batch), consumers._ICE_BATCH_MAX)
+            received.extend(batch)
+        self.assertEqual(received, candidates)
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_msgpack_subprotocol_is_negotiated(self):
+        binary = await self._join("A", subprotocols=["msgpack"])
+        text   = await self._join("B")
+        self.assertEqual(binary.subprotocol, consumers.MSGPACK_SUBPROTOCOL)
+        self.assertIsNone(text.subprotocol)
+        with override_settings(SIGNALLING_MSGPACK=False):
+            fallback = await self._join("C", subprotocols=["msgpack"])
+        self.assertIsNone(fallback.subprotocol)
+        for communicator in (binary, text, fallback):
+            await communicator.disconnect()
+
+    async def test_json_and_msgpack_clients_share_a_room(self):
+        alice = await self._join("A")
+        bob   = await self._join("B", subprotocols=["msgpack"])
+        await self._drain_joins(alice)
+        await self._send(alice, {"type": "chat", "text": "hi from json"})
+        output = await bob.receive_output(2)
+        self.assertEqual(unpack(output["bytes"])["text"], "hi from json")
+        await self._send(bob, {"type": "offer", "to": alice.peer_id, "sdp": "v=0"})
+        output = await alice.receive_output(2)
+        self.assertEqual(json.loads(output["text"]), {"type": "offer", "sdp": "v=0", "from": bob.peer_id})
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_msgpack_values_without_a_json_form_are_rejected(self):
+        alice = await self._join("A")
+        bob   = await self._join("B", subprotocols=["msgpack"])
+        await self._drain_joins(alice)
+        invalid = consumers._SIGNAL_COUNTERS["invalid"].value
+        await self._send(bob, {"type": "offer", "to": alice.peer_id, "sdp": b"\x00\x01"})
+        await self._send(bob, {"type": "answer", "to": alice.peer_id, "sdp": {1: "int key"}})
+        await self._send(bob, {"type": "answer", "to": alice.peer_id, "sdp": "v=0"})
+        self.assertEqual(await self._receive(alice), {"type": "answer", "sdp": "v=0", "from": bob.peer_id})
+        self.assertEqual(consumers._SIGNAL_COUNTERS["invalid"].value - invalid, 2)
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_a_broadcast_is_encoded_once_for_the_whole_room(self):
+        alice  = await self._join("A")
+        others = [await self._join(name) for name in "BCDE"]
+        binary = await self._join("F", subprotocols=["msgpack"])
+        await self._drain_joins(alice, *others)
+        with mock.patch.object(encoding, "encode", wraps=encoding.encode) as encode_, \
+                mock.patch.object(encoding, "pack", wraps=encoding.pack) as pack_:
+            await self._send(alice, {"type": "chat", "text": "once"})
+            texts  = [(await peer.receive_output(2))["text"] for peer in others]
+            packed = (await binary.receive_output(2))["bytes"]
+        self.assertEqual((encode_.call_count, pack_.call_count), (1, 1))
+        self.assertEqual(len(set(texts)), 1)
+        self.assertEqual(unpack(packed), json.loads(texts[0]))
+        for communicator in (alice, *others, binary):
+            await communicator.disconnect()
+
+
+class FrameTests(SimpleTestCase):
+    """pick_frame() forwards the receiver's pre-encoded format and converts only when it is missing."""
+
+    payload = {"type": "chat", "text": "héllo"}
+
+    def test_event_frames_carry_each_format_in_use(self):
+        self.assertEqual(encoding.event_frames(self.payload), {"text": encode(self.payload)})
+        frames = encoding.event_frames(self.payload, binary=True)
+        self.assertEqual((json.loads(frames["text"]), unpack(frames["bytes"])), (self.payload, self.payload))
+
+    def test_present_frames_are_forwarded_as_is(self):
+        frames = encoding.event_frames(self.payload, binary=True)
+        with mock.patch.object(encoding, "encode") as encode_, mock.patch.object(encoding, "pack") as pack_:
+            self.assertIs(encoding.pick_frame(frames, binary=False), frames["text"])
+            self.assertIs(encoding.pick_frame(frames, binary=True), frames["bytes"])
+        encode_.assert_not_called()
+        pack_.assert_not_called()
+
+    def test_missing_formats_are_converted(self):
+        text_only = encoding.event_frames(self.payload)
+        self.assertEqual(unpack(encoding.pick_frame(text_only, binary=True)), self.payload)
+        bytes_only = {"bytes": pack(self.payload)}
+        self.assertEqual(json.loads(encoding.pick_frame(bytes_only, binary=False)), self.payload)
+        legacy = {"payload": self.payload}   # queued by a worker running older code
+        self.assertEqual(json.loads(encoding.pick_frame(legacy, binary=False)), self.payload)
+        self.assertEqual(unpack(encoding.pick_frame(legacy, binary=True)), self.payload)
+
+
+# ===== 14. Outbound queues =====
+
+class OutboundQueueTests(SimpleTestCase):
+    """put() never awaits, so frames stay queued until the test yields to the writer."""
+
+    def _queue(self, **kwargs):
+        sent  = []
+        async def send(text):
+            sent.append(text)
+        queue = OutboundQueue(send, **kwargs)
+        self.addCleanup(queue.close)
+        return queue, sent
+
+    async def _drain(self):
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+    async def test_frames_go_out_by_priority_then_in_order(self):
+        queue, sent = self._queue()
+        for text, priority in (("i1", INTERIM), ("c1", CHAT), ("f1", FINAL), ("s1", SIGNALLING),
+                               ("c2", CHAT), ("s2", SIGNALLING)):
+            self.assertTrue(queue.put(text, priority))
+        await self._drain()
+        self.assertEqual(sent, ["s1", "s2", "f1", "c1", "c2", "i1"])
+
+    async def test_a_newer_interim_replaces_the_queued_one_for_its_speaker(self):
+        drops = []
+        queue, sent = self._queue(on_drop=lambda priority, count: drops.append((priority, count)))
+        queue.put("doctor 1", INTERIM, "doctor")
+        queue.put("patient 1", INTERIM, "patient")
+        queue.put("doctor 2", INTERIM, "doctor")
+        await self._drain()
+        self.assertEqual(sent, ["patient 1", "doctor 2"])
+        self.assertEqual(drops, [(INTERIM, 1)])
+
+    async def test_over_budget_sheds_the_lowest_priority_first(self):
+        drops = []
+        queue, sent = self._queue(budget=30, on_drop=lambda priority, count: drops.append((priority, count)))
+        queue.put("f" * 10, FINAL)
+        queue.put("c" * 10, CHAT)
+        queue.put("i" * 10, INTERIM)
+        self.assertTrue(queue.put("s" * 10, SIGNALLING))
+        self.assertEqual(drops, [(INTERIM, 1)])
+        self.assertTrue(queue.put("t" * 10, SIGNALLING))
+        self.assertEqual(drops, [(INTERIM, 1), (CHAT, 1)])
+        self.assertFalse(queue.put("j" * 10, INTERIM))   # nothing lower left to shed
+        await self._drain()
+        self.assertEqual(sent, ["s" * 10, "t" * 10, "f" * 10])
+        self.assertEqual(queue.dropped, 3)
+
+    async def test_signalling_is_never_shed(self):
+        queue, sent = self._queue(budget=10, hard_limit=1000)
+        for n in range(5):
+            self.assertTrue(queue.put(f"signal {n:03}", SIGNALLING))
+        self.assertEqual(queue.queued, 50)
+        await self._drain()
+        self.assertEqual(sent, [f"signal {n:03}" for n in range(5)])
+        self.assertEqual(queue.dropped, 0)
+
+    async def test_signalling_past_the_hard_limit_closes_the_connection(self):
+        overflow = mock.AsyncMock()
+        queue, sent = self._queue(budget=10, hard_limit=25, on_overflow=overflow)
+        self.assertTrue(queue.put("a" * 10))
+        self.assertTrue(queue.put("b" * 10))
+        self.assertFalse(queue.put("c" * 10))
+        self.assertFalse(queue.put("d" * 10, SIGNALLING))   # closed: no more frames
+        await self._drain()
+        overflow.assert_awaited_once()
+        self.assertEqual(sent, [])
+
+
+@override_settings(CALL_HEARTBEAT_INTERVAL=0)
+class SlowClientTests(SimpleTestCase):
+
+    def setUp(self):
+        _reset_registry()
+        self.addCleanup(_reset_registry)
+        self.addCleanup(RoomManager._rooms.clear)
+
+    async def test_a_slow_peer_does_not_delay_its_room_mates(self):
+        app   = consumers.CallConsumer.as_asgi()
+        fast  = [_AsgiPeer(app, "slowroom") for _ in range(2)]
+        slow  = _AsgiPeer(app, "slowroom", delay=0.5)
+        for peer in (*fast, slow):
+            await peer.join()
+        layer = get_channel_layer()
+        for n in range(5):
+            await layer.group_send("call_slowroom", {
+                "type": "relay_message", "priority": CHAT,
+                "text": encode({"type": "chat", "text": str(n), "t": time.perf_counter()}),
+            })
+        await asyncio.sleep(0.2)
+        for peer in fast:
+            self.assertEqual(peer.received.get("chat"), 5)
+            self.assertLess(max(peer.latency), 0.2)
+        self.assertLess(slow.received.get("chat", 0), 5)   # still writing its first frames
+        for peer in (*fast, slow):
+            await peer.close()
+
+    async def test_a_slow_client_does_not_hold_up_the_stt_relay_loop(self):
+        upstream  = _FakeUpstream()
+        real_send = consumers.AsyncWebsocketConsumer.send
+
+        async def slow_send(consumer, text_data=None, bytes_data=None, close=False):
+            if text_data and '"transcript"' in text_data:
+                await asyncio.sleep(1)
+            await real_send(consumer, text_data, bytes_data, close)
+
+        with self.settings(STT_RECONNECT_BACKOFF=0.01), \
+                mock.patch.object(consumers.AsyncWebsocketConsumer, "send", slow_send), \
+                mock.patch.object(consumers.STTConsumerRoom, "_open_deepgram", return_value=upstream):
+            communicator = WebsocketCommunicator(consumers.STTConsumerRoom.as_asgi(), "/ws/stt/room/?role=doctor&name=A")
+            self.assertTrue((await communicator.connect())[0])
+            self.assertEqual((await communicator.receive_json_from(timeout=2))["type"], "stt_ready")
+            for n in range(20):
+                upstream.messages.put_nowait(json.dumps({
+                    "type": "Results", "is_final": True, "start": n, "duration": 1,
+                    "channel": {"alternatives": [{"transcript": f"words {n}"}]},
+                }))
+            await asyncio.sleep(0.2)
+            self.assertTrue(upstream.messages.empty())   # all 20 read while the client took one
+            await communicator.disconnect()
+
+
+# ===== 15. STT audio buffers =====
+
+def _pcm(*samples):
+    return np.array(samples, dtype="<i2").tobytes()
+
+
+def _split(stereo):
+    """The two mono channels of interleaved linear16 ``stereo``, as sample lists."""
+    frames = np.frombuffer(stereo, dtype="<i2").reshape(-1, 2)
+    return frames[:, 0].tolist(), frames[:, 1].tolist()
+
+
+class ReplayBufferTests(SimpleTestCase):
+    """10 bytes per second, so a 10-byte chunk is one second of audio."""
+
+    def _buffer(self, **kwargs):
+        return ReplayBuffer(bytes_per_second=10, **kwargs)
+
+    def test_rewind_replays_the_unfinalised_utterance_and_the_outage(self):
+        replay = self._buffer()
+        for data in (b"a" * 10, b"b" * 10):
+            replay.append(data, received_at=0)
+            replay.mark_sent()
+        self.assertTrue(replay.accept(0, 1.5, is_final=True))   # a and half of b transcribed
+        replay.append(b"c" * 10, received_at=1)                   # socket down: recorded, not sent
+        self.assertEqual(replay.rewind(), 2.0)
+        self.assertEqual(replay.next_unsent(), (b"b" * 10, 0))
+        self.assertEqual(replay.next_unsent(), (b"c" * 10, 1))
+        self.assertIsNone(replay.next_unsent())
+
+    def test_accept_skips_results_for_audio_already_finalised(self):
+        replay = self._buffer()
+        for data in (b"a" * 10, b"b" * 10):
+            replay.append(data, received_at=0)
+            replay.mark_sent()
+        replay.accept(0, 1.5, is_final=True)
+        replay.rewind()   # the new connection's t=0 is session second 1
+        self.assertFalse(replay.accept(0, 0.5, is_final=True))
+        self.assertTrue(replay.accept(0, 0.8, is_final=False))
+        self.assertTrue(replay.accept(0, 1, is_final=True))
+        self.assertFalse(replay.accept(0.5, 0.5, is_final=False))
+
+    def test_audio_past_the_window_is_trimmed_and_counted_if_unsent(self):
+        replay  = self._buffer(window=2)
+        expired = [replay.append(bytes([n]) * 10, received_at=n) for n in range(5)]
+        self.assertEqual(expired, [0, 0, 1, 1, 1])
+        self.assertEqual(len(replay.chunks), 2)
+        self.assertEqual(replay.next_unsent(), (bytes([3]) * 10, 3))
+        replay.mark_sent()
+        self.assertEqual(replay.append(b"x" * 10, received_at=5), 0)   # sent audio ages out silently
+        self.assertEqual(len(replay.chunks), 2)
+
+    def test_finals_are_tracked_per_channel(self):
+        replay = self._buffer(channels=2)
+        replay.append(b"s" * 20, received_at=0)
+        replay.mark_sent()
+        self.assertTrue(replay.accept(0, 2, is_final=True, channel=0))
+        self.assertTrue(replay.accept(0, 1, is_final=True, channel=1))
+        self.assertFalse(replay.accept(0, 1, is_final=False, channel=0))
+        self.assertEqual(len(replay.chunks), 1)   # channel 1 still needs the second half
+        replay.accept(1, 1, is_final=True, channel=1)
+        self.assertEqual(len(replay.chunks), 0)
+
+
+class StereoInterleaverTests(SimpleTestCase):
+
+    def test_samples_are_paired_in_arrival_order(self):
+        mixer = StereoInterleaver()
+        self.assertEqual(mixer.push(0, _pcm(1, 2, 3, 4)), b"")   # waits for the other side
+        stereo = mixer.push(1, _pcm(-1, -2, -3))
+        self.assertEqual(_split(stereo), ([1, 2, 3], [-1, -2, -3]))
+        self.assertEqual(_split(mixer.push(1, _pcm(-4, -5))), ([4], [-4]))
+        self.assertEqual(mixer.silence_bytes, 0)
+
+    def test_a_lagging_side_is_filled_with_silence(self):
+        mixer = StereoInterleaver(max_lag=0.001)   # 16 samples
+        self.assertEqual(mixer.push(0, _pcm(*range(1, 17))), b"")
+        stereo = mixer.push(0, _pcm(17))
+        self.assertEqual(_split(stereo), (list(range(1, 18)), [0] * 17))
+        self.assertEqual(mixer.silence_bytes, 17 * 2)
+        self.assertEqual(_split(mixer.push(1, _pcm(5)) + mixer.push(0, _pcm(6))), ([6], [5]))
+
+    def test_flush_emits_what_is_left(self):
+        mixer = StereoInterleaver()
+        mixer.push(0, _pcm(1, 2, 3))
+        mixer.push(1, _pcm(9))
+        self.assertEqual(_split(mixer.flush()), ([2, 3], [0, 0]))
+        self.assertEqual(mixer.flush(), b"")
+
+    def test_half_samples_wait_for_their_second_byte(self):
+        mixer  = StereoInterleaver()
+        whole  = _pcm(0x0102, 0x0304)
+        mixer.push(0, whole[:3])
+        stereo = mixer.push(1, whole[:3])
+        self.assertEqual(_split(stereo), ([0x0102], [0x0102]))
+        mixer.push(0, whole[3:])
+        self.assertEqual(_split(mixer.push(1, whole[3:])), ([0x0304], [0x0304]))
+
+
+class MultichannelSTTTests(SimpleTestCase):
+
+    def setUp(self):
+        _reset_registry()
+        self.addCleanup(_reset_registry)
+        patcher = mock.patch.object(consumers, "deepgram_breaker", CircuitBreaker(failure_threshold=5))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _result(self, channel, text, start, duration):
+        return json.dumps({
+            "type": "Results", "is_final": True, "start": start, "duration": duration,
+            "channel_index": [channel, 2], "channel": {"alternatives": [{"transcript": text}]},
+        })
+
+    async def test_one_stream_carries_both_speakers_with_their_own_finals(self):
+        upstream = _FakeUpstream()
+        with self.settings(STT_MULTICHANNEL=True, WS_OUTBOUND_BUDGET=0), \
+                mock.patch.object(consumers.STTConsumer, "_open_deepgram", return_value=upstream) as dial:
+            communicator = WebsocketCommunicator(consumers.STTConsumer.as_asgi(), "/ws/stt/")
+            self.assertTrue((await communicator.connect())[0])
+            self.assertEqual((await communicator.receive_json_from(timeout=2))["type"], "stt_ready")
+            self.assertEqual(dial.call_count, 1)
+
+            await communicator.send_to(bytes_data=b"\x01" + _pcm(1, 2))
+            await communicator.send_to(bytes_data=b"\x02" + _pcm(-1, -2))
+            await communicator.receive_nothing(timeout=0.05)
+            self.assertEqual(_split(b"".join(upstream.sent)), ([1, 2], [-1, -2]))
+
+            # A final on one channel must not hide the other speaker's
+            # results for the same stretch of audio.
+            upstream.messages.put_nowait(self._result(0, "doctor words", 0, 1))
+            upstream.messages.put_nowait(self._result(1, "patient words", 0, 1))
+            upstream.messages.put_nowait(self._result(0, "doctor again", 0, 0.5))   # already finalised
+            upstream.messages.put_nowait(self._result(1, "patient more", 1, 1))
+            received = [await communicator.receive_json_from(timeout=2) for _ in range(3)]
+            self.assertEqual([(m["speaker"], m["text"]) for m in received], [
+                ("Doctor", "doctor words"), ("Patient", "patient words"), ("Patient", "patient more"),
+            ])
+            self.assertTrue(await communicator.receive_nothing(timeout=0.05))
+            await communicator.disconnect()
+
+
+# ===== 16. Transcript compaction =====
+
+class TranscriptArchiveTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user("compact-doctor", password="x")
+        now        = timezone.now()
+        meetings   = Meeting.objects.bulk_create([
+            Meeting(room_id=f"compact-{i}", scheduled_time=now, status="ended", doctor=cls.doctor,
+                    speech_to_text=f"Doctor: visit {i}, how is the cough?\nPatient: better — merci.")
+            for i in range(3)
+        ] + [
+            Meeting(room_id="compact-recent", scheduled_time=now, status="ended", doctor=cls.doctor, speech_to_text="Doctor: just now."),
+            Meeting(room_id="compact-live",   scheduled_time=now, status="started", doctor=cls.doctor, speech_to_text="Doctor: still talking."),
+            Meeting(room_id="compact-empty",  scheduled_time=now, status="ended", doctor=cls.doctor),
+        ])
+        # updated_at is auto_now; age the rows compact_transcripts should pick up.
+        Meeting.objects.exclude(room_id="compact-recent").update(updated_at=now - timedelta(days=2))
+        cls.old = [m.pk for m in meetings[:3]]
+
+    def _compact(self, *args):
+        out = io.StringIO()
+        call_command("compact_transcripts", *args, stdout=out)
+        return out.getvalue()
+
+    def test_pack_round_trips_unicode_text(self):
+        text    = "Patient: ça fait mal ici — 頭痛 🤒\n" * 50
+        archive = TranscriptArchive.pack(self.old[0], text)
+        self.assertEqual(archive.raw_size, len(text.encode("utf-8")))
+        self.assertLess(len(archive.data), archive.raw_size)
+        self.assertEqual(archive.text(), text)
+        archive.save()
+        self.assertEqual(TranscriptArchive.objects.get(pk=self.old[0]).text(), text)
+
+    def test_compaction_moves_only_old_ended_transcripts_in_batches(self):
+        originals = dict(Meeting.objects.values_list("room_id", "speech_to_text"))
+        with mock.patch.object(TranscriptArchive.objects, "bulk_create", wraps=TranscriptArchive.objects.bulk_create) as create:
+            output = self._compact("--batch-size", "2")
+        self.assertEqual([len(call.args[0]) for call in create.call_args_list], [2, 1])
+        self.assertIn("compacted 3 transcripts", output)
+        self.assertEqual(sorted(TranscriptArchive.objects.values_list("pk", flat=True)), sorted(self.old))
+        for meeting in Meeting.objects.all():
+            compacted = meeting.pk in self.old
+            self.assertEqual(meeting.transcript_compacted, compacted, meeting.room_id)
+            self.assertEqual(meeting.speech_to_text, "" if compacted else originals[meeting.room_id])
+            self.assertEqual(meeting.transcript, originals[meeting.room_id])
+        self.assertIn("compacted 0 transcripts", self._compact())
+
+    def test_limit_stops_after_that_many_meetings(self):
+        self.assertIn("compacted 2 transcripts", self._compact("--batch-size", "5", "--limit", "2"))
+        self.assertEqual(TranscriptArchive.objects.count(), 2)
+
+    def test_dry_run_only_counts(self):
+        output = self._compact("--dry-run")
+        self.assertTrue(output.startswith("3 meetings,"), output)
+        self.assertFalse(TranscriptArchive.objects.exists())
+        self.assertFalse(Meeting.objects.filter(transcript_compacted=True).exists())
+
+    def test_writing_a_compacted_transcript_makes_it_hot_again(self):
+        self._compact()
+        meeting = Meeting.objects.get(pk=self.old[0])
+        meeting.transcript = meeting.transcript + "\nDoctor: one more thing."
+        meeting.save()
+        meeting.refresh_from_db()
+        self.assertFalse(meeting.transcript_compacted)
+        self.assertTrue(meeting.speech_to_text.endswith("one more thing."))
+        self.assertTrue(meeting.speech_to_text.startswith("Doctor: visit 0"))
+        self.assertFalse(TranscriptArchive.objects.filter(pk=meeting.pk).exists())
+
+
+# ===== 17. Re-transcription =====
+
+SECOND = archive.BYTES_PER_SECOND
+
+
+def _archive_streams(root, room, streams):
+    """Archive ``{speaker: [(received_at, seconds)]}`` for ``room`` under ``root``."""
+    archiver = archive.AudioArchiver(root)
+    for speaker, chunks in streams.items():
+        archiver.describe(room, speaker, label=speaker)
+        for received_at, seconds in chunks:
+            archiver.write(room, speaker, b"\x00\x01" * int(seconds * SECOND / 2), received_at)
+        archiver.close_stream(room, speaker)
+    archiver.close()
+
+
+class RetranscribePlanTests(SimpleTestCase):
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = Path(root.name)
+
+    def test_units_break_at_gaps(self):
+        _archive_streams(self.root, "room", {
+            "Doctor" : [(100, 1), (101, 1), (102, 1), (110, 1), (111, 1)],
+            "Patient": [(100.5, 0.5), (101, 1)],
+        })
+        self.assertEqual(plan_units("room", self.root, gap_seconds=2), [
+            ("room", "Doctor", 100, 103, 3.0),
+            ("room", "Doctor", 110, 112, 2.0),
+            ("room", "Patient", 100.5, 102, 1.5),
+        ])
+
+    def test_long_stretches_are_split_at_max_seconds(self):
+        _archive_streams(self.root, "room", {"Doctor": [(100 + n, 1) for n in range(5)]})
+        self.assertEqual(plan_units("room", self.root, max_seconds=2), [
+            ("room", "Doctor", 100, 102, 2.0),
+            ("room", "Doctor", 102, 104, 2.0),
+            ("room", "Doctor", 104, 105, 1.0),
+        ])
+
+    def test_a_room_without_audio_has_no_units(self):
+        self.assertEqual(plan_units("nothing-here", self.root), [])
+
+    def test_checkpoints_round_trip_and_ignore_broken_files(self):
+        checkpoints = Checkpoints(self.root)
+        unit        = ("room/1", "Doctor", 100.0, 103.0, 3.0)
+        self.assertIsNone(checkpoints.load(unit))
+        checkpoints.save(unit, {"lines": [[100.5, "Doctor", "hello"]], "audio_seconds": 3.0})
+        self.assertEqual(checkpoints.load(unit), {"lines": [[100.5, "Doctor", "hello"]], "audio_seconds": 3.0})
+        self.assertEqual(checkpoints.path(unit).parent.name, "room_1")
+        checkpoints.path(unit).write_text("{not json")
+        self.assertIsNone(checkpoints.load(unit))
+
+    def test_previous_transcript_is_kept_once(self):
+        checkpoints = Checkpoints(self.root)
+        checkpoints.save_previous("room", "Doctor: the original")
+        checkpoints.save_previous("room", "Doctor: a rerun's output")
+        self.assertEqual((self.root / "room" / "previous_transcript.txt").read_text(), "Doctor: the original")
+
+    def test_merge_orders_lines_by_time_across_units(self):
+        doctor  = {"lines": [[100.0, "Doctor", "How are you?"], [104.0, "Doctor", "Since when?"]]}
+        patient = {"lines": [[102.0, "Patient", "Coughing."], [106.0, "Patient", "Monday."]]}
+        self.assertEqual(merge_transcript([doctor, patient]), (
+            "Doctor: How are you?\nPatient: Coughing.\nDoctor: Since when?\nPatient: Monday."
+        ))
+        self.assertEqual(merge_transcript([]), "")
+
+
+def _fake_transcribe(unit, root):
+    """transcribe_unit without Whisper: one line per unit."""
+    room, speaker, start, end, audio_seconds = unit
+    return {"lines": [[start, speaker, f"{end - start:.0f}s from {start:.0f}"]], "audio_seconds": audio_seconds}
+
+
+class RetranscribeCommandTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.meeting = Meeting.objects.create(
+            room_id="rt-room", scheduled_time=timezone.now(), status="ended", speech_to_text="Doctor: live text",
+        )
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = Path(root.name)
+        _archive_streams(self.root, "rt-room", {
+            "Doctor" : [(100, 1), (101, 1), (110, 1)],
+            "Patient": [(105, 2)],
+        })
+        archive_root = override_settings(AUDIO_ARCHIVE_ROOT=self.root)
+        archive_root.enable()
+        self.addCleanup(archive_root.disable)
+        # No Whisper here: stub the worker and run the pool in threads.
+        self.transcribe = mock.Mock(side_effect=_fake_transcribe)
+        for patcher in (
+            mock.patch.object(retranscribe_command, "transcribe_unit", self.transcribe),
+            mock.patch.object(retranscribe_command, "importlib"),   # find_spec("whisper") is truthy
+            mock.patch.object(retranscribe_command, "ProcessPoolExecutor",
+                              lambda workers, initializer, initargs: ThreadPoolExecutor(workers)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _run(self, *args):
+        out = io.StringIO()
+        call_command("retranscribe", str(self.meeting.pk), "--workers", "2", *args, stdout=out)
+        return out.getvalue()
+
+    def test_units_are_merged_into_the_transcript(self):
+        self._run()
+        self.assertEqual(self.transcribe.call_count, 3)
+        self.meeting.refresh_from_db()
+        self.assertEqual(self.meeting.speech_to_text, (
+            "Doctor: 2s from 100\nPatient: 2s from 105\nDoctor: 1s from 110"
+        ))
+        kept = self.root / ".retranscribe" / "base" / "rt-room" / "previous_transcript.txt"
+        self.assertEqual(kept.read_text(), "Doctor: live text")
+
+    def test_a_rerun_resumes_from_checkpoints(self):
+        self._run()
+        checkpoints = sorted((self.root / ".retranscribe" / "base" / "rt-room").glob("*.json"))
+        self.assertEqual(len(checkpoints), 3)
+        checkpoints[0].unlink()   # as if the first run stopped before this unit finished
+        self.transcribe.reset_mock()
+        output = self._run()
+        self.assertIn("2 units already checkpointed, 1 to do", output)
+        self.assertEqual(self.transcribe.call_count, 1)
+        self.transcribe.reset_mock()
+        self.assertIn("3 units already checkpointed, 0 to do", self._run())
+        self.transcribe.assert_not_called()
+
+    def test_dry_run_only_plans(self):
+        output = self._run("--dry-run")
+        self.assertIn("1 meetings, 3 units", output)
+        self.transcribe.assert_not_called()
+        self.meeting.refresh_from_db()
+        self.assertEqual(self.meeting.speech_to_text, "Doctor: live text")
+
+
+# ===== 18. Deepgram emulator =====
+
+def _speech(seconds, channels=1, silent=()):
+    """Interleaved linear16 audio: a constant non-zero level, zeros on ``silent`` channels."""
+    frames = np.full((int(seconds * 16000), channels), 1000, dtype="<i2")
+    for channel in silent:
+        frames[:, channel] = 0
+    return frames.tobytes()
+
+
+class DeepgramEmulatorTests(SimpleTestCase):
+
+    async def _stream(self, emulator, channels=1, interim=True):
+        query = f"?encoding=linear16&sample_rate=16000&channels={channels}&interim_results={str(interim).lower()}"
+        return await ws_connect(emulator.url + query)
+
+    async def _results(self, ws, count, timeout=2):
+        return [json.loads(await asyncio.wait_for(ws.recv(), timeout)) for _ in range(count)]
+
+    async def test_interims_then_a_final_per_utterance(self):
+        config = EmulatorConfig(interim_interval=0.5, utterance_seconds=1.0, seed=1)
+        async with DeepgramEmulator(config) as emulator:
+            async with await self._stream(emulator) as ws:
+                for _ in range(4):
+                    await ws.send(_speech(0.25))
+                first, second, final = await self._results(ws, 3)
+        self.assertEqual([m["is_final"] for m in (first, second, final)], [False, False, True])
+        self.assertEqual((first["start"], first["duration"]), (0.0, 0.5))
+        self.assertEqual((final["start"], final["duration"], final["channel_index"]), (0.0, 1.0, [0, 1]))
+        self.assertEqual(final["channel"]["alternatives"][0]["transcript"], DEFAULT_SCRIPT[0])
+        self.assertTrue(DEFAULT_SCRIPT[0].startswith(first["channel"]["alternatives"][0]["transcript"]))
+
+    async def test_silent_channels_produce_no_results(self):
+        config = EmulatorConfig(utterance_seconds=0.5)
+        async with DeepgramEmulator(config) as emulator:
+            async with await self._stream(emulator, channels=2, interim=False) as ws:
+                await ws.send(_speech(0.5, channels=2, silent=(1,)))
+                await ws.send(_speech(0.5, channels=2, silent=(0,)))
+                first, second = await self._results(ws, 2)
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(ws.recv(), 0.1)
+        self.assertEqual([first["channel_index"], second["channel_index"]], [[0, 2], [1, 2]])
+        self.assertEqual(second["start"], 0.5)
+
+    async def test_close_stream_flushes_a_final_and_metadata(self):
+        async with DeepgramEmulator(EmulatorConfig(utterance_seconds=5)) as emulator:
+            async with await self._stream(emulator, interim=False) as ws:
+                await ws.send(_speech(0.3))
+                await ws.send(json.dumps({"type": "CloseStream"}))
+                final, metadata = await self._results(ws, 2)
+                with self.assertRaises(ConnectionClosed):
+                    await asyncio.wait_for(ws.recv(), 2)
+        self.assertTrue(final["is_final"])
+        self.assertEqual(final["duration"], 0.3)
+        self.assertEqual((metadata["type"], metadata["duration"]), ("Metadata", 0.3))
+
+    async def test_idle_streams_and_injected_failures_close_with_1011(self):
+        config = EmulatorConfig(idle_timeout=0.1, disconnect_after=0.5)
+        async with DeepgramEmulator(config) as emulator:
+            async with await self._stream(emulator) as ws:
+                await ws.send(json.dumps({"type": "KeepAlive"}))
+                with self.assertRaises(ConnectionClosed):
+                    await asyncio.wait_for(ws.recv(), 2)
+                self.assertEqual(ws.close_code, 1011)
+            async with await self._stream(emulator, interim=False) as ws:
+                await ws.send(_speech(0.5))
+                with self.assertRaises(ConnectionClosed):
+                    await asyncio.wait_for(ws.recv(), 2)
+                self.assertEqual(ws.close_code, 1011)
+            self.assertEqual(emulator.stats["keepalives"], 1)
+            self.assertEqual(emulator.stats["injected_disconnects"], 1)
+
+    async def test_results_are_held_back_by_the_configured_latency(self):
+        async with DeepgramEmulator(EmulatorConfig(latency=0.2, utterance_seconds=0.5)) as emulator:
+            async with await self._stream(emulator, interim=False) as ws:
+                sent = time.monotonic()
+                await ws.send(_speech(0.5))
+                await self._results(ws, 1)
+                self.assertGreaterEqual(time.monotonic() - sent, 0.2)
+
+    async def test_stt_consumer_transcribes_against_the_emulator(self):
+        _reset_registry()
+        self.addCleanup(_reset_registry)
+        async with DeepgramEmulator(EmulatorConfig(utterance_seconds=0.5, seed=3)) as emulator:
+            with self.settings(DEEPGRAM_URL=emulator.url):
+                communicator = WebsocketCommunicator(consumers.STTConsumerRoom.as_asgi(), "/ws/stt/room/?role=doctor&name=A")
+                self.assertTrue((await communicator.connect())[0])
+                self.assertEqual((await communicator.receive_json_from(timeout=5))["type"], "stt_ready")
+                await communicator.send_to(bytes_data=b"\x01" + _speech(0.5))
+                message = await communicator.receive_json_from(timeout=5)
+                while not message.get("is_final"):
+                    message = await communicator.receive_json_from(timeout=5)
+                self.assertEqual(message["type"], "transcript")
+                self.assertIn(message["text"], DEFAULT_SCRIPT)
+                await communicator.disconnect()
@@ -23,7 +23,11 @@ from .views import (
     MeetingStartView,
     MeetingEndView,
     MeetingTranscriptAppendView,
+    MeetingExportView,
+    TranscriptSearchView,
+    UtilizationView,
     SocketStatusView,
+    MetricsView,
 )
 
 urlpatterns = [
@@ -34,6 +38,9 @@ urlpatterns = [
     # WebSocket Status
     path("socket-status/", SocketStatusView.as_view(), name="socket-status"),
 
+    # Metrics (Prometheus text format)
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+
     # User management
     path("users/create/",   UserCreateView.as_view(),  name="user-create"),
     path("users/patients/", PatientListView.as_view(), name="patient-list"),
@@ -61,9 +68,12 @@ urlpatterns = [
     path("patient/appointments/", PatientAppointmentListView.as_view(), name="patient-appointments"),
     path("meeting/sales/",        SalesAppointmentListView.as_view(),   name="sales-appointments"),
     path("meetings/",             MeetingListView.as_view(),            name="meeting-list"),
+    path("meetings/export.<str:fmt>", MeetingExportView.as_view(),    name="meeting-export"),
     path("meeting/start/",        MeetingStartView.as_view(),           name="meeting-start"),
     path("meeting/end/",          MeetingEndView.as_view(),             name="meeting-end"),
     path("append-transcript/",    MeetingTranscriptAppendView.as_view(),name="append-transcript"),
+    path("transcripts/search/",   TranscriptSearchView.as_view(),       name="transcript-search"),
+    path("analytics/utilization/", UtilizationView.as_view(),          name="utilization"),
 
     # Wildcard LAST
     path("meeting/<str:meeting_id>/", MeetingDetailView.as_view(), name="meeting-detail"),
@@ -13,6 +13,8 @@ from datetime import datetime, timedelta
 
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 
@@ -22,13 +24,15 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from . import analytics, export, jobs, metrics, search
+from .middleware import TimedStream
 from .models import Clinic, Meeting, UserProfile, DoctorAvailability
 from .serializers import (
     DoctorAvailabilitySerializer,
     MeetingSerializer,
     UserSerializer,
 )
-from .services import create_patient
+from .services import create_patient, is_admin
 
 
 class LoginView(APIView):
@@ -559,7 +563,7 @@ class DoctorAppointmentListView(APIView):
     def get(self, request):
         clinic_id = request.query_params.get("clinic")
         # FIX Bug 4a: added select_related("sales") — prevents N+1 after serializer fix
-        meetings = Meeting.objects.filter(doctor=request.user).select_related("patient", "clinic", "sales")
+        meetings = Meeting.objects.filter(doctor=request.user).select_related("patient", "clinic", "sales", "transcript_archive")
         if clinic_id:
             meetings = meetings.filter(clinic_id=clinic_id)
         return Response(MeetingSerializer(meetings.order_by("scheduled_time"), many=True).data)
@@ -570,7 +574,7 @@ class PatientAppointmentListView(APIView):
 
     def get(self, request):
         # select_related("sales") was already present here — no change needed
-        meetings = Meeting.objects.filter(patient=request.user).select_related("doctor", "clinic", "sales")
+        meetings = Meeting.objects.filter(patient=request.user).select_related("doctor", "clinic", "sales", "transcript_archive")
         return Response(MeetingSerializer(meetings.order_by("scheduled_time"), many=True).data)
 
 
@@ -579,7 +583,7 @@ class SalesAppointmentListView(APIView):
 
     def get(self, request):
         # FIX Bug 4b: added select_related("sales") — prevents N+1 after serializer fix
-        meetings = Meeting.objects.filter(sales=request.user).select_related("patient", "doctor", "clinic", "sales")
+        meetings = Meeting.objects.filter(sales=request.user).select_related("patient", "doctor", "clinic", "sales", "transcript_archive")
         return Response(MeetingSerializer(meetings.order_by("scheduled_time"), many=True).data)
 
 
@@ -591,13 +595,13 @@ class MeetingListView(APIView):
         clinic_id = request.query_params.get("clinic")
 
         if role == "patient":
-            meetings = Meeting.objects.filter(patient=request.user).select_related("doctor", "clinic", "sales")
+            meetings = Meeting.objects.filter(patient=request.user).select_related("doctor", "clinic", "sales", "transcript_archive")
         elif role == "doctor":
-            meetings = Meeting.objects.filter(doctor=request.user).select_related("patient", "clinic", "sales")
+            meetings = Meeting.objects.filter(doctor=request.user).select_related("patient", "clinic", "sales", "transcript_archive")
         elif role == "sales":
-            meetings = Meeting.objects.filter(sales=request.user).select_related("patient", "doctor", "clinic", "sales")
+            meetings = Meeting.objects.filter(sales=request.user).select_related("patient", "doctor", "clinic", "sales", "transcript_archive")
         else:
-            meetings = Meeting.objects.filter(patient=request.user).select_related("doctor", "clinic", "sales")
+            meetings = Meeting.objects.filter(patient=request.user).select_related("doctor", "clinic", "sales", "transcript_archive")
 
         if clinic_id:
             meetings = meetings.filter(clinic_id=clinic_id)
@@ -685,10 +689,15 @@ class MeetingEndView(APIView):
         try:
             meeting_id     = request.data.get("meeting_id")
             speech_to_text = request.data.get("speech_to_text", "")
-            meeting = get_object_or_404(Meeting, meeting_id=meeting_id)
-            meeting.status         = "ended"
-            meeting.speech_to_text = speech_to_text
-            meeting.save()
+            # The stored transcript is about to be replaced; don't read it.
+            meeting = get_object_or_404(Meeting.objects.defer("speech_to_text"), meeting_id=meeting_id)
+            meeting.status     = "ended"
+            meeting.transcript = speech_to_text
+            with transaction.atomic():
+                meeting.save()
+                # Indexing the full transcript runs on a run_jobs worker, not in this request
+                # (or right after commit, with JOBS_INLINE).
+                jobs.enqueue("search.index", {"meeting_id": meeting.meeting_id})
             return Response({"status": "ended", "meeting_id": meeting.meeting_id})
         except Exception:
             print(traceback.format_exc())
@@ -705,25 +714,171 @@ class MeetingTranscriptAppendView(APIView):
             if not meeting_id or not line:
                 return Response({"error": "meeting_id and line are required"}, status=status.HTTP_400_BAD_REQUEST)
             meeting = get_object_or_404(Meeting, meeting_id=meeting_id)
-            meeting.speech_to_text = (f"{meeting.speech_to_text}\n{line}" if meeting.speech_to_text else line)
-            meeting.save()
+            transcript         = meeting.transcript
+            meeting.transcript = f"{transcript}\n{line}" if transcript else line
+            with transaction.atomic():
+                meeting.save()
+                search.append(meeting.meeting_id, line)
             return Response({"status": "appended"})
         except Exception:
             print(traceback.format_exc())
             return Response({"error": "Failed to append transcript"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _sees_all_meetings(user):
+    """Admins and staff may search and export every meeting; others only their own."""
+    return is_admin(user)
+
+
+class MeetingExportView(APIView):
+    """
+    GET /api/meetings/export.csv    (or export.ndjson)
+        ?clinic=<id>&doctor=<id>&sales=<id>&status=ended,cancelled
+        &from=YYYY-MM-DD&to=YYYY-MM-DD&transcripts=1
+
+    Streams every matching meeting (consultation/export.py); the response
+    starts at once and memory stays flat however many rows match. Admins
+    and staff export any meeting, everyone else the ones they took part in.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, fmt):
+        if fmt not in export.ENCODERS:
+            return Response({"error": f"unknown export format {fmt!r}"}, status=status.HTTP_404_NOT_FOUND)
+        params = request.query_params
+        try:
+            filters = {
+                key: int(params[key]) for key in ("clinic", "doctor", "sales") if params.get(key)
+            }
+            for key, name in (("from", "date_from"), ("to", "date_to")):
+                if params.get(key):
+                    filters[name] = datetime.strptime(params[key], "%Y-%m-%d").date()
+        except ValueError:
+            return Response(
+                {"error": "clinic, doctor and sales must be ids; from and to YYYY-MM-DD"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if params.get("status"):
+            filters["status"] = params["status"].split(",")
+        if not _sees_all_meetings(request.user):
+            filters["user"] = request.user
+
+        transcripts = params.get("transcripts") in ("1", "true", "yes")
+        meetings    = export.filter_meetings(**filters)
+        chunks      = TimedStream(export.stream(meetings, fmt, transcripts))
+        # DRF's Request forwards ``scope`` to the Django request; only ASGIRequest has one.
+        body        = export.aiter_sync(chunks) if getattr(request, "scope", None) is not None else chunks
+        response    = StreamingHttpResponse(body, content_type=export.CONTENT_TYPES[fmt])
+        response.db_stream = chunks   # the body's queries count towards this view's DB metrics
+        stamp       = timezone.localtime().strftime("%Y%m%d-%H%M")
+        response["Content-Disposition"] = f'attachment; filename="meetings-{stamp}.{fmt}"'
+        return response
+
+
+class TranscriptSearchView(APIView):
+    """
+    GET /api/transcripts/search/?q=chest pain -cough&limit=20&offset=0
+
+    Ranked full-text search over meeting transcripts (consultation/search.py).
+    Admins and staff search every meeting; everyone else only the meetings
+    they took part in. Snippets mark matches with « ».
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if not search.supported():
+            return Response({"error": "transcript search needs PostgreSQL or SQLite"},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+        query = (request.query_params.get("q") or "").strip()
+        if not query:
+            return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit  = min(max(int(request.query_params.get("limit", 20)), 1), 100)
+            offset = max(int(request.query_params.get("offset", 0)), 0)
+        except ValueError:
+            return Response({"error": "limit and offset must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        # One extra hit tells whether there is a next page without a COUNT.
+        hits = search.search(query, limit=limit + 1, offset=offset,
+                             participant=None if _sees_all_meetings(user) else user.id)
+        more = len(hits) > limit
+        hits = hits[:limit]
+
+        meetings = Meeting.objects.filter(pk__in=[hit.meeting_id for hit in hits]).select_related(
+            "patient", "doctor", "sales", "clinic",
+        ).only(
+            "meeting_id", "room_id", "scheduled_time", "status", "appointment_type",
+            "patient__first_name", "patient__last_name", "doctor__first_name", "doctor__last_name",
+            "sales__first_name", "sales__last_name", "clinic__name",
+        ).in_bulk()
+        results = []
+        for hit in hits:
+            meeting = meetings.get(hit.meeting_id)
+            if meeting is None:
+                continue
+            results.append({
+                "meeting_id"      : meeting.meeting_id,
+                "room_id"         : meeting.room_id,
+                "scheduled_time"  : meeting.scheduled_time,
+                "status"          : meeting.status,
+                "appointment_type": meeting.appointment_type,
+                "patient_name"    : meeting.patient.get_full_name() if meeting.patient else None,
+                "doctor_name"     : meeting.doctor.get_full_name() if meeting.doctor else None,
+                "sales_name"      : meeting.sales.get_full_name() if meeting.sales else None,
+                "clinic_name"     : meeting.clinic.name if meeting.clinic else None,
+                "rank"            : hit.rank,
+                "snippet"         : hit.snippet,
+            })
+        return Response({"query": query, "offset": offset, "limit": limit, "has_more": more, "results": results})
+
+
+class UtilizationView(APIView):
+    """
+    GET /api/analytics/utilization/?from=YYYY-MM-DD&to=YYYY-MM-DD&clinic=<id>&user=<id>&role=doctor|sales
+
+    Available vs booked minutes, outcomes (ended, cancelled, no-shows) and
+    average held duration per doctor / sales rep, read from the daily
+    rollups (consultation/analytics.py). Defaults to the last 30 days.
+    Admins and staff see everyone; others only themselves.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        today  = timezone.localdate()
+        try:
+            date_to   = datetime.strptime(params["to"], "%Y-%m-%d").date() if params.get("to") else today
+            date_from = (datetime.strptime(params["from"], "%Y-%m-%d").date() if params.get("from")
+                         else date_to - timedelta(days=29))
+            clinic    = int(params["clinic"]) if params.get("clinic") else None
+            user      = int(params["user"]) if params.get("user") else None
+        except ValueError:
+            return Response({"error": "from and to must be YYYY-MM-DD; clinic and user ids"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if date_from > date_to:
+            return Response({"error": "from is after to"}, status=status.HTTP_400_BAD_REQUEST)
+        role = params.get("role") or None
+        if role not in (None, *analytics.ROLES):
+            return Response({"error": "role must be doctor or sales"}, status=status.HTTP_400_BAD_REQUEST)
+        if not _sees_all_meetings(request.user):
+            user = request.user.id
+        return Response(analytics.summarize(date_from, date_to, clinic=clinic, user=user, role=role))
+
+
 class SocketStatusView(APIView):
     """
     API endpoint to get WebSocket status information.
     Provides non-blocking, read-only access to socket connectivity data.
+    Open to anyone; the per-room breakdown (live call room ids) is only
+    included for admins.
     """
     permission_classes = [AllowAny]
 
     def get(self, request):
         """Get current WebSocket status information."""
         try:
-            info = SocketStatusService.get_socket_info_summary()
+            info = SocketStatusService.get_socket_info_summary(include_rooms=is_admin(request.user))
             return Response(info, status=status.HTTP_200_OK)
         except Exception as e:
             print(f"[SocketStatusView] Error: {traceback.format_exc()}")
@@ -746,4 +901,15 @@ class SocketStatusView(APIView):
             return Response(
                 {"error": "Failed to retrieve all sockets"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+
+class MetricsView(APIView):
+    """
+    Prometheus scrape endpoint. Values are per worker process, so scrape
+    each worker directly rather than through the load balancer.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -8,15 +8,23 @@ from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
 
-import consultation.routing
-
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "medical_consultation.settings")
 
+# Initialise Django before importing consumers — they pull in
+# consultation.services, which imports the models.
+django_asgi_app = get_asgi_application()
+
+import consultation.routing  # noqa: E402
+from consultation.middleware import JWTAuthMiddleware  # noqa: E402
+
+# Session user first (Django admin), then ?token=<JWT access token>.
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
-        URLRouter(
-            consultation.routing.websocket_urlpatterns
+        JWTAuthMiddleware(
+            URLRouter(
+                consultation.routing.websocket_urlpatterns
+            )
         )
     ),
 })
\ No newline at end of file
@@ -36,6 +36,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "consultation.middleware.ViewDBMetricsMiddleware",
 ]
 
 ROOT_URLCONF = "medical_consultation.urls"
@@ -91,6 +92,47 @@ MEDIA_ROOT = BASE_DIR / "media"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# ── Transcript search ─────────────────────────────────────────────────────────
+# Text search configuration the tsvector index is built with (PostgreSQL;
+# SQLite uses FTS5's porter tokenizer). Migration 0007 indexes with
+# "english"; after changing this run consultation.search.rebuild().
+TRANSCRIPT_SEARCH_CONFIG = "english"
+
+# ── Transcript cold storage ───────────────────────────────────────────────────
+# compact_transcripts moves transcripts of meetings ended (and not updated)
+# for this many hours into compressed TranscriptArchive rows.
+TRANSCRIPT_COMPACT_AFTER_HOURS = 24
+
+# ── Utilization rollups ───────────────────────────────────────────────────────
+# Changing someone's DoctorAvailability re-snapshots their available minutes
+# from today this many days ahead; rollup_utilization covers longer ranges.
+UTILIZATION_AVAILABILITY_DAYS = 90
+
+# ── Background jobs ───────────────────────────────────────────────────────────
+# consultation/jobs.py, run by `manage.py run_jobs`. A claimed job not finished
+# within JOB_LEASE_SECONDS is handed to another worker. Retries back off
+# exponentially up to JOB_BACKOFF_CAP seconds; finished jobs are deleted after
+# JOBS_KEEP_DONE_HOURS (failed ones are kept). Without a worker, set
+# JOBS_INLINE: jobs due now (transcript indexing) then run in the request
+# process right after its transaction commits.
+JOB_LEASE_SECONDS    = 300
+JOB_BACKOFF_CAP      = 3600
+JOBS_KEEP_DONE_HOURS = 24
+JOBS_INLINE          = os.getenv("JOBS_INLINE", "false").lower() in ("1", "true", "yes")
+
+# ── Meeting scheduler ─────────────────────────────────────────────────────────
+# Run by `manage.py run_jobs --scheduler` (one per deployment). Meetings still
+# "started" MEETING_EXPIRE_GRACE_MINUTES after their scheduled end are ended;
+# ones never started become "no_show". Reminder jobs are queued
+# MEETING_REMINDER_LEAD_MINUTES before the start. Timers due within
+# MEETING_SCHEDULER_BATCH_SECONDS fire as one batch. Set MEETING_SCHEDULER
+# (env) wherever meetings are saved once a scheduler runs: only then do saves
+# queue the syncs that keep it current, which nothing else would ever claim.
+MEETING_SCHEDULER               = os.getenv("MEETING_SCHEDULER", "false").lower() in ("1", "true", "yes")
+MEETING_EXPIRE_GRACE_MINUTES    = 30
+MEETING_REMINDER_LEAD_MINUTES   = 15
+MEETING_SCHEDULER_BATCH_SECONDS = 5
+
 # ── Django Channels ───────────────────────────────────────────────────────────
 CHANNEL_LAYERS = {
     "default": {
@@ -98,6 +140,98 @@ CHANNEL_LAYERS = {
     }
 }
 
+# ── Signalling fan-out ────────────────────────────────────────────────────────
+# Encoder for room broadcasts (consultation/encoding.py): json | ujson | orjson.
+# Falls back to stdlib json if the chosen package is not installed.
+SIGNALLING_JSON_ENCODER = os.getenv("SIGNALLING_JSON_ENCODER", "json")
+
+# Accept the opt-in "msgpack" subprotocol on ws/call/<room>/ (binary frames).
+# Clients that don't ask for it keep getting JSON text.
+SIGNALLING_MSGPACK = True
+
+# Live captions relayed to the call room by the STT consumers: finals are
+# sent at once, interims are coalesced per speaker to this many per second.
+CAPTION_INTERIM_RATE = 4
+
+# ── Outbound queues ───────────────────────────────────────────────────────────
+# Each call/STT socket sends through a priority queue (consultation/outbound.py).
+# Past WS_OUTBOUND_BUDGET queued bytes interims, then chat, then finals are
+# dropped; past WS_OUTBOUND_HARD_LIMIT (signalling only) the socket is closed.
+# A budget of 0 restores inline sends.
+WS_OUTBOUND_BUDGET     = 256 * 1024
+WS_OUTBOUND_HARD_LIMIT = 1024 * 1024
+
+# ── Call rate limits ──────────────────────────────────────────────────────────
+# Token buckets per call socket (consultation/ratelimit.py): {type: (rate/s,
+# burst)}; "*" is shared by every message. Over-limit messages are dropped and
+# counted; once drops outnumber accepted messages by CALL_FLOOD_CLOSE_AFTER the
+# socket is closed with 1008 (0 = never close).
+CALL_RATE_LIMITS = {
+    "*"        : (50.0, 200),
+    "offer"    : (2.0, 10),
+    "answer"   : (2.0, 10),
+    "ice"      : (30.0, 100),
+    "ice_batch": (5.0, 20),
+    "chat"     : (2.0, 10),
+    "join"     : (0.2, 3),
+}
+CALL_FLOOD_CLOSE_AFTER = 200
+
+# ── ICE batching ──────────────────────────────────────────────────────────────
+# Trickled candidates for a peer whose join listed "ice_batch" in features are
+# held for CALL_ICE_BATCH_WINDOW seconds (or until CALL_ICE_BATCH_MAX pile up)
+# and relayed as one {"type": "ice_batch", "candidates": [...]}. 0 disables.
+CALL_ICE_BATCH_WINDOW = 0.03
+CALL_ICE_BATCH_MAX    = 20
+
+# ── Call rooms ────────────────────────────────────────────────────────────────
+# Peers silent for CALL_HEARTBEAT_INTERVAL seconds are pinged; peers silent
+# for CALL_HEARTBEAT_TIMEOUT are evicted and peer_left is broadcast.
+# Set the timeout to 0 to disable eviction.
+CALL_HEARTBEAT_INTERVAL = 15
+CALL_HEARTBEAT_TIMEOUT  = 45
+
+# ── Socket status (cluster-wide) ──────────────────────────────────────────────
+# With a Redis URL set, every worker publishes its socket counts there and
+# /socket-status/ merges them. Leave unset for single-process deployments.
+SOCKET_STATUS_REDIS_URL = os.getenv("SOCKET_STATUS_REDIS_URL")
+SOCKET_STATUS_HEARTBEAT = 5    # seconds between snapshot publishes
+SOCKET_STATUS_TTL       = 15   # a worker silent for this long is dropped
+SOCKET_STATUS_PUSH_RATE = 2    # max ws/status/ diff pushes per second
+
+# ── Logging ───────────────────────────────────────────────────────────────────
+# JSON lines, written by a background thread so consumers never block on
+# stdout. Interim transcripts are sampled (1 in LOG_INTERIM_SAMPLE_RATE).
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "consultation.logs.JsonFormatter"},
+    },
+    "filters": {
+        "sample_interim": {
+            "()"  : "consultation.logs.SampleFilter",
+            "rate": int(os.getenv("LOG_INTERIM_SAMPLE_RATE", "20")),
+        },
+    },
+    "handlers": {
+        "background_json": {
+            "()"       : "consultation.logs.BackgroundStreamHandler",
+            "formatter": "json",
+        },
+    },
+    "loggers": {
+        "consultation": {
+            "handlers" : ["background_json"],
+            "level"    : os.getenv("CONSULTATION_LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+        "consultation.stt.interim": {
+            "filters": ["sample_interim"],
+        },
+    },
+}
+
 # ── DRF + JWT ─────────────────────────────────────────────────────────────────
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
@@ -117,6 +251,41 @@ SIMPLE_JWT = {
 # The key is also hard-coded as a fallback inside consumers.py.
 os.environ.setdefault("DEEPGRAM_API_KEY", "241891d132965abc6b1488661f56229bc0d70f47")
 
+# Streaming endpoint. Point it at the local emulator for offline load and
+# latency testing:  python manage.py deepgram_emulator --port 8765
+#   export DEEPGRAM_URL=ws://127.0.0.1:8765/v1/listen
+DEEPGRAM_URL = os.getenv("DEEPGRAM_URL", "wss://api.deepgram.com/v1/listen")
+
+# Two-speaker consumers (ws/stt/, ws/stt/sales/, ws/stt/admin/): send both
+# speakers as one 2-channel stream over a single Deepgram connection instead
+# of one connection per speaker. STT_MULTICHANNEL_MAX_LAG is how far (seconds)
+# one speaker may run ahead before the other side is filled with silence.
+STT_MULTICHANNEL         = os.getenv("STT_MULTICHANNEL", "false").lower() in ("1", "true", "yes")
+STT_MULTICHANNEL_MAX_LAG = 0.1
+
+# Upstream outages. Each stream keeps up to STT_REPLAY_SECONDS of audio not
+# yet covered by a final transcript and re-sends it after reconnecting.
+# Reconnects back off exponentially (with jitter) from STT_RECONNECT_BACKOFF
+# up to STT_RECONNECT_BACKOFF_MAX seconds. DEEPGRAM_BREAKER_THRESHOLD failed
+# connects within DEEPGRAM_BREAKER_WINDOW seconds stop every consumer in the
+# process from dialling out for DEEPGRAM_BREAKER_RESET seconds (degraded mode).
+STT_REPLAY_SECONDS         = 20
+STT_RECONNECT_BACKOFF      = 0.5
+STT_RECONNECT_BACKOFF_MAX  = 30
+DEEPGRAM_BREAKER_THRESHOLD = 5
+DEEPGRAM_BREAKER_WINDOW    = 30
+DEEPGRAM_BREAKER_RESET     = 30
+
+# Raw STT audio archive (consultation/archive.py). Off by default. When on,
+# every STT socket opened with ?room=<room_id> has its per-speaker PCM written
+# by a background thread to AUDIO_ARCHIVE_ROOT/<room_id>/<speaker>/ in
+# preallocated AUDIO_ARCHIVE_SEGMENT_SECONDS segments. Chunks are dropped
+# (and counted) if more than AUDIO_ARCHIVE_QUEUE are waiting for the disk.
+AUDIO_ARCHIVE_ENABLED         = os.getenv("AUDIO_ARCHIVE_ENABLED", "false").lower() in ("1", "true", "yes")
+AUDIO_ARCHIVE_ROOT            = Path(os.getenv("AUDIO_ARCHIVE_ROOT", str(MEDIA_ROOT / "audio")))
+AUDIO_ARCHIVE_SEGMENT_SECONDS = 60
+AUDIO_ARCHIVE_QUEUE           = 2000
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
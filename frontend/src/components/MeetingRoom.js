@@ -7,6 +7,7 @@ import { useParams, useSearchParams, useNavigate } from "react-router-dom";
 import { API_URL as API, WS_URL as WS } from "../config";
 import "./MeetingRoom.css";
 const COMMIT_DELAY     = 800; // Flush transcript after 800ms of silence
+const CAPTION_HOLD_MS  = 4000; // How long a remote speaker's caption stays visible
 const SELF_PREFIX      = 0x01;
 const TRANSCRIPT_POLL_MS = 5000; // Poll less frequently since we sync after append
 
@@ -98,6 +99,8 @@ export default function MeetingRoom() {
   const [unreadChat,   setUnreadChat]   = useState(0);
   const [unreadTx,     setUnreadTx]     = useState(0);
   const [meetingEnded, setMeetingEnded] = useState(false);
+  const [captions,     setCaptions]     = useState({});   // { speakerKey: { speaker, text, seq, final } }
+  const captionTimersRef = useRef({});
 
   const chatEndRef = useRef(null);
 
@@ -155,14 +158,15 @@ export default function MeetingRoom() {
   };
 
   const _openSignalling = () => {
-    const ws = new WebSocket(`${WS}/ws/call/${roomId}/`);
+    // The token ties this peer to the logged-in user (captions are matched to it).
+    const ws = new WebSocket(`${WS}/ws/call/${roomId}/?token=${encodeURIComponent(token || "")}`);
     sigWsRef.current = ws;
 
     ws.onopen = () => {
       if (!isMountedRef.current) return;
       setConnected(true);
-      ws.send(JSON.stringify({ type: "join", name: myName, role: myRole }));
-      _openSttWs();
+      // "ice_batch": the server may deliver trickled candidates in batches.
+      ws.send(JSON.stringify({ type: "join", name: myName, role: myRole, features: ["ice_batch"] }));
     };
 
     ws.onmessage = async (evt) => {
@@ -173,6 +177,7 @@ export default function MeetingRoom() {
         case "assigned":
           myIdRef.current = msg.id;
           setParticipants(msg.peers || []);
+          _openSttWs();   // after "assigned" so captions can carry our peer id
           for (const peer of (msg.peers || [])) {
             await _createPeerConnection(peer.id, peer.name, peer.role, true);
           }
@@ -188,6 +193,9 @@ export default function MeetingRoom() {
         case "offer":  await _handleOffer(msg.from, msg.offer);   break;
         case "answer": await _handleAnswer(msg.from, msg.answer); break;
         case "ice":    await _handleIce(msg.from, msg.candidate); break;
+        case "ice_batch":
+          for (const candidate of (msg.candidates || [])) await _handleIce(msg.from, candidate);
+          break;
         case "chat":
           setChatMessages(prev => [...prev, {
             id: Date.now(), from: msg.name, role: msg.role,
@@ -195,6 +203,11 @@ export default function MeetingRoom() {
           }]);
           if (rightPanel !== "chat") setUnreadChat(n => n + 1);
           break;
+        case "ping":   ws.send(JSON.stringify({ type: "pong" })); break;   // server heartbeat
+        case "caption":
+          if (msg.peer && msg.peer === myIdRef.current) break;   // our own speech
+          _showCaption(msg);
+          break;
         default: break;
       }
     };
@@ -342,11 +355,28 @@ export default function MeetingRoom() {
     } catch (err) { console.error("STT capture error:", err); }
   }, []);
 
+  // Live captions relayed by the server (interims coalesced per speaker).
+  // A final stays on screen briefly; an interim older than the last final is ignored.
+  const _showCaption = useCallback((msg) => {
+    const key = msg.peer || `${msg.role}:${msg.speaker}`;
+    setCaptions(prev => {
+      const cur = prev[key];
+      if (cur && cur.seq > msg.seq) return prev;
+      return { ...prev, [key]: { speaker: msg.speaker, text: msg.text, seq: msg.seq, final: msg.is_final } };
+    });
+    clearTimeout(captionTimersRef.current[key]);
+    captionTimersRef.current[key] = setTimeout(() => {
+      setCaptions(prev => { const next = { ...prev }; delete next[key]; return next; });
+    }, msg.is_final ? CAPTION_HOLD_MS : CAPTION_HOLD_MS * 2);
+  }, []);
+
   const _openSttWs = useCallback(() => {
     if (sttWsRef.current) return;
     setSttStatus("connecting");
     const nameEncoded = encodeURIComponent(myName);
-    const ws = new WebSocket(`${WS}/ws/stt/room/?role=${myRole}&name=${nameEncoded}`);
+    const peer = encodeURIComponent(myIdRef.current || "");
+    // Captions into the room need a logged-in participant of its meeting.
+    const ws = new WebSocket(`${WS}/ws/stt/room/?role=${myRole}&name=${nameEncoded}&room=${encodeURIComponent(roomId)}&peer=${peer}&token=${encodeURIComponent(token || "")}`);
     ws.binaryType = "arraybuffer";
     sttWsRef.current = ws;
     ws.onopen  = () => {};
@@ -356,6 +386,8 @@ export default function MeetingRoom() {
         const msg = JSON.parse(evt.data);
         if (msg.type === "stt_ready") { setSttStatus("live"); _startSttCapture(ws); }
         if (msg.type === "stt_error") setSttStatus("error");
+        if (msg.type === "stt_degraded")  setSttStatus("degraded");
+        if (msg.type === "stt_recovered") setSttStatus("live");
         if (msg.type === "transcript" && msg.is_final && msg.text) {
           const text = msg.text.trim();
           bufRef.current = bufRef.current ? `${bufRef.current} ${text}` : text;
@@ -366,7 +398,7 @@ export default function MeetingRoom() {
     };
     ws.onerror  = () => setSttStatus("error");
     ws.onclose  = () => { setSttStatus(""); sttWsRef.current = null; };
-  }, [_startSttCapture, _flushBuffer, myRole, myName]);
+  }, [_startSttCapture, _flushBuffer, myRole, myName, roomId, token]);
 
   const toggleMic = () => {
     if (!localStreamRef.current) return;
@@ -406,6 +438,7 @@ export default function MeetingRoom() {
 
   const _cleanup = () => {
     if (timerRef.current) { clearTimeout(timerRef.current); timerRef.current = null; }
+    Object.values(captionTimersRef.current).forEach(clearTimeout);
     try { procRef.current?.disconnect(); } catch (_) {}
     if (audioCtxRef.current && audioCtxRef.current.state !== "closed") {
       audioCtxRef.current.close().catch(() => {}); audioCtxRef.current = null;
@@ -456,6 +489,7 @@ export default function MeetingRoom() {
             {sttStatus === "connecting" && <span className="mr-badge amber">⏳ STT</span>}
             {sttStatus === "live"       && <span className="mr-badge green">🎙 Live</span>}
             {sttStatus === "error"      && <span className="mr-badge red">✗ STT</span>}
+            {sttStatus === "degraded"   && <span className="mr-badge amber">⚠ STT</span>}
           </div>
           <button className={`mr-panel-btn ${rightPanel === "chat" ? "active" : ""}`}
             onClick={() => setRightPanel(p => p === "chat" ? null : "chat")} title="Room Chat">
@@ -499,6 +533,15 @@ export default function MeetingRoom() {
                 onClick={e => { e.target.select(); navigator.clipboard.writeText(e.target.value); }} />
             </div>
           )}
+          {Object.keys(captions).length > 0 && (
+            <div className="mr-captions">
+              {Object.entries(captions).map(([key, c]) => (
+                <div key={key} className={`mr-caption ${c.final ? "final" : ""}`}>
+                  <span className="mr-caption-speaker">{c.speaker}:</span> {c.text}
+                </div>
+              ))}
+            </div>
+          )}
         </main>
 
         {/* RIGHT PANEL */}
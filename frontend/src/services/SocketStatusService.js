@@ -1,6 +1,11 @@
 // src/services/SocketStatusService.js
 // WebSocket Status Service - provides non-intrusive monitoring of WebSocket connections
 // This service helps track socket connectivity status without affecting existing functionality
+//
+// Status is pushed over ws/status/ (one snapshot, then coalesced diffs).
+// The stream is for staff/admin accounts only; it authenticates with the
+// stored JWT. HTTP polling is the fallback while that socket is down (or
+// refused, for other users).
 
 import { WS_URL, API_URL } from "../config";
 
@@ -20,7 +25,13 @@ class SocketStatusService {
     
     this.listeners = new Set();
     this.pollInterval = null;
-    this.pollFrequency = 10000; // Poll every 10 seconds
+    this.pollFrequency = 10000; // Fallback poll every 10 seconds
+    this.statusSocket = null;
+    this.reconnectTimer = null;
+    this.reconnectDelay = 1000;
+    this.maxReconnectDelay = 60000;
+    this.resyncInterval = null;
+    this.resyncFrequency = 60000; // Full snapshot every minute to correct drift
     this.enableLogging = true; // Enable/disable logging
     this.logPrefix = "[SocketStatusService]";
     
@@ -33,15 +44,121 @@ class SocketStatusService {
   }
 
   /**
-   * Initialize the service and start polling for socket status
-   * @param {number} pollFrequency - Polling interval in milliseconds (default: 10000)
+   * Initialize the service and subscribe to the socket status stream.
+   * Safe to call repeatedly; only one stream is kept open.
+   * @param {number} pollFrequency - Fallback polling interval in milliseconds (default: 10000)
    */
   initialize(pollFrequency = 10000) {
     if (this.enableLogging) {
-      console.log(`${this.logPrefix} Initializing with poll frequency: ${pollFrequency}ms`);
+      console.log(`${this.logPrefix} Initializing (fallback poll frequency: ${pollFrequency}ms)`);
     }
     this.pollFrequency = pollFrequency;
-    this.startPolling();
+    this.connectStream();
+  }
+
+  /**
+   * Open the ws/status/ stream. Falls back to polling while it is down and
+   * reconnects with exponential backoff.
+   */
+  connectStream() {
+    if (this.statusSocket) return;
+    if (this.reconnectTimer) {
+      clearTimeout(this.reconnectTimer);
+      this.reconnectTimer = null;
+    }
+
+    const token = localStorage.getItem("token");
+    const query = token ? `?token=${encodeURIComponent(token)}` : "";
+    const ws = new WebSocket(`${WS_URL}/ws/status/${query}`);
+    this.statusSocket = ws;
+
+    ws.onopen = () => {
+      if (this.enableLogging) {
+        console.log(`${this.logPrefix} Status stream connected`);
+      }
+      this.reconnectDelay = 1000;
+      this.stopPolling();
+      this.resyncInterval = setInterval(() => {
+        if (ws.readyState === WebSocket.OPEN) {
+          ws.send(JSON.stringify({ type: "resync" }));
+        }
+      }, this.resyncFrequency);
+    };
+
+    ws.onmessage = (e) => {
+      let msg;
+      try { msg = JSON.parse(e.data); } catch { return; }
+      if (msg.type === "status_snapshot") this.applySnapshot(msg);
+      else if (msg.type === "status_diff") this.applyDiff(msg);
+    };
+
+    ws.onclose = () => {
+      if (this.resyncInterval) {
+        clearInterval(this.resyncInterval);
+        this.resyncInterval = null;
+      }
+      if (this.statusSocket !== ws) return; // closed by clear()
+      this.statusSocket = null;
+      if (this.enableLogging) {
+        console.warn(`${this.logPrefix} Status stream closed, polling until reconnect in ${this.reconnectDelay}ms`);
+      }
+      if (!this.pollInterval) this.startPolling();
+      this.reconnectTimer = setTimeout(() => {
+        this.reconnectTimer = null;
+        this.connectStream();
+      }, this.reconnectDelay);
+      this.reconnectDelay = Math.min(this.reconnectDelay * 2, this.maxReconnectDelay);
+    };
+  }
+
+  /**
+   * Replace cached status with a full snapshot from the stream
+   * @param {Object} data - status_snapshot message
+   */
+  applySnapshot(data) {
+    this.statusCache = {
+      ...this.statusCache,
+      active: data.active || false,
+      totalSockets: data.total_sockets || 0,
+      socketsByType: data.sockets_by_type || {},
+      timestamp: data.timestamp || new Date().toISOString(),
+      endpoints: data.ws_endpoints || {},
+      isConnecting: false,
+      lastError: null,
+    };
+    this.notifyListeners();
+  }
+
+  /**
+   * Apply an incremental status_diff (added/removed/updated sockets) to the cache
+   * @param {Object} diff - status_diff message
+   */
+  applyDiff(diff) {
+    const byType = { ...this.statusCache.socketsByType };
+    const add = (type) => {
+      byType[type] = (byType[type] || 0) + 1;
+    };
+    const remove = (type) => {
+      const next = (byType[type] || 0) - 1;
+      if (next > 0) byType[type] = next;
+      else delete byType[type];
+    };
+    (diff.added || []).forEach(({ type }) => add(type));
+    (diff.removed || []).forEach(({ type }) => remove(type));
+    // Same socket id registered again as another type.
+    (diff.updated || []).forEach(({ type, was }) => {
+      remove(was);
+      add(type);
+    });
+    const total = Object.values(byType).reduce((a, b) => a + b, 0);
+    this.statusCache = {
+      ...this.statusCache,
+      active: total > 0,
+      totalSockets: total,
+      socketsByType: byType,
+      timestamp: new Date((diff.ts || Date.now() / 1000) * 1000).toISOString(),
+    };
+    this.notifyListeners();
   }
 
   /**
@@ -329,6 +446,15 @@ class SocketStatusService {
     }
     
     this.stopPolling();
+    if (this.reconnectTimer) {
+      clearTimeout(this.reconnectTimer);
+      this.reconnectTimer = null;
+    }
+    if (this.statusSocket) {
+      const ws = this.statusSocket;
+      this.statusSocket = null;
+      ws.close();
+    }
     this.statusCache = {
       active: false,
       totalSockets: 0,